@@ -0,0 +1,102 @@
+"""Benchmark alternative-route search on a registered road network.
+
+Compares the penalty-method engine in routes.alternatives with the previous
+approach (Yen's algorithm via nx.shortest_simple_paths on an undirected
+nx.Graph copy) over random origin/destination pairs.
+
+    python benchmarks/bench_alternatives.py --network-type drive --pairs 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+project_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_path)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smart_traffic.settings')
+
+import django
+
+django.setup()
+
+import networkx as nx
+import numpy as np
+
+from benchmarks.support import summarize
+from routes.alternatives import find_alternatives
+from routes.graph_registry import DEFAULT_PLACE, graph_registry
+
+
+def yen_undirected(G_simple, source, target, k):
+    paths = []
+    try:
+        for path in nx.shortest_simple_paths(G_simple, source, target, weight='length'):
+            if len(paths) >= k:
+                break
+            if path not in paths:
+                paths.append(path)
+    except nx.NetworkXNoPath:
+        pass
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--place', default=DEFAULT_PLACE)
+    parser.add_argument('--network-type', default='drive')
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--max-similarity', type=float, default=0.8)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-baseline', action='store_true', help='Only time the new engine')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    network = graph_registry.get(args.place, args.network_type)
+    graph = network.routing_graph
+    load_seconds = time.perf_counter() - start
+    snapshot = network.snapshot
+
+    rng = np.random.default_rng(args.seed)
+    pairs = rng.integers(0, snapshot.n_nodes, size=(args.pairs, 2))
+
+    engine_times = []
+    for source, target in pairs:
+        start = time.perf_counter()
+        find_alternatives(graph, int(source), int(target), k=args.k, max_similarity=args.max_similarity)
+        engine_times.append(time.perf_counter() - start)
+
+    results = {
+        'place': args.place,
+        'network_type': args.network_type,
+        'nodes': snapshot.n_nodes,
+        'edges': snapshot.n_edges,
+        'pairs': args.pairs,
+        'k': args.k,
+        'load_seconds': round(load_seconds, 3),
+        'penalty_directed': summarize(engine_times),
+    }
+
+    if not args.skip_baseline:
+        # The old code also rebuilt this copy per request; it is excluded here
+        G_simple = nx.Graph(network.G)
+        baseline_times = []
+        for source, target in pairs:
+            start = time.perf_counter()
+            yen_undirected(G_simple, int(snapshot.node_ids[source]), int(snapshot.node_ids[target]), args.k)
+            baseline_times.append(time.perf_counter() - start)
+        results['yen_undirected'] = summarize(baseline_times)
+        results['speedup_median'] = round(
+            results['yen_undirected']['p50_ms'] / max(results['penalty_directed']['p50_ms'], 1e-9), 1
+        )
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
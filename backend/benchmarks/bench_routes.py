@@ -0,0 +1,387 @@
+"""Benchmark the routing pipeline offline on a synthetic grid or a saved snapshot.
+
+Trains a small speed model for the network, times each stage of route
+requests (snap, search, scoring, serialization) and measures RouteView
+throughput at several client concurrencies. Results are written as JSON
+and can be compared against an earlier run.
+
+    python benchmarks/bench_routes.py --grid-size 40 --requests 200
+    python benchmarks/bench_routes.py --snapshot path/to/snapshot --baseline before.json
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+project_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_path)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smart_traffic.settings')
+
+import django
+
+django.setup()
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import LabelEncoder
+
+from benchmarks.support import grid_graph, summarize
+from routes.alternatives import find_alternatives
+from routes.graph_registry import DEFAULT_PLACE, graph_registry
+from routes.model_registry import ENCODER_FILE, MANIFEST_FILE, MODEL_FILE, model_registry
+from routes.planning import name_routes, parse_route_request, rank_routes
+from routes.route_cache import route_cache
+from routes.scoring import score_paths
+from routes.snapping import attach_endpoints, direct_path
+from routes.snapshot import GraphSnapshot, compile_snapshot, snapshot_path
+from routes.views import RouteView
+from routes.weights import weight_cache
+
+GRID_BASE_SPEEDS = {'primary': 50, 'secondary': 40, 'tertiary': 30, 'residential': 25}
+RUSH_HOURS = [9, 10, 11, 18, 19, 20]
+def train_speed_model(snapshot, rows=20000, trees=10, seed=0):
+    """A small forest trained on synthetic speeds for ``snapshot``'s roads.
+
+    Same features and encoder as ``traffic_model/train_model.py``; speeds
+    follow the road class with rush-hour and weekday slowdowns.
+    """
+    rng = np.random.default_rng(seed)
+    base_by_code = np.array([
+        GRID_BASE_SPEEDS.get(h, 25) if isinstance(h, str) else 25 for h in snapshot.highway_vocab
+    ], dtype=np.float64)
+    edge = rng.integers(0, snapshot.n_edges, rows)
+    hours = rng.integers(0, 24, rows)
+    days = rng.integers(0, 7, rows)
+    speeds = (
+        base_by_code[np.asarray(snapshot.edge_highway)[edge]]
+        * np.where(np.isin(hours, RUSH_HOURS), 0.65, 1.0)
+        * np.where(days < 5, 0.85, 1.0)
+        * rng.uniform(0.7, 1.3, rows)
+    )
+    road_ids = np.asarray(snapshot.edge_osmid)[edge]
+    encoder = LabelEncoder()
+    features = pd.DataFrame({
+        'road_id_encoded': encoder.fit_transform(road_ids),
+        'hour': hours,
+        'day_of_week': days,
+    })
+    model = RandomForestRegressor(n_estimators=trees, max_depth=12, random_state=seed)
+    model.fit(features, speeds)
+    return model, encoder
+
+
+def write_model(model, encoder, path):
+    path.mkdir(parents=True, exist_ok=True)
+    with open(path / MODEL_FILE, 'wb') as f:
+        pickle.dump(model, f)
+    with open(path / ENCODER_FILE, 'wb') as f:
+        pickle.dump(encoder, f)
+    manifest = {'version': 'benchmark', 'model': MODEL_FILE, 'encoder': ENCODER_FILE}
+    (path / MANIFEST_FILE).write_text(json.dumps(manifest))
+
+
+def random_requests(snapshot, count, optimize, seed=0):
+    """Route request bodies between random points inside the network's bbox."""
+    rng = np.random.default_rng(seed)
+    x, y = np.asarray(snapshot.node_x), np.asarray(snapshot.node_y)
+    lats = rng.uniform(y.min(), y.max(), (count, 2))
+    lons = rng.uniform(x.min(), x.max(), (count, 2))
+    start = datetime(2025, 5, 5)
+    minutes = rng.integers(0, 7 * 24 * 60, count)
+    return [
+        {
+            'source': f'{lats[i, 0]:.6f},{lons[i, 0]:.6f}',
+            'destination': f'{lats[i, 1]:.6f},{lons[i, 1]:.6f}',
+            'date_time': (start + timedelta(minutes=int(minutes[i]))).isoformat() + 'Z',
+            'travel_mode': 'drive',
+            'optimize': optimize,
+        }
+        for i in range(count)
+    ]
+
+
+def _timed(samples, name, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    samples.setdefault(name, []).append(time.perf_counter() - start)
+    return result
+
+
+def measure_load(place, network_type):
+    """Seconds to load a network from its snapshot and derive its indexes."""
+    graph_registry.clear()
+    timings = {}
+    network = _timed(timings, 'snapshot', graph_registry.get, place, network_type)
+    _timed(timings, 'snap_index', lambda: network.snap_index)
+    _timed(timings, 'routing_graph', lambda: network.routing_graph)
+    _timed(timings, 'edge_table', lambda: network.edge_table)
+    timings = {name: round(seconds[0], 4) for name, seconds in timings.items()}
+    timings['total_s'] = round(sum(timings.values()), 4)
+    return network, timings
+
+
+def measure_stages(network, bundle, requests):
+    """Per-stage latencies of the ``route_request`` pipeline, one request at a time.
+
+    ``shortest_path`` is the single best route and ``k_alternatives`` the
+    whole alternative search, which repeats that first search. Requests
+    whose endpoints snap onto the same edge skip both, like ``RouteView``.
+    """
+    samples = {}
+    snapshot = network.snapshot
+    graph = network.routing_graph
+    k = getattr(settings, 'ROUTE_ALTERNATIVES', 3)
+    max_similarity = getattr(settings, 'ROUTE_MAX_SIMILARITY', 0.8)
+    max_snap_distance = getattr(settings, 'SNAP_MAX_DISTANCE_M', 1000)
+    renderer = JSONRenderer()
+    for data in requests:
+        source, dest, date_time, travel_mode, optimize = _timed(samples, 'parse', parse_route_request, data)
+        edge_weights, bound_scale = snapshot.edge_length, 1.0
+        if optimize == 'time':
+            weights = _timed(samples, 'weights', weight_cache.get, network, bundle,
+                             date_time.hour, date_time.weekday(), travel_mode)
+            edge_weights, bound_scale = weights.seconds, weights.bound_scale
+
+        def snap():
+            snaps = network.snap_index.snap([source[0], dest[0]], [source[1], dest[1]],
+                                            max_distance=max_snap_distance)
+            if (snaps.edge < 0).any():
+                return None, None
+            return (network.snap_index.endpoint(snaps, 0, edge_weights, origin=True),
+                    network.snap_index.endpoint(snaps, 1, edge_weights, origin=False))
+
+        origin, destination = _timed(samples, 'snapping', snap)
+        if origin is None:
+            continue
+        found = None
+        direct = direct_path(origin, destination, edge_weights, snapshot)
+        if direct is not None:
+            found = [direct]
+        else:
+            pair_weights = graph.pair_weights(edge_weights)
+            _timed(samples, 'shortest_path', graph.shortest_path, origin.seeds, destination.seeds,
+                   pair_weights=pair_weights, bound_scale=bound_scale)
+            found = _timed(samples, 'k_alternatives', find_alternatives, graph, origin.seeds, destination.seeds,
+                           k=k, max_similarity=max_similarity, pair_weights=pair_weights, bound_scale=bound_scale)
+            found = [attach_endpoints(path, origin, destination, snapshot) for path in found]
+        if not found:
+            continue
+
+        def score():
+            return rank_routes(score_paths(
+                network.edge_table, name_routes(found, optimize), bundle, date_time, travel_mode,
+                start_point=(origin.lon, origin.lat), end_point=(destination.lon, destination.lat),
+            ))
+
+        payload = _timed(samples, 'scoring', score)
+        _timed(samples, 'serialization', renderer.render, payload)
+    return {name: summarize(values) for name, values in samples.items()}
+
+
+def measure_throughput(view, requests, concurrency):
+    """End-to-end requests per second of ``view`` with ``concurrency`` client threads."""
+    factory = RequestFactory()
+    bodies = [json.dumps(data) for data in requests]
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def call(body):
+        start = time.perf_counter()
+        response = view(factory.post('/api/routes/', body, content_type='application/json'))
+        if hasattr(response, 'render'):
+            response.render()
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(call, bodies))
+    wall = time.perf_counter() - start
+    return {
+        'concurrency': concurrency,
+        'requests': len(bodies),
+        'seconds': round(wall, 4),
+        'rps': round(len(bodies) / wall, 2) if wall else None,
+        'latency': summarize(latencies),
+        'statuses': statuses,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'routing_backend': getattr(settings, 'ROUTING_BACKEND', 'dijkstra'),
+        'route_alternatives': getattr(settings, 'ROUTE_ALTERNATIVES', 3),
+        'route_cache_size': getattr(settings, 'ROUTE_CACHE_SIZE', 1024),
+    }
+
+
+def run_benchmark(workdir, graph=None, snapshot_dir=None, requests=200, concurrency=(1, 4, 16),
+                  optimize='distance', seed=0, log=None):
+    """Benchmark the routing pipeline on an offline network and model.
+
+    The network is ``graph``, an osmnx-style graph, or the compiled
+    snapshot at ``snapshot_dir``; it and a small synthetic speed model are
+    written under ``workdir``. Must run with GRAPH_SNAPSHOT_DIR and
+    TRAFFIC_MODEL_DIR pointing into ``workdir`` (see ``main``). Returns the
+    results as a JSON-ready dict.
+    """
+    log = log or (lambda message: None)
+    path = snapshot_path(DEFAULT_PLACE, 'drive')
+    if snapshot_dir is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.symlink(os.path.abspath(snapshot_dir), path, target_is_directory=True)
+        source = str(snapshot_dir)
+    else:
+        compile_snapshot(graph, path)
+        source = f'synthetic grid of {graph.number_of_nodes()} nodes'
+    snapshot = GraphSnapshot.load(path)
+
+    log('Training speed model')
+    model, encoder = train_speed_model(snapshot, seed=seed)
+    write_model(model, encoder, workdir / 'model')
+    bundle = model_registry.reload()
+    weight_cache.clear()
+    route_cache.clear()
+
+    log('Measuring graph load')
+    network, load = measure_load(DEFAULT_PLACE, 'drive')
+    bodies = random_requests(snapshot, requests, optimize, seed=seed)
+    # The first search of a process also pays for lazy imports and caches
+    measure_stages(network, bundle, bodies[:1])
+    log(f'Measuring stages over {requests} requests')
+    stages = measure_stages(network, bundle, bodies)
+    stages['graph_load'] = load
+
+    view = RouteView.as_view()
+    throughput = []
+    for level in concurrency:
+        route_cache.clear()
+        log(f'Measuring throughput with {level} concurrent clients')
+        throughput.append(measure_throughput(view, bodies, level))
+    return {
+        'environment': environment(),
+        'network': {'source': source, 'nodes': snapshot.n_nodes, 'edges': snapshot.n_edges},
+        'requests': {'count': requests, 'optimize': optimize, 'seed': seed},
+        'stages': stages,
+        'throughput': throughput,
+    }
+
+
+def compare(results, baseline):
+    """Relative change of each stage's median and each level's RPS against ``baseline``."""
+    changes = {}
+    for name, stats in results['stages'].items():
+        before = baseline.get('stages', {}).get(name, {})
+        # Graph load is measured once; the other stages per request
+        key = 'p50_ms' if 'p50_ms' in stats else 'total_s'
+        if stats.get(key) and before.get(key):
+            changes[f'{name}.{key}'] = round(stats[key] / before[key] - 1, 4)
+    before_rps = {level['concurrency']: level['rps'] for level in baseline.get('throughput', [])}
+    for level in results['throughput']:
+        if level['rps'] and before_rps.get(level['concurrency']):
+            changes[f"rps@{level['concurrency']}"] = round(level['rps'] / before_rps[level['concurrency']] - 1, 4)
+    return changes
+
+
+def concurrency_levels(value):
+    return [int(level) for level in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--grid-size', type=int, default=40, help='Streets per side of the synthetic grid')
+    parser.add_argument('--snapshot', default=None,
+                        help='Benchmark this compiled snapshot directory instead of a synthetic grid')
+    parser.add_argument('--requests', type=int, default=200, help='Route requests per measurement')
+    parser.add_argument('--concurrency', type=concurrency_levels, default=[1, 4, 16],
+                        help='Comma-separated client thread counts for the throughput runs')
+    parser.add_argument('--optimize', choices=['distance', 'time'], default='distance')
+    parser.add_argument('--backend', choices=['dijkstra', 'alt'], default=None,
+                        help='Routing backend; defaults to ROUTING_BACKEND')
+    parser.add_argument('--route-cache', action='store_true',
+                        help='Keep the route cache enabled; by default every request searches')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON results file, '-' for stdout")
+    parser.add_argument('--baseline', default=None,
+                        help='Earlier results file to report relative changes against')
+    args = parser.parse_args()
+
+    if args.requests < 1 or not args.concurrency or min(args.concurrency) < 1:
+        parser.error('--requests and every --concurrency level must be >= 1')
+    if args.snapshot is not None and not GraphSnapshot.exists(args.snapshot):
+        parser.error(f'No snapshot found in {args.snapshot}')
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+
+    graph = None if args.snapshot else grid_graph(args.grid_size, seed=args.seed)
+    # One region covering everything, so any snapshot can be benchmarked
+    overrides = {
+        'MODEL_RELOAD_INTERVAL': 3600, 'ROUTE_CACHE_SHARED_PATH': None,
+        'ROUTE_REGIONS': {'benchmark': {'place': DEFAULT_PLACE}},
+    }
+    if not args.route_cache:
+        overrides['ROUTE_CACHE_SIZE'] = 0
+    if args.backend:
+        overrides['ROUTING_BACKEND'] = args.backend
+
+    with tempfile.TemporaryDirectory(prefix='route-benchmark-') as workdir:
+        workdir = Path(workdir)
+        overrides.update(GRAPH_SNAPSHOT_DIR=workdir / 'snapshots', TRAFFIC_MODEL_DIR=workdir / 'model')
+        with override_settings(**overrides):
+            results = run_benchmark(
+                workdir, graph=graph, snapshot_dir=args.snapshot, requests=args.requests,
+                concurrency=args.concurrency, optimize=args.optimize, seed=args.seed,
+                log=lambda message: print(message, file=sys.stderr, flush=True),
+            )
+
+    if baseline is not None:
+        results['changes'] = compare(results, baseline)
+    text = json.dumps(results, indent=2)
+    if args.output == '-':
+        print(text)
+        return
+    Path(args.output).write_text(text + '\n')
+
+    for name, stats in results['stages'].items():
+        if 'p50_ms' in stats:
+            print(f"{name:<16} p50 {stats['p50_ms']:>9.3f} ms  p95 {stats['p95_ms']:>9.3f} ms")
+        else:
+            print(f"{name:<16} total {stats['total_s']:>7.3f} s")
+    for level in results['throughput']:
+        print(f"concurrency {level['concurrency']:>3}: {level['rps']:>8.1f} req/s, "
+              f"p95 {level['latency']['p95_ms']:.1f} ms")
+    for name, change in results.get('changes', {}).items():
+        print(f'{name:<24} {change:+.1%}')
+    print(f'Wrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Benchmark point-to-point routing backends on a registered road network.
+
+Times landmark preprocessing and compares query latency of plain Dijkstra
+with A* using landmark (ALT) lower bounds over random node pairs. Path
+costs of both backends are checked to agree.
+
+    python benchmarks/bench_routing_backends.py --network-type drive --pairs 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+project_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_path)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smart_traffic.settings')
+
+import django
+
+django.setup()
+
+import numpy as np
+
+from benchmarks.support import summarize
+from routes.graph_registry import DEFAULT_PLACE, graph_registry
+from routes.landmarks import LandmarkIndex
+from routes.routing import RoutingGraph
+
+
+def time_queries(graph, pairs):
+    times, costs = [], []
+    for source, target in pairs:
+        start = time.perf_counter()
+        path = graph.shortest_path(int(source), int(target))
+        times.append(time.perf_counter() - start)
+        costs.append(path.cost if path is not None else np.inf)
+    return times, np.array(costs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--place', default=DEFAULT_PLACE)
+    parser.add_argument('--network-type', default='drive')
+    parser.add_argument('--pairs', type=int, default=50)
+    parser.add_argument('--landmarks', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    snapshot = graph_registry.get(args.place, args.network_type).snapshot
+    dijkstra_graph = RoutingGraph(snapshot)
+
+    start = time.perf_counter()
+    landmarks = LandmarkIndex.build(dijkstra_graph, args.landmarks, seed=args.seed)
+    preprocess_seconds = time.perf_counter() - start
+    alt_graph = RoutingGraph(snapshot, landmarks=landmarks)
+    landmark_bytes = landmarks.dist_from.nbytes + landmarks.dist_to.nbytes
+
+    rng = np.random.default_rng(args.seed)
+    pairs = rng.integers(0, snapshot.n_nodes, size=(args.pairs, 2))
+    dijkstra_times, dijkstra_costs = time_queries(dijkstra_graph, pairs)
+    alt_times, alt_costs = time_queries(alt_graph, pairs)
+
+    results = {
+        'place': args.place,
+        'network_type': args.network_type,
+        'nodes': snapshot.n_nodes,
+        'edges': snapshot.n_edges,
+        'pairs': args.pairs,
+        'alt_preprocess_seconds': round(preprocess_seconds, 3),
+        'alt_landmarks': int(len(landmarks.landmarks)),
+        'alt_storage_mb': round(landmark_bytes / 2 ** 20, 2),
+        'dijkstra': summarize(dijkstra_times),
+        'alt': summarize(alt_times),
+        'costs_match': bool(np.allclose(dijkstra_costs, alt_costs, rtol=1e-4)),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
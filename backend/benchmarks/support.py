@@ -0,0 +1,69 @@
+"""Helpers shared by the benchmark scripts and the routing tests."""
+import math
+
+import networkx as nx
+import numpy as np
+
+METRES_PER_DEGREE = 111320.0
+
+
+def summarize(samples):
+    """Count and latency percentiles in milliseconds of ``samples`` seconds."""
+    if not samples:
+        return {'count': 0}
+    ms = np.asarray(samples) * 1000
+    return {
+        'count': len(ms),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3),
+        'total_s': round(float(ms.sum() / 1000), 4),
+    }
+
+
+def grid_highway(street):
+    # Every tenth street is a primary road, every fifth a secondary one
+    if street % 10 == 0:
+        return 'primary'
+    if street % 5 == 0:
+        return 'secondary'
+    return 'tertiary' if street % 5 == 2 else 'residential'
+
+
+def grid_graph(size=40, spacing_m=150.0, lat=22.72, lon=75.86, seed=0):
+    """An osmnx-style ``size`` x ``size`` street grid around (lat, lon).
+
+    Streets get a road class by position, lengths are jittered up to 20%
+    above the straight-line distance and about one block in ten is
+    one-way, so searches see realistic ties and detours.
+    """
+    rng = np.random.default_rng(seed)
+    dlat = spacing_m / METRES_PER_DEGREE
+    dlon = spacing_m / (METRES_PER_DEGREE * math.cos(math.radians(lat)))
+    G = nx.MultiDiGraph(crs='epsg:4326')
+    node = lambda i, j: 1 + i * size + j
+    for i in range(size):
+        for j in range(size):
+            G.add_node(node(i, j), x=lon + j * dlon, y=lat + i * dlat, street_count=4)
+
+    osmid = 1000000
+    for i in range(size):
+        for j in range(size):
+            for di, dj in ((0, 1), (1, 0)):
+                a, b = i + di, j + dj
+                if a >= size or b >= size:
+                    continue
+                osmid += 1
+                # Rows run east-west, columns north-south
+                street = i if di == 0 else j
+                highway = grid_highway(street)
+                length = spacing_m * rng.uniform(1.0, 1.2)
+                oneway = highway == 'residential' and rng.random() < 0.1
+                G.add_edge(node(i, j), node(a, b), osmid=osmid, length=length, highway=highway,
+                           oneway=oneway, reversed=False)
+                if not oneway:
+                    G.add_edge(node(a, b), node(i, j), osmid=osmid, length=length, highway=highway,
+                               oneway=False, reversed=True)
+    return G
@@ -0,0 +1,68 @@
+import numpy as np
+
+from .routing import Path
+
+DEFAULT_PENALTY = 1.4
+
+
+def overlap(path, other, lengths):
+    """Share of ``path``'s length that also lies on ``other``."""
+    total = lengths[path.edges].sum()
+    if total == 0:
+        return 1.0
+    shared = np.isin(path.edges, other.edges)
+    return float(lengths[path.edges[shared]].sum() / total)
+
+
+def find_alternatives(graph, source, target, k=3, max_similarity=0.8, penalty=DEFAULT_PENALTY,
+                      max_searches=None, pair_weights=None, bound_scale=1.0, cancel=None):
+    """Up to ``k`` short, mutually dissimilar paths from ``source`` to ``target``.
+
+    Penalty method on the directed graph: after every search the weights of
+    the edges just found are multiplied by ``penalty`` and the search is
+    repeated, so later searches are pushed onto other roads. A candidate is
+    kept when no more than ``max_similarity`` of its length overlaps any
+    path already kept. The first path is always the plain shortest path.
+    Costs on the returned paths are measured with the unpenalized weights.
+
+    ``pair_weights`` defaults to edge lengths; ``bound_scale`` is passed on
+    to ``RoutingGraph.shortest_path`` for other weights. Once the optional
+    ``cancel`` event is set, no further searches are started.
+    """
+    if pair_weights is None:
+        pair_weights = graph.pair_weights()
+    base_weights = np.asarray(pair_weights, dtype=np.float64)
+    edge_costs = np.zeros(len(graph.edge_u))
+    edge_costs[graph.pair_edges] = base_weights
+    weights = base_weights
+    # A* reads weights from a list; once penalised, both are updated in place
+    weight_list = None
+    max_searches = max_searches or 3 * k
+
+    paths = []
+    for _ in range(max_searches):
+        if cancel is not None and cancel.is_set():
+            break
+        path = graph.shortest_path(source, target, weights, bound_scale=bound_scale, weight_list=weight_list)
+        if path is None:
+            break
+        # Seed costs are added by the search but not by the edge sums
+        seed_costs = path.cost - float(weights[graph.pairs_between(path.nodes)].sum())
+        path = Path(path.nodes, path.edges, float(edge_costs[path.edges].sum()) + seed_costs)
+        if all(
+            not np.array_equal(path.nodes, kept.nodes) and overlap(path, kept, edge_costs) <= max_similarity
+            for kept in paths
+        ):
+            paths.append(path)
+            if len(paths) >= k:
+                break
+        pairs = graph.pairs_between(path.nodes)
+        if weights is base_weights:
+            weights = base_weights.copy()
+            if graph.backend == 'alt':
+                weight_list = list(graph.weight_list(base_weights))
+        weights[pairs] *= penalty
+        if weight_list is not None:
+            for i in pairs.tolist():
+                weight_list[i] *= penalty
+    return paths
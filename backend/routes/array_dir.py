@@ -0,0 +1,31 @@
+import json
+import shutil
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+
+def save_array_dir(path, arrays, meta):
+    """Write ``arrays`` as ``<name>.npy`` files and ``meta`` as ``meta.json`` in directory ``path``.
+
+    An existing directory is replaced whole, so readers see either the old
+    or the new contents. Returns ``path``.
+    """
+    path = Path(path)
+    # Write next to the destination and swap directories so that a running
+    # server never loads a half-written directory
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.{uuid.uuid4().hex}')
+    tmp.mkdir()
+    for name, array in arrays.items():
+        np.save(tmp / f'{name}.npy', np.ascontiguousarray(array))
+    (tmp / 'meta.json').write_text(json.dumps(meta))
+    old = None
+    if path.exists():
+        old = path.with_name(f'.{path.name}.old.{uuid.uuid4().hex}')
+        path.rename(old)
+    tmp.rename(path)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+    return path
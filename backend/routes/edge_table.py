@@ -0,0 +1,29 @@
+import numpy as np
+
+from .scoring import max_speed_for
+
+
+class EdgeTable:
+    """Per-edge attributes as NumPy columns keyed by snapshot edge index.
+
+    Routes are arrays of edge indices, so materializing their segments is a
+    handful of gathers instead of a graph and GeoDataFrame lookup per edge.
+    """
+
+    def __init__(self, snapshot):
+        offsets = np.asarray(snapshot.geom_offsets)
+        coords = np.asarray(snapshot.geom_coords)
+        self.start_lon = coords[offsets[:-1], 0]
+        self.start_lat = coords[offsets[:-1], 1]
+        self.end_lon = coords[offsets[1:] - 1, 0]
+        self.end_lat = coords[offsets[1:] - 1, 1]
+        self.length = np.asarray(snapshot.edge_length)
+        self.osmid = np.asarray(snapshot.edge_osmid)
+        self.highway = np.asarray(snapshot.edge_highway)
+        self.highway_vocab = snapshot.highway_vocab
+        # Free-flow speed class per edge; NaN for list-valued highway tags
+        max_speed_by_class = np.array([max_speed_for(h) for h in self.highway_vocab], dtype=np.float64)
+        self.max_speed = max_speed_by_class[self.highway] if len(self.highway) else np.empty(0)
+
+    def __len__(self):
+        return len(self.length)
@@ -0,0 +1,162 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .array_dir import save_array_dir
+
+FORMAT_VERSION = 1
+
+ARRAYS = ('roots', 'feature', 'threshold', 'children', 'value')
+
+# Samples evaluated together; each holds one node index per tree
+CHUNK_ROWS = 4096
+# Levels descended between dropping (sample, tree) pairs that reached a leaf
+STEPS_PER_COMPACTION = 8
+
+
+def _smallest_int(values, candidates=(np.int16, np.int32)):
+    for dtype in candidates:
+        info = np.iinfo(dtype)
+        if not len(values) or (values.min() >= info.min and values.max() <= info.max):
+            return dtype
+    return np.int64
+
+
+def forest_arrays(model, quantize=False):
+    """Flatten a fitted ``RandomForestRegressor`` into per-node arrays.
+
+    Nodes of all trees are concatenated, with ``roots`` holding each
+    tree's first node. A sample goes to ``children[node, 0]`` when its
+    ``feature`` is at most ``threshold``, else to ``children[node, 1]``.
+    Leaves point to themselves and compare against an always-true
+    threshold, so a sample that reached one can take further steps.
+
+    ``quantize`` assumes integer-valued features, as the speed model's
+    road code, hour and day are: thresholds are rounded down to int16
+    (int32 if they do not fit), which keeps every split, and leaf values
+    are stored as float16.
+    """
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    sizes = np.array([tree.node_count for tree in trees], dtype=np.int64)
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    feature = np.concatenate([tree.feature for tree in trees]).astype(np.int64)
+    threshold = np.concatenate([tree.threshold for tree in trees])
+    value = np.concatenate([tree.value[:, 0, 0] for tree in trees])
+    left = np.concatenate([np.where(tree.children_left >= 0, tree.children_left + root, -1)
+                           for tree, root in zip(trees, roots)])
+    right = np.concatenate([np.where(tree.children_right >= 0, tree.children_right + root, -1)
+                            for tree, root in zip(trees, roots)])
+
+    leaf = left < 0
+    nodes = np.arange(len(feature))
+    left[leaf] = nodes[leaf]
+    right[leaf] = nodes[leaf]
+    feature[leaf] = 0
+    if quantize:
+        threshold = np.floor(threshold).astype(np.int64)
+        dtype = _smallest_int(threshold[~leaf])
+        threshold = np.where(leaf, np.iinfo(dtype).max, threshold).astype(dtype)
+        value = value.astype(np.float16)
+    else:
+        threshold[leaf] = np.inf
+    index = _smallest_int(nodes, (np.int32,))
+    arrays = {
+        'roots': roots.astype(index),
+        'feature': feature.astype(_smallest_int(feature, (np.int8, np.int16))),
+        'threshold': threshold,
+        'children': np.column_stack([left, right]).astype(index),
+        'value': value,
+    }
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'trees': len(trees),
+        'max_depth': int(max(tree.max_depth for tree in trees)),
+        'n_features': int(model.n_features_in_),
+        'feature_names': [str(name) for name in getattr(model, 'feature_names_in_', [])],
+        'quantized': bool(quantize),
+    }
+    return arrays, meta
+
+
+class PackedForest:
+    """A random forest regressor as flat NumPy arrays, evaluated with NumPy only.
+
+    Predictions match ``model.predict`` of the forest it was exported
+    from, up to float rounding, or float16 leaf values when quantized.
+    Arrays are memory-mapped by default, so every worker process on the
+    host shares the same physical pages.
+    """
+
+    def __init__(self, path, arrays, meta):
+        self.path = Path(path) if path is not None else None
+        self.meta = meta
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def from_sklearn(cls, model, quantize=False):
+        arrays, meta = forest_arrays(model, quantize=quantize)
+        return cls(None, arrays, meta)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        path = Path(path)
+        meta = json.loads((path / 'meta.json').read_text())
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported forest format {meta.get('format_version')} in {path}")
+        mmap_mode = 'r' if mmap else None
+        arrays = {name: np.load(path / f'{name}.npy', mmap_mode=mmap_mode) for name in ARRAYS}
+        return cls(path, arrays, meta)
+
+    def save(self, path):
+        """Write the forest to ``path`` as a directory of ``.npy`` arrays."""
+        return save_array_dir(path, {name: getattr(self, name) for name in ARRAYS}, self.meta)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+    def predict(self, X, chunk_rows=CHUNK_ROWS):
+        """Mean leaf value over all trees for every row of ``X``.
+
+        ``X`` is a 2-D array, or a DataFrame, with the features in training
+        order. Every (row, tree) pair steps down one level at a time, and
+        pairs that reached a leaf are dropped every few levels: unbounded
+        trees have a few very deep branches, which most pairs never walk.
+        """
+        X = np.asarray(X)
+        n_features = self.meta['n_features']
+        if X.ndim != 2 or X.shape[1] != n_features:
+            raise ValueError(f'Expected {n_features} features, got shape {X.shape}')
+        # Split decisions as sklearn makes them, on float32 features
+        X = X.astype(np.int64 if self.meta['quantized'] else np.float32)
+        roots = np.asarray(self.roots, dtype=np.int64)
+        children = np.asarray(self.children).ravel()
+        out = np.empty(len(X))
+        for start in range(0, len(X), chunk_rows):
+            x = X[start:start + chunk_rows]
+            leaves = np.empty(len(x) * len(roots), dtype=np.int64)
+            # Pairs still descending: their position in ``leaves``, current
+            # node and the offset of their row in the flattened features
+            pair = np.arange(len(leaves))
+            node = np.tile(roots, len(x))
+            offset = np.repeat(np.arange(len(x)) * n_features, len(roots))
+            x = x.ravel()
+            while len(pair):
+                for _ in range(STEPS_PER_COMPACTION):
+                    right = x[offset + self.feature[node]] > self.threshold[node]
+                    node = children[2 * node + right]
+                done = children[2 * node] == node
+                leaves[pair[done]] = node[done]
+                pair, node, offset = pair[~done], node[~done], offset[~done]
+            values = self.value[leaves].reshape(-1, len(roots))
+            out[start:start + len(values)] = values.mean(axis=1, dtype=np.float64)
+        return out
+
+
+class RoadIdClasses:
+    """The part of a fitted ``LabelEncoder`` that serving uses: its classes."""
+
+    def __init__(self, classes):
+        self.classes_ = classes
@@ -0,0 +1,287 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import networkx as nx
+import numpy as np
+import osmnx as ox
+from django.conf import settings
+
+from .edge_table import EdgeTable
+from .landmarks import LANDMARK_DIR, LandmarkIndex
+from .metrics import metrics
+from .routing import RoutingGraph
+from .snapping import SnapIndex
+from .snapshot import GraphSnapshot, snapshot_path
+
+logger = logging.getLogger(__name__)
+
+metrics.describe('road_networks_loaded', 'gauge', 'Road networks held in memory')
+metrics.describe('road_networks_bytes', 'gauge', 'Approximate memory held by loaded road networks and speed models')
+metrics.describe('road_network_evictions_total', 'counter',
+                 'Road networks and speed models dropped to stay within the memory budget')
+
+DEFAULT_PLACE = 'Indore, India'
+# Rough size of an osmnx graph in networkx dicts, per edge
+GRAPH_BYTES_PER_EDGE = 1024
+
+
+def load_graph(place, network_type):
+    ox.settings.use_cache = True
+    return ox.graph_from_place(place, network_type=network_type)
+
+
+class RoadNetwork:
+    """A loaded road network together with the structures derived from it.
+
+    A network is backed either by a compiled snapshot or by an osmnx graph.
+    Whichever is missing, as well as the edge GeoDataFrame, the edge table,
+    the routing graph and the snapping index, is built on first use.
+    Instances are shared by every request served by the worker, so callers
+    must treat them as read-only. The osmnx graph is dropped once the
+    snapshot is derived from it, and rebuilt from the snapshot if asked for.
+    ``on_grow``, when set, is called with the network after anything new
+    is built.
+    """
+
+    def __init__(self, place, network_type, G=None, snapshot=None, version=1):
+        if G is None and snapshot is None:
+            raise ValueError('RoadNetwork needs a graph or a snapshot')
+        self.place = place
+        self.network_type = network_type
+        self.version = version
+        self._lock = threading.RLock()
+        self._snapshot = snapshot
+        self._G = nx.freeze(G) if G is not None else None
+        self._edges = None
+        self._routing_graph = None
+        self._snap_index = None
+        self._edge_table = None
+        self.on_grow = None
+
+    def _derive(self, attr, build):
+        value = getattr(self, attr)
+        if value is None:
+            built = False
+            with self._lock:
+                value = getattr(self, attr)
+                if value is None:
+                    value = build()
+                    setattr(self, attr, value)
+                    built = True
+            if built and self.on_grow is not None:
+                self.on_grow(self)
+        return value
+
+    def _snapshot_from_graph(self):
+        snapshot = GraphSnapshot.from_graph(self.G)
+        # Everything is served from the snapshot; the graph's dicts would
+        # only hold memory
+        self._G = None
+        return snapshot
+
+    @property
+    def snapshot(self):
+        return self._derive('_snapshot', self._snapshot_from_graph)
+
+    @property
+    def G(self):
+        return self._derive('_G', lambda: nx.freeze(self.snapshot.to_graph()))
+
+    @property
+    def edges(self):
+        return self._derive('_edges', self.snapshot.edges_frame)
+
+    @property
+    def edge_table(self):
+        return self._derive('_edge_table', lambda: EdgeTable(self.snapshot))
+
+    @property
+    def snap_index(self):
+        return self._derive('_snap_index', lambda: SnapIndex(self.snapshot))
+
+    @property
+    def routing_graph(self):
+        return self._derive('_routing_graph', self._build_routing_graph)
+
+    @property
+    def nbytes(self):
+        """Approximate memory of the network's structures built or loaded so far.
+
+        Memory-mapped snapshot arrays count in full, although pages not yet
+        read are not resident. A networkx graph still held is estimated
+        from its edge count.
+        """
+        parts = [self._snapshot, self._edge_table, self._routing_graph, self._snap_index]
+        if self._routing_graph is not None:
+            parts.append(self._routing_graph.landmarks)
+        total = sum(
+            value.nbytes
+            for part in parts if part is not None
+            for value in vars(part).values() if isinstance(value, np.ndarray)
+        )
+        if self._edges is not None:
+            total += int(self._edges.memory_usage(deep=False).sum())
+        G = self._G
+        if G is not None:
+            total += G.number_of_edges() * GRAPH_BYTES_PER_EDGE
+        return total
+
+    def _build_routing_graph(self):
+        graph = RoutingGraph(self.snapshot)
+        if getattr(settings, 'ROUTING_BACKEND', 'dijkstra') == 'alt':
+            try:
+                graph.landmarks = self._landmarks(graph)
+            except Exception:
+                logger.exception('Landmark preprocessing failed for %s/%s, falling back to Dijkstra',
+                                 self.place, self.network_type)
+        return graph
+
+    def _landmarks(self, graph):
+        # Prefer landmarks stored with the snapshot by build_graph_snapshots
+        path = self.snapshot.path / LANDMARK_DIR if self.snapshot.path is not None else None
+        if path is not None and LandmarkIndex.exists(path):
+            return LandmarkIndex.load(path)
+        return LandmarkIndex.build(graph, getattr(settings, 'ROUTING_LANDMARKS', 16))
+
+
+class GraphRegistry:
+    """Loads each (place, network_type) road network once per process.
+
+    Compiled snapshots (see the ``build_graph_snapshots`` command) are
+    preferred; otherwise the graph is loaded through osmnx. Networks, and
+    the speed model registries regions ``hold`` here, share one budget of
+    REGION_MEMORY_BUDGET_MB: whenever one of them loads or builds more, the
+    least recently used others are dropped and loaded again when next asked
+    for. Requests still holding a dropped network or model finish on it.
+    """
+
+    def __init__(self, loader=load_graph, memory_budget_mb=None):
+        self._loader = loader
+        self._memory_budget_mb = memory_budget_mb
+        # Networks by (place, network_type) and model registries by
+        # ('model', directory), least recently used first
+        self._held = OrderedDict()
+        # Versions keep increasing across evictions, so caches keyed by
+        # network version never mix a reloaded network with its predecessor
+        self._versions = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def memory_budget_mb(self):
+        if self._memory_budget_mb is not None:
+            return self._memory_budget_mb
+        return getattr(settings, 'REGION_MEMORY_BUDGET_MB', 4096)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _next_version(self, key):
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            return self._versions[key]
+
+    def _build(self, key, version):
+        place, network_type = key
+        path = snapshot_path(place, network_type)
+        if GraphSnapshot.exists(path):
+            snapshot = GraphSnapshot.load(path)
+            network = RoadNetwork(place, network_type, snapshot=snapshot, version=version)
+        else:
+            G = self._loader(place, network_type)
+            network = RoadNetwork(place, network_type, G=G, version=version)
+        network.on_grow = lambda network: self._evict(keep=key)
+        return network
+
+    def get(self, place, network_type):
+        key = (place, network_type)
+        with self._lock:
+            network = self._held.get(key)
+            if network is not None:
+                self._held.move_to_end(key)
+                return network
+        # Only one thread builds a given network; the others wait for it
+        with self._key_lock(key):
+            with self._lock:
+                network = self._held.get(key)
+            if network is None:
+                network = self._build(key, version=self._next_version(key))
+                with self._lock:
+                    self._held[key] = network
+                self._evict(keep=key)
+        return network
+
+    def hold(self, models):
+        """Count a ``ModelRegistry``'s loaded model against the budget.
+
+        Marks it most recently used. Once evicted it is unloaded, and loads
+        again on its next ``get``.
+        """
+        key = ('model', str(models.model_dir))
+        with self._lock:
+            known = self._held.get(key) is models
+            self._held[key] = models
+            self._held.move_to_end(key)
+        if not known:
+            models.on_load = lambda models: self._evict(keep=key)
+            self._evict(keep=key)
+
+    def _evict(self, keep):
+        """Drop least recently used networks and models until the rest fit the budget."""
+        budget = self.memory_budget_mb
+        evicted = []
+        with self._lock:
+            sizes = {key: held.nbytes for key, held in self._held.items()}
+            total = sum(sizes.values())
+            if budget:
+                for key in list(self._held):
+                    if total <= budget * 2 ** 20:
+                        break
+                    if key != keep:
+                        evicted.append((key, self._held.pop(key)))
+                        total -= sizes[key]
+            loaded = sum(isinstance(held, RoadNetwork) for held in self._held.values())
+        for key, held in evicted:
+            if isinstance(held, RoadNetwork):
+                logger.info('Dropped the %s network of %s to stay within %s MB', key[1], key[0], budget)
+            else:
+                held.unload()
+                logger.info('Unloaded the speed model in %s to stay within %s MB', key[1], budget)
+        if budget and total > budget * 2 ** 20:
+            logger.warning('Road networks and speed models hold %.0f MB, over the %s MB budget',
+                           total / 2 ** 20, budget)
+        metrics.inc('road_network_evictions_total', len(evicted))
+        metrics.set('road_networks_loaded', loaded)
+        metrics.set('road_networks_bytes', total)
+
+    def reload(self, place=None, network_type=None):
+        """Rebuild loaded networks matching the given filters.
+
+        The new network is built before it replaces the old one, so requests
+        already holding a reference finish on the previous version.
+        """
+        reloaded = []
+        for key in self.loaded():
+            if place is not None and key[0] != place:
+                continue
+            if network_type is not None and key[1] != network_type:
+                continue
+            with self._key_lock(key):
+                network = self._build(key, version=self._next_version(key))
+                with self._lock:
+                    self._held[key] = network
+            reloaded.append(key)
+        return reloaded
+
+    def loaded(self):
+        with self._lock:
+            return [key for key, held in self._held.items() if isinstance(held, RoadNetwork)]
+
+    def clear(self):
+        with self._lock:
+            self._held.clear()
+
+
+graph_registry = GraphRegistry()
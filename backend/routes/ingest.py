@@ -0,0 +1,235 @@
+import atexit
+import json
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+
+from .bulk_load import load_frame
+from .metrics import metrics
+from .models import RawGPSData
+
+logger = logging.getLogger(__name__)
+
+metrics.describe('gps_points_total', 'counter', 'GPS probe points received by outcome')
+metrics.describe('gps_buffer_rows', 'gauge', 'GPS probe points buffered and not yet written')
+metrics.describe('gps_flushes_total', 'counter', 'GPS buffer flushes by outcome')
+metrics.describe('gps_flush_seconds', 'gauge', 'Duration of the last GPS buffer flush')
+metrics.describe('gps_flush_seconds_total', 'counter', 'Total time spent flushing the GPS buffer')
+
+# Binary probe records: epoch seconds, WGS84 coordinates and speed, little-endian
+PROBE_DTYPE = np.dtype([
+    ('timestamp', '<f8'), ('latitude', '<f8'), ('longitude', '<f8'), ('speed_kmh', '<f4'),
+])
+
+
+class BufferFull(Exception):
+    pass
+
+
+class BatchTooLarge(Exception):
+    """A batch that could not fit even into the empty buffer."""
+
+
+def parse_binary(body):
+    """Probe records from packed ``PROBE_DTYPE`` bytes."""
+    if len(body) % PROBE_DTYPE.itemsize:
+        raise ValueError(f'Body is not a whole number of {PROBE_DTYPE.itemsize}-byte records')
+    records = np.frombuffer(body, dtype=PROBE_DTYPE)
+    return pd.DataFrame({name: records[name].astype(np.float64) for name in PROBE_DTYPE.names})
+
+
+def parse_json_lines(body):
+    """Probe records from JSON lines with latitude, longitude, speed_kmh and timestamp.
+
+    Timestamps are epoch seconds or ISO 8601 strings. Missing or malformed
+    values become NaN and are rejected by ``validate``.
+    """
+    lines = [line for line in body.split(b'\n') if line.strip()]
+    # One C-level parse for the whole batch instead of one per line
+    rows = json.loads(b'[' + b','.join(lines) + b']') if lines else []
+    if not all(isinstance(row, dict) for row in rows):
+        raise ValueError('Every line must be a JSON object')
+    frame = pd.DataFrame.from_records(rows, columns=list(PROBE_DTYPE.names))
+    timestamps = frame['timestamp']
+    epoch = pd.to_numeric(timestamps, errors='coerce')
+    text = timestamps.map(lambda t: t if isinstance(t, str) else None)
+    if text.notna().any():
+        parsed = pd.to_datetime(text, utc=True, errors='coerce', format='ISO8601')
+        epoch = epoch.where(epoch.notna(), (parsed - pd.Timestamp(0, tz='UTC')).dt.total_seconds())
+    frame['timestamp'] = epoch.astype(np.float64)
+    for name in ('latitude', 'longitude', 'speed_kmh'):
+        frame[name] = pd.to_numeric(frame[name], errors='coerce').astype(np.float64)
+    return frame
+
+
+def validate(frame, now=None):
+    """Rows with plausible coordinates, speeds and times; vectorized."""
+    now = time.time() if now is None else now
+    max_speed = getattr(settings, 'GPS_MAX_SPEED_KMH', 250)
+    max_skew = getattr(settings, 'GPS_MAX_CLOCK_SKEW_S', 300)
+    lat, lon = frame['latitude'].to_numpy(), frame['longitude'].to_numpy()
+    speed, ts = frame['speed_kmh'].to_numpy(), frame['timestamp'].to_numpy()
+    with np.errstate(invalid='ignore'):
+        valid = (
+            (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+            & (speed >= 0) & (speed <= max_speed)
+            & (ts > 0) & (ts <= now + max_skew)
+        )
+    return frame[valid]
+
+
+class ProbeBuffer:
+    """In-memory buffer of validated probe points, written in bulk.
+
+    Points are flushed once ``flush_rows`` are waiting, by the request that
+    crossed the threshold, and at least every ``flush_interval`` seconds by
+    a background thread. The buffer never holds more than ``max_rows``
+    points: a request that would overflow it first flushes, and is refused
+    with ``BufferFull`` if the points still do not fit. Whatever is left is
+    flushed when the process exits.
+    """
+
+    def __init__(self, flush_rows=None, flush_interval=None, max_rows=None):
+        self._flush_rows = flush_rows
+        self._flush_interval = flush_interval
+        self._max_rows = max_rows
+        self._frames = []
+        self._rows = 0
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def flush_rows(self):
+        if self._flush_rows is not None:
+            return self._flush_rows
+        return getattr(settings, 'GPS_FLUSH_ROWS', 5000)
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, 'GPS_FLUSH_INTERVAL', 1.0)
+
+    @property
+    def max_rows(self):
+        if self._max_rows is not None:
+            return self._max_rows
+        return getattr(settings, 'GPS_BUFFER_MAX_ROWS', 100000)
+
+    def __len__(self):
+        return self._rows
+
+    def add(self, frame):
+        """Buffer ``frame``'s points, flushing first if they do not fit."""
+        if not len(frame):
+            return
+        if len(frame) > self.max_rows:
+            raise BatchTooLarge(f'Batch of {len(frame)} points exceeds the buffer of {self.max_rows}')
+        self._start_flusher()
+        if not self._append(frame):
+            self.flush()
+            if not self._append(frame):
+                raise BufferFull()
+        if self._rows >= self.flush_rows:
+            self.flush()
+
+    def _append(self, frame):
+        with self._lock:
+            if self._rows + len(frame) > self.max_rows:
+                return False
+            self._frames.append(frame)
+            self._rows += len(frame)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            metrics.set('gps_buffer_rows', self._rows)
+        return True
+
+    def flush(self):
+        """Write all buffered points; returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                frames, self._frames = self._frames, []
+                self._rows, self._oldest = 0, None
+                metrics.set('gps_buffer_rows', 0)
+            if not frames:
+                return 0
+            frame = pd.concat(frames, ignore_index=True)
+            start = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    load_frame(RawGPSData, self._table_frame(frame))
+            except Exception:
+                logger.exception('Failed to write %d GPS points', len(frame))
+                metrics.inc('gps_flushes_total', outcome='failure')
+                # Keep what still fits so a short database outage loses nothing
+                with self._lock:
+                    kept = frame.iloc[:max(0, self.max_rows - self._rows)]
+                    self._frames.insert(0, kept)
+                    self._rows += len(kept)
+                    self._oldest = self._oldest or time.monotonic()
+                    metrics.set('gps_buffer_rows', self._rows)
+                metrics.inc('gps_points_total', len(frame) - len(kept), outcome='dropped')
+                return 0
+            elapsed = time.perf_counter() - start
+            metrics.inc('gps_flushes_total', outcome='success')
+            metrics.set('gps_flush_seconds', round(elapsed, 6))
+            metrics.inc('gps_flush_seconds_total', elapsed)
+            metrics.inc('gps_points_total', len(frame), outcome='written')
+            return len(frame)
+
+    @staticmethod
+    def _table_frame(frame):
+        # Timestamps in the database's text form, in UTC
+        stamps = np.datetime_as_string(
+            (frame['timestamp'].to_numpy() * 1e6).astype('datetime64[us]'), unit='us',
+        )
+        suffix = '+00:00' if connection.vendor == 'postgresql' else ''
+        created = np.datetime_as_string(np.datetime64(int(time.time() * 1e6), 'us'), unit='us')
+        return pd.DataFrame({
+            'latitude': frame['latitude'].to_numpy(),
+            'longitude': frame['longitude'].to_numpy(),
+            'speed_kmh': frame['speed_kmh'].to_numpy(),
+            'timestamp': np.char.add(np.char.replace(stamps, 'T', ' '), suffix),
+            'created_at': created.replace('T', ' ') + suffix,
+        })
+
+    def _start_flusher(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run_flusher, name='gps-flusher', daemon=True)
+                self._thread.start()
+                # The flusher dies with the interpreter, so write the rest
+                # on a clean shutdown
+                atexit.register(self._flush_at_exit)
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to flush the GPS buffer at exit')
+        finally:
+            connection.close()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(min(self.flush_interval, 1.0))
+            oldest = self._oldest
+            if oldest is None or time.monotonic() - oldest < self.flush_interval:
+                continue
+            try:
+                self.flush()
+            finally:
+                # This thread's connection would otherwise stay open forever
+                connection.close()
+
+
+probe_buffer = ProbeBuffer()
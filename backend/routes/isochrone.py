@@ -0,0 +1,165 @@
+import numpy as np
+import shapely
+from django.conf import settings
+from scipy.sparse.csgraph import dijkstra
+
+from .lru import LRUCache
+from .metrics import metrics
+
+metrics.describe('isochrone_cache_total', 'counter', 'Isochrone cache lookups by result')
+
+# Concave hull tightness: 0 follows the reached points closely, 1 is the
+# convex hull
+HULL_RATIO = 0.3
+# Contours of fewer than three points are buffered by this many degrees
+MIN_CONTOUR_DEG = 0.0002
+
+
+def reach_times(graph, origin, edge_weights, limit, max_nodes=None):
+    """Travel cost from ``origin`` to every node, bounded by ``limit``.
+
+    One Dijkstra from the origin's virtual node that stops expanding past
+    ``limit``. When more than ``max_nodes`` nodes are reached, only the
+    cheapest ``max_nodes`` are kept. Returns the costs, inf for nodes not
+    reached, and the cost up to which they are complete.
+    """
+    n = graph.n_nodes
+    matrix = graph.seeded_matrix(graph.pair_weights(edge_weights), [origin.seeds])
+    dist = dijkstra(matrix, indices=n, limit=limit)[:n]
+    reached = dist[np.isfinite(dist)]
+    if max_nodes is not None and len(reached) > max_nodes:
+        limit = float(np.partition(reached, max_nodes - 1)[max_nodes - 1])
+        dist[dist > limit] = np.inf
+    return dist, limit
+
+
+def edge_times(snapshot, origin, dist, edge_weights):
+    """Cost of entering and of leaving every edge, from node costs.
+
+    The origin's own edges are entered at cost 0 where it snapped.
+    """
+    edge_weights = np.asarray(edge_weights, dtype=np.float64)
+    enter = dist[np.asarray(snapshot.edge_u)]
+    leave = enter + edge_weights
+    for edge, fraction in zip(origin.edges, origin.fractions):
+        if edge < 0:
+            continue
+        enter[edge] = 0.0
+        leave[edge] = min(leave[edge], (1 - fraction) * edge_weights[edge])
+    return enter, leave
+
+
+def contour(snapshot, table, origin, dist, enter, leave, budget):
+    """Polygon around everything reachable within ``budget``.
+
+    The hull covers the nodes reached in time and, on edges left partly
+    travelled, the point reached along the edge's chord.
+    """
+    nodes = np.flatnonzero(dist <= budget)
+    partial = np.flatnonzero((enter < budget) & (leave > budget))
+    along = (budget - enter[partial]) / (leave[partial] - enter[partial])
+    lon = np.concatenate([
+        [origin.lon], np.asarray(snapshot.node_x)[nodes],
+        table.start_lon[partial] + along * (table.end_lon[partial] - table.start_lon[partial]),
+    ])
+    lat = np.concatenate([
+        [origin.lat], np.asarray(snapshot.node_y)[nodes],
+        table.start_lat[partial] + along * (table.end_lat[partial] - table.start_lat[partial]),
+    ])
+    hull = shapely.concave_hull(shapely.multipoints(np.column_stack([lon, lat])), ratio=HULL_RATIO)
+    if not isinstance(hull, shapely.Polygon):
+        hull = hull.buffer(MIN_CONTOUR_DEG)
+    return shapely.transform(hull, lambda coords: np.round(coords, 6))
+
+
+def isochrones(network, origin, edge_weights, budgets, max_nodes=None):
+    """Reachable edges and contours from ``origin`` for each budget in seconds.
+
+    Returns a JSON-ready dict: a GeoJSON FeatureCollection of one contour
+    per budget, largest last, and per-edge arrays of every edge entered
+    within the largest budget with the seconds to enter and to leave it.
+    ``complete`` is false when the search hit ``max_nodes`` before the
+    largest budget; contours past ``reached_s`` then stop there.
+    """
+    snapshot = network.snapshot
+    table = network.edge_table
+    budgets = sorted(budgets)
+    dist, reached = reach_times(network.routing_graph, origin, edge_weights, budgets[-1], max_nodes)
+    enter, leave = edge_times(snapshot, origin, dist, edge_weights)
+
+    features = []
+    for budget in budgets:
+        polygon = contour(snapshot, table, origin, dist, enter, leave, min(budget, reached))
+        features.append({
+            'type': 'Feature',
+            'properties': {'minutes': budget / 60, 'complete': budget <= reached},
+            'geometry': shapely.geometry.mapping(polygon),
+        })
+    edges = np.flatnonzero(enter < min(budgets[-1], reached))
+    edges = edges[np.argsort(enter[edges], kind='stable')]
+    return {
+        'origin': {'lat': round(origin.lat, 6), 'lon': round(origin.lon, 6)},
+        'complete': reached >= budgets[-1],
+        'reached_s': round(float(reached), 1),
+        'contours': {'type': 'FeatureCollection', 'features': features},
+        'edges': {
+            'count': len(edges),
+            'edge': edges.tolist(),
+            'road_id': table.osmid[edges].tolist(),
+            'start_lat': np.round(table.start_lat[edges], 6).tolist(),
+            'start_lon': np.round(table.start_lon[edges], 6).tolist(),
+            'end_lat': np.round(table.end_lat[edges], 6).tolist(),
+            'end_lon': np.round(table.end_lon[edges], 6).tolist(),
+            'enter_s': np.round(enter[edges], 1).tolist(),
+            'leave_s': np.round(leave[edges], 1).tolist(),
+        },
+    }
+
+
+def isochrone_key(network, bundle, snap_index, snaps, travel_mode, date_time, budgets, snap_m=None):
+    """Cache key for isochrones from the first point of ``snaps``.
+
+    The origin is identified by its snapped edge and a ``snap_m`` metre
+    bucket along it, as route cache endpoints are, so nearby requests share
+    results. Graph and model versions are part of the key.
+    """
+    if snap_m is None:
+        snap_m = getattr(settings, 'ROUTE_CACHE_SNAP_M', 25)
+    edge = int(snaps.edge[0])
+    along = float(snaps.fraction[0]) * float(snap_index.edge_geom_len[edge])
+    return (
+        network.place, network.network_type, network.version, bundle.version, travel_mode,
+        date_time.hour, date_time.weekday(), edge, int(along // snap_m) if snap_m > 0 else along,
+        tuple(sorted(budgets)),
+    )
+
+
+class IsochroneCache:
+    """LRU cache of isochrone payloads keyed by ``isochrone_key``.
+
+    Payloads are shared between requests and must not be modified.
+    """
+
+    def __init__(self, max_entries=None):
+        self._max_entries = max_entries
+        self._entries = LRUCache(lambda: self.max_entries)
+
+    @property
+    def max_entries(self):
+        if self._max_entries is not None:
+            return self._max_entries
+        return getattr(settings, 'ISOCHRONE_CACHE_SIZE', 256)
+
+    def get(self, key):
+        payload = self._entries.get(key)
+        metrics.inc('isochrone_cache_total', result='hit' if payload is not None else 'miss')
+        return payload
+
+    def put(self, key, payload):
+        self._entries.put(key, payload)
+
+    def clear(self):
+        self._entries.clear()
+
+
+isochrone_cache = IsochroneCache()
@@ -0,0 +1,161 @@
+import heapq
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from .array_dir import save_array_dir
+
+LANDMARK_DIR = 'landmarks'
+
+# float32 storage rounds distances; shrinking the bounds slightly keeps
+# them admissible
+BOUND_SLACK = 1 - 1e-5
+# A* computes lower bounds for blocks of 2 ** BOUND_BLOCK_BITS consecutive
+# nodes, each on its first visit to the block
+BOUND_BLOCK_BITS = 10
+
+
+class LandmarkIndex:
+    """Precomputed landmark distances for A* with ALT lower bounds.
+
+    For every landmark L the index stores d(L, v) and d(v, L) for all nodes
+    v, measured with edge lengths. By the triangle inequality
+    ``max(d(L, t) - d(L, v), d(v, L) - d(t, L))`` never exceeds d(v, t), so
+    it is an admissible A* heuristic for any weights that are at least the
+    edge lengths (e.g. penalised lengths). Weights in other units can be
+    bounded by scaling, see ``RoutingGraph.shortest_path``.
+    """
+
+    def __init__(self, landmarks, dist_from, dist_to, meta=None):
+        self.landmarks = landmarks
+        self.dist_from = dist_from
+        self.dist_to = dist_to
+        self.meta = meta or {}
+
+    @classmethod
+    def build(cls, graph, n_landmarks=16, seed=0):
+        """Pick landmarks by farthest-point selection and compute their distances."""
+        start = time.perf_counter()
+        matrix = graph.matrix(graph.pair_weights())
+        n_landmarks = min(n_landmarks, graph.n_nodes)
+        rng = np.random.default_rng(seed)
+        landmarks = []
+        closest = np.full(graph.n_nodes, np.inf)
+        candidate = int(rng.integers(graph.n_nodes))
+        dist_from = []
+        for _ in range(n_landmarks):
+            landmarks.append(candidate)
+            dist = dijkstra(matrix, indices=candidate)
+            dist_from.append(dist)
+            closest = np.minimum(closest, np.where(np.isfinite(dist), dist, np.inf))
+            reachable = np.isfinite(closest)
+            if not reachable.any():
+                break
+            # Next landmark: the reachable node farthest from all chosen ones
+            candidate = int(np.flatnonzero(reachable)[np.argmax(closest[reachable])])
+            if candidate in landmarks:
+                break
+        landmarks = np.array(landmarks, dtype=np.int64)
+        dist_to = dijkstra(matrix.T.tocsr(), indices=landmarks)
+        meta = {
+            'n_landmarks': len(landmarks),
+            'build_seconds': round(time.perf_counter() - start, 3),
+        }
+        return cls(landmarks, np.array(dist_from, dtype=np.float32), dist_to.astype(np.float32), meta)
+
+    @classmethod
+    def exists(cls, path):
+        return (Path(path) / 'meta.json').exists()
+
+    def save(self, path):
+        arrays = {'landmarks': self.landmarks, 'dist_from': self.dist_from, 'dist_to': self.dist_to}
+        return save_array_dir(path, arrays, self.meta)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        path = Path(path)
+        mmap_mode = 'r' if mmap else None
+        return cls(
+            np.load(path / 'landmarks.npy'),
+            np.load(path / 'dist_from.npy', mmap_mode=mmap_mode),
+            np.load(path / 'dist_to.npy', mmap_mode=mmap_mode),
+            json.loads((path / 'meta.json').read_text()),
+        )
+
+    def lower_bounds(self, target, nodes=slice(None)):
+        """Lower bound on the distance from every node, or from ``nodes``, to ``target``."""
+        with np.errstate(invalid='ignore'):
+            forward = self.dist_from[:, target][:, None] - self.dist_from[:, nodes]
+            backward = self.dist_to[:, nodes] - self.dist_to[:, target][:, None]
+            bounds = np.fmax(forward, backward).max(axis=0)
+        # inf - inf leaves no information about a node
+        bounds = np.nan_to_num(bounds, nan=0.0, neginf=0.0)
+        return np.maximum(bounds, 0) * BOUND_SLACK
+
+    def block_bounds(self, targets, scale=1.0):
+        """Function giving the A* bounds of one block of nodes as a list.
+
+        ``targets`` maps target nodes to the cost of finishing there; a
+        node's bound is its cheapest scaled bound to a target plus that cost.
+        """
+        def bounds(block):
+            nodes = slice(block << BOUND_BLOCK_BITS, (block + 1) << BOUND_BLOCK_BITS)
+            return np.min([
+                self.lower_bounds(target, nodes) * scale + cost for target, cost in targets.items()
+            ], axis=0).tolist()
+        return bounds
+
+
+def astar(indptr, heads, weights, sources, targets, block_bounds):
+    """A* over plain-list CSR arrays; returns (cost, node path) or None.
+
+    ``sources`` is a list of ``(node, cost)`` seeds and ``targets`` maps
+    target nodes to the cost of finishing there. ``block_bounds(block)``
+    returns the heuristic for a block of nodes, see ``BOUND_BLOCK_BITS``;
+    only blocks the search reaches are computed.
+    """
+    mask = (1 << BOUND_BLOCK_BITS) - 1
+    blocks = [None] * ((len(indptr) >> BOUND_BLOCK_BITS) + 1)
+    best = {}
+    pred = {}
+    heap = []
+    for node, cost in sources:
+        best[node] = cost
+        pred[node] = -1
+        bounds = blocks[node >> BOUND_BLOCK_BITS]
+        if bounds is None:
+            bounds = blocks[node >> BOUND_BLOCK_BITS] = block_bounds(node >> BOUND_BLOCK_BITS)
+        heapq.heappush(heap, (cost + bounds[node & mask], cost, node))
+    finish = None
+    while heap:
+        _, cost, node = heapq.heappop(heap)
+        if node == -1:
+            path = [finish]
+            while pred[path[-1]] != -1:
+                path.append(pred[path[-1]])
+            return cost, path[::-1]
+        if cost > best[node]:
+            continue
+        if node in targets:
+            # Finishing goes through a virtual node (-1) so that cheaper
+            # paths through other targets are still found first
+            total = cost + targets[node]
+            if finish is None or total < best[-1]:
+                best[-1] = total
+                finish = node
+                heapq.heappush(heap, (total, total, -1))
+        for i in range(indptr[node], indptr[node + 1]):
+            head = heads[i]
+            new_cost = cost + weights[i]
+            if new_cost < best.get(head, np.inf):
+                best[head] = new_cost
+                pred[head] = node
+                # Inlined block lookup: this is the search's innermost loop
+                bounds = blocks[head >> BOUND_BLOCK_BITS]
+                if bounds is None:
+                    bounds = blocks[head >> BOUND_BLOCK_BITS] = block_bounds(head >> BOUND_BLOCK_BITS)
+                heapq.heappush(heap, (new_cost + bounds[head & mask], new_cost, head))
+    return None
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from routes.graph_registry import load_graph
+from routes.landmarks import LANDMARK_DIR, LandmarkIndex
+from routes.regions import region_registry
+from routes.routing import RoutingGraph
+from routes.snapshot import GraphSnapshot, compile_snapshot, snapshot_path
+
+NETWORK_TYPES = ['drive', 'bike', 'walk', 'all']
+
+
+class Command(BaseCommand):
+    help = 'Compiles road networks into memory-mapped snapshots for fast worker startup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--place', default=None, help='Place to compile instead of the configured regions')
+        parser.add_argument('--region', action='append', dest='regions',
+                            help='Region to compile (repeatable, defaults to every region)')
+        parser.add_argument(
+            '--network-type', action='append', dest='network_types', choices=NETWORK_TYPES,
+            help='Network type to compile (repeatable, defaults to all types used by the app)',
+        )
+        parser.add_argument(
+            '--landmarks', type=int, default=0,
+            help='Also precompute this many ALT landmarks for the A* routing backend',
+        )
+
+    def handle(self, *args, **options):
+        if options['place']:
+            places = [options['place']]
+        else:
+            try:
+                regions = [region_registry.get(name) for name in options['regions'] or []] or region_registry.regions
+            except KeyError as e:
+                raise CommandError(f'Unknown region {e}')
+            places = [region.place for region in regions]
+        for place in places:
+            self.compile_place(place, options)
+
+    def compile_place(self, place, options):
+        for network_type in options['network_types'] or NETWORK_TYPES:
+            try:
+                G = load_graph(place, network_type)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Failed to load {network_type} map data for {place}: {str(e)}"))
+                continue
+            path = compile_snapshot(G, snapshot_path(place, network_type))
+            self.stdout.write(self.style.SUCCESS(
+                f'Wrote {network_type} snapshot for {place} to {path} '
+                f'({G.number_of_nodes()} nodes, {G.number_of_edges()} edges)'
+            ))
+            if options['landmarks']:
+                graph = RoutingGraph(GraphSnapshot.load(path))
+                index = LandmarkIndex.build(graph, options['landmarks'])
+                index.save(path / LANDMARK_DIR)
+                self.stdout.write(self.style.SUCCESS(
+                    f"Computed {index.meta['n_landmarks']} landmarks in {index.meta['build_seconds']}s"
+                ))
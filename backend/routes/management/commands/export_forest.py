@@ -0,0 +1,80 @@
+import json
+import os
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from routes.forest import PackedForest
+from routes.model_registry import ENCODER_FILE, FOREST_DIR, MANIFEST_FILE, MODEL_FILE, ROAD_IDS_FILE
+
+
+class Command(BaseCommand):
+    help = 'Exports the trained speed forest as packed NumPy arrays, which the server then loads instead of pickles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-dir', default=None, help='Model directory; defaults to TRAFFIC_MODEL_DIR')
+        parser.add_argument('--quantize', action='store_true',
+                            help='Store int16 split thresholds and float16 leaf values')
+        parser.add_argument('--check-rows', type=int, default=10000,
+                            help='Random feature rows compared against the pickled model')
+
+    def handle(self, *args, **options):
+        model_dir = Path(
+            options['model_dir'] or getattr(settings, 'TRAFFIC_MODEL_DIR', settings.BASE_DIR / 'traffic_model')
+        )
+        manifest_path = model_dir / MANIFEST_FILE
+        manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+        try:
+            with open(model_dir / manifest.get('model', MODEL_FILE), 'rb') as f:
+                model = pickle.load(f)
+            with open(model_dir / manifest.get('encoder', ENCODER_FILE), 'rb') as f:
+                encoder = pickle.load(f)
+        except FileNotFoundError as e:
+            raise CommandError(f'No trained model in {model_dir}: {e}')
+
+        forest = PackedForest.from_sklearn(model, quantize=options['quantize'])
+        forest.save(model_dir / FOREST_DIR)
+        tmp_path = model_dir / f'{ROAD_IDS_FILE}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, encoder.classes_)
+        os.replace(tmp_path, model_dir / ROAD_IDS_FILE)
+
+        # Same features the server predicts from: road code, hour, day of week
+        rng = np.random.default_rng(0)
+        rows = options['check_rows']
+        features = pd.DataFrame({
+            'road_id_encoded': rng.integers(0, len(encoder.classes_), rows),
+            'hour': rng.integers(0, 24, rows),
+            'day_of_week': rng.integers(0, 7, rows),
+        })
+        start = time.perf_counter()
+        expected = model.predict(features)
+        sklearn_s = time.perf_counter() - start
+        start = time.perf_counter()
+        predicted = PackedForest.load(model_dir / FOREST_DIR).predict(features)
+        packed_s = time.perf_counter() - start
+        pickled_mib = (model_dir / manifest.get('model', MODEL_FILE)).stat().st_size / 2 ** 20
+        self.stdout.write(
+            f'{forest.meta["trees"]} trees, {forest.nbytes / 2 ** 20:.1f} MiB packed vs {pickled_mib:.1f} MiB pickled; '
+            f'{rows} rows in {packed_s * 1000:.0f} ms vs {sklearn_s * 1000:.0f} ms with sklearn, '
+            f'max difference {np.abs(predicted - expected).max() if rows else 0:.4f} km/h'
+        )
+
+        # A new version, so cached weights are recomputed from the forest
+        suffix = '-forest16' if options['quantize'] else '-forest'
+        version = manifest.get('version') or time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+        manifest.update(
+            version=version.removesuffix('-forest').removesuffix('-forest16') + suffix,
+            forest=FOREST_DIR, road_ids=ROAD_IDS_FILE,
+        )
+        tmp_path = model_dir / f'{MANIFEST_FILE}.tmp'
+        tmp_path.write_text(json.dumps(manifest, indent=2))
+        os.replace(tmp_path, manifest_path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported forest to {model_dir / FOREST_DIR} (version {manifest["version"]})'
+        ))
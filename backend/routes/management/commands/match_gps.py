@@ -0,0 +1,75 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from routes.map_matching import WATERMARK, GPSMatcher
+from routes.regions import region_registry
+
+
+class Command(BaseCommand):
+    help = 'Map-matches new RawGPSData points and merges their speeds into TrafficData'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50000, help='Points read per transaction')
+        parser.add_argument('--workers', type=int, default=0, help='Processes matching hourly partitions')
+        parser.add_argument('--max-distance', type=float, default=None,
+                            help='Largest distance in metres between a point and its road')
+        parser.add_argument('--follow', action='store_true',
+                            help='Keep running and poll for new points every --interval seconds')
+        parser.add_argument('--interval', type=float, default=10.0)
+        parser.add_argument('--reset', type=int, metavar='ID', default=None,
+                            help='Move the watermark to this RawGPSData id before starting')
+        parser.add_argument('--region', action='append', dest='regions',
+                            help='Region to match points of (repeatable, defaults to every region)')
+
+    def handle(self, *args, **options):
+        max_distance = options['max_distance']
+        if max_distance is None:
+            max_distance = getattr(settings, 'GPS_MATCH_MAX_DISTANCE_M', 30)
+        regions = region_registry.regions
+        if options['regions']:
+            try:
+                regions = [region_registry.get(name) for name in options['regions']]
+            except KeyError as e:
+                raise CommandError(f'Unknown region {e}')
+        # A point belongs to the region locate() picks: the first one with a
+        # box around it, else the one without a box
+        ordered = sorted(region_registry.regions, key=lambda region: region.bbox is None)
+        matchers = {}
+        for region in regions:
+            claimed = [other.bbox for other in ordered[:ordered.index(region)] if other.bbox is not None]
+            matchers[region.name] = GPSMatcher(
+                region.network('drive'),
+                max_distance=max_distance,
+                workers=options['workers'],
+                tz=getattr(settings, 'GPS_MATCH_TIMEZONE', 'Asia/Kolkata'),
+                bbox=region.bbox,
+                exclude=claimed,
+                # The first region keeps the single-city watermark and its progress
+                watermark_name=WATERMARK if region is region_registry.default else f'{WATERMARK}:{region.name}',
+            )
+            if options['reset'] is not None:
+                matchers[region.name].reset(options['reset'])
+        try:
+            while True:
+                total = 0
+                for name, matcher in matchers.items():
+                    start = time.perf_counter()
+                    processed = matcher.run_batch(options['batch_size'])
+                    if processed:
+                        elapsed = time.perf_counter() - start
+                        self.stdout.write(
+                            f'{name}: matched {processed} points up to id {matcher.watermark()} '
+                            f'({processed / elapsed:.0f} points/s)'
+                        )
+                    total += processed
+                if total:
+                    continue
+                if not options['follow']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            for matcher in matchers.values():
+                matcher.close()
+        for name, matcher in matchers.items():
+            self.stdout.write(self.style.SUCCESS(f'{name}: up to date at RawGPSData id {matcher.watermark()}'))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from routes.models import ProcessingWatermark
+from routes.rollup import WATERMARK, reset_rollup, rollup_batch
+
+
+class Command(BaseCommand):
+    help = 'Adds new TrafficData rows to the hourly per-road speed rollup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100000, help='Rows read per transaction')
+        parser.add_argument('--follow', action='store_true',
+                            help='Keep running and poll for new rows every --interval seconds')
+        parser.add_argument('--interval', type=float, default=60.0)
+        parser.add_argument('--rebuild', action='store_true', help='Empty the rollup and rebuild it from all rows')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset_rollup()
+        while True:
+            start = time.perf_counter()
+            processed = rollup_batch(options['batch_size'])
+            if processed:
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'Rolled up {processed} rows ({processed / elapsed:.0f} rows/s)')
+                continue
+            if not options['follow']:
+                break
+            time.sleep(options['interval'])
+        position = ProcessingWatermark.objects.get(name=WATERMARK).position
+        self.stdout.write(self.style.SUCCESS(f'Up to date at TrafficData id {position}'))
@@ -1,87 +1,131 @@
-import pandas as pd
 import numpy as np
-from django.core.management.base import BaseCommand
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from routes.bulk_load import load_frame
 from routes.models import TrafficData
-import osmnx as ox
-from datetime import datetime, timedelta
+from routes.rollup import reset_rollup
+from routes.regions import region_registry
+from datetime import date
+
+# Base speeds for Indore road types
+BASE_SPEEDS = {
+    'motorway': 70,
+    'primary': 50,
+    'secondary': 40,
+    'tertiary': 30,
+    'residential': 25,
+    'unclassified': 20
+}
+RUSH_HOURS = [9, 10, 11, 18, 19, 20]
+TIMES = np.array([f"{h:02d}:00:00" for h in range(24)])
+# Random draws come in blocks of rows seeded by (seed, block), so a seed gives
+# the same data whatever --chunk-size is
+DRAW_BLOCK = 4096
+
+COLUMNS = [
+    'road_id', 'latitude_start', 'longitude_start', 'latitude_end', 'longitude_end',
+    'date', 'time', 'speed_kmh', 'congestion_level', 'sample_count',
+]
+
 
 class Command(BaseCommand):
-    help = 'Seeds the database with traffic data for Indore'
+    help = 'Seeds the database with traffic data for a region, Indore by default'
 
-    def handle(self, *args, **kwargs):
-        # Clear existing data
-        TrafficData.objects.all().delete()
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Number of rows to generate')
+        parser.add_argument('--start-date', type=date.fromisoformat, default=date(2025, 5, 1),
+                            help='First date of the generated history (YYYY-MM-DD)')
+        parser.add_argument('--days', type=int, default=30, help='Number of days of history')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible data')
+        parser.add_argument('--chunk-size', type=int, default=100000,
+                            help='Rows generated and inserted at a time')
+        parser.add_argument('--method', choices=['auto', 'copy', 'insert'], default='auto',
+                            help='Load with PostgreSQL COPY or batched INSERTs; auto uses COPY on PostgreSQL')
+        parser.add_argument('--append', action='store_true', help='Keep existing rows')
+        parser.add_argument('--region', default=None, help='Region to seed; defaults to the first configured')
+
+    def handle(self, *args, **options):
+        num_rows = options['rows']
+        if num_rows < 0 or options['days'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--rows must be >= 0, --days and --chunk-size >= 1')
+        method = options['method']
+        if method == 'auto':
+            method = 'copy' if connection.vendor == 'postgresql' else 'insert'
+        if method == 'copy' and connection.vendor != 'postgresql':
+            raise CommandError('COPY needs a PostgreSQL database')
+
+        try:
+            region = region_registry.get(options['region']) if options['region'] else region_registry.default
+        except KeyError:
+            raise CommandError(f"Unknown region {options['region']}")
 
-        # Load Indore road network
-        ox.settings.use_cache = True
+        # Load the region's road network
         try:
-            G = ox.graph_from_place('Indore, India', network_type='all')  # Try 'all' for bike/walk
-            edges = ox.graph_to_gdfs(G, nodes=False, edges=True)
+            table = region.network('all').edge_table  # Try 'all' for bike/walk
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Failed to load Indore map data: {str(e)}"))
+            self.stdout.write(self.style.ERROR(f"Failed to load {region.place} map data: {str(e)}"))
             return
+        if not len(table):
+            raise CommandError('The road network has no edges')
+
+        # Clear existing data
+        if not options['append']:
+            TrafficData.objects.all().delete()
+            reset_rollup()
+
+        base_speed_by_class = np.array([
+            BASE_SPEEDS.get(h if isinstance(h, str) else 'residential', 25) for h in table.highway_vocab
+        ], dtype=np.float64)
+        base_speeds = base_speed_by_class[table.highway]
+        seed = options['seed']
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+
+        for start in range(0, num_rows, options['chunk_size']):
+            stop = min(start + options['chunk_size'], num_rows)
+            chunk = self.generate(table, base_speeds, seed, start, stop, options['start_date'], options['days'])
+            with transaction.atomic():
+                load_frame(TrafficData, chunk, method)
+            self.stdout.write(f'{stop}/{num_rows} rows')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully seeded {num_rows} rows for {region.place}'))
+
+    @staticmethod
+    def draw(seed, start, stop):
+        """Hour and random speed factor of rows ``start`` to ``stop``."""
+        hours, factors = [], []
+        first = start // DRAW_BLOCK
+        for block in range(first, -(-stop // DRAW_BLOCK)):
+            rng = np.random.default_rng([seed, block])
+            hours.append(rng.integers(0, 24, DRAW_BLOCK))
+            factors.append(rng.uniform(0.7, 1.3, DRAW_BLOCK))
+        rows = slice(start - first * DRAW_BLOCK, stop - first * DRAW_BLOCK)
+        return np.concatenate(hours)[rows], np.concatenate(factors)[rows]
+
+    def generate(self, table, base_speeds, seed, start, stop, start_date, days):
+        """Rows ``start`` to ``stop``; row i uses edge i and day i in turn."""
+        index = np.arange(start, stop)
+        edge = index % len(table)
+        day = index % days
+        hours, random_factor = self.draw(seed, start, stop)
+        dates = np.datetime64(start_date, 'D') + day
+        # Monday is 0, as in date.weekday()
+        days_of_week = (dates.astype(np.int64) - 4) % 7
+
+        time_factor = np.where(np.isin(hours, RUSH_HOURS), 0.65, 1.0)
+        day_factor = np.where(days_of_week < 5, 0.85, 1.0)
+        speeds = np.clip(base_speeds[edge] * time_factor * day_factor * random_factor, 5, 80)
 
-        # Generate synthetic data
-        num_rows = 10000
-        road_ids = edges['osmid'].values
-        road_types = edges['highway'].values
-        hours = np.random.randint(0, 24, num_rows)
-        days_of_week = np.random.randint(0, 7, num_rows)
-        dates = [datetime(2025, 5, 1) + timedelta(days=i % 30) for i in range(num_rows)]
-        times = [f"{h:02d}:00:00" for h in hours]
-        speeds = []
-
-        # Base speeds for Indore road types
-        base_speeds = {
-            'motorway': 70,
-            'primary': 50,
-            'secondary': 40,
-            'tertiary': 30,
-            'residential': 25,
-            'unclassified': 20
-        }
-
-        # Generate speeds
-        for i in range(num_rows):
-            road_type = road_types[i % len(road_types)] if isinstance(road_types[i % len(road_types)], str) else 'residential'
-            base_speed = base_speeds.get(road_type, 25)
-            hour = hours[i]
-            time_factor = 0.65 if hour in [9, 10, 11, 18, 19, 20] else 1.0
-            day_factor = 0.85 if days_of_week[i] < 5 else 1.0
-            random_factor = np.random.uniform(0.7, 1.3)
-            speed = base_speed * time_factor * day_factor * random_factor
-            speeds.append(max(5, min(speed, 80)))
-
-        # Create DataFrame
-        data = {
-            'road_id': [
-                str(road_ids[i % len(road_ids)][0]) if isinstance(road_ids[i % len(road_ids)], list)
-                else str(road_ids[i % len(road_ids)])
-                for i in range(num_rows)
-            ],
-            'latitude_start': [edges.iloc[i % len(edges)]['geometry'].coords[0][1] for i in range(num_rows)],
-            'longitude_start': [edges.iloc[i % len(edges)]['geometry'].coords[0][0] for i in range(num_rows)],
-            'latitude_end': [edges.iloc[i % len(edges)]['geometry'].coords[-1][1] for i in range(num_rows)],
-            'longitude_end': [edges.iloc[i % len(edges)]['geometry'].coords[-1][0] for i in range(num_rows)],
-            'date': dates,
-            'time': times,
+        return pd.DataFrame({
+            'road_id': table.osmid[edge],
+            'latitude_start': table.start_lat[edge],
+            'longitude_start': table.start_lon[edge],
+            'latitude_end': table.end_lat[edge],
+            'longitude_end': table.end_lon[edge],
+            'date': np.datetime_as_string(dates),
+            'time': TIMES[hours],
             'speed_kmh': speeds,
-            'congestion_level': ['red' if s < 12 else 'yellow' if s < 25 else 'green' for s in speeds]
-        }
-        df = pd.DataFrame(data)
-
-        # Seed database
-        for _, row in df.iterrows():
-            TrafficData.objects.create(
-                road_id=row['road_id'],
-                latitude_start=row['latitude_start'],
-                longitude_start=row['longitude_start'],
-                latitude_end=row['latitude_end'],
-                longitude_end=row['longitude_end'],
-                date=row['date'],
-                time=row['time'],
-                speed_kmh=row['speed_kmh'],
-                congestion_level=row['congestion_level']
-            )
-
-        self.stdout.write(self.style.SUCCESS(f'Successfully seeded {num_rows} rows for Indore'))
\ No newline at end of file
+            'congestion_level': np.where(speeds < 12, 'red', np.where(speeds < 25, 'yellow', 'green')),
+            'sample_count': 1,
+        }, columns=COLUMNS)
@@ -0,0 +1,216 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+
+from .bulk_load import load_frame, update_frame
+from .metrics import metrics
+from .models import ProcessingWatermark, RawGPSData, TrafficData
+from .rollup import apply_samples, locked_watermark
+
+logger = logging.getLogger(__name__)
+
+metrics.describe('gps_matched_points_total', 'counter', 'GPS points map-matched by outcome')
+
+WATERMARK = 'gps_map_matching'
+
+# Snapping structures of the current pool worker, set once per process
+_worker_state = None
+
+
+def congestion_for(speeds):
+    # Same thresholds as the seeded history
+    return np.where(speeds < 12, 'red', np.where(speeds < 25, 'yellow', 'green'))
+
+
+def _init_worker(snap_index, osmid):
+    global _worker_state
+    _worker_state = (snap_index, osmid)
+
+
+def _worker_match(task):
+    return match_partition(*_worker_state, *task)
+
+
+def match_partition(snap_index, osmid, points, max_distance, tz):
+    """Snap one partition of points to edges and aggregate their speeds.
+
+    Points farther than ``max_distance`` metres from any edge are dropped.
+    Returns one row per (road_id, date, hour) in local time ``tz`` with the
+    point count, speed sum and the edge that got the most points.
+    """
+    snaps = snap_index.snap(points['latitude'].to_numpy(), points['longitude'].to_numpy(),
+                            max_distance=max_distance)
+    matched = snaps.edge >= 0
+    local = points['timestamp'][matched].dt.tz_convert(tz)
+    frame = pd.DataFrame({
+        'edge': snaps.edge[matched],
+        'road_id': osmid[snaps.edge[matched]],
+        'date': local.dt.date.to_numpy(),
+        'hour': local.dt.hour.to_numpy(),
+        'speed_kmh': points['speed_kmh'].to_numpy()[matched],
+    })
+    keys = ['road_id', 'date', 'hour']
+    grouped = frame.groupby(keys, sort=False)
+    aggregates = grouped['speed_kmh'].agg(count='size', speed_sum='sum').reset_index()
+    # Coordinates come from the road's busiest edge
+    busiest = frame.groupby(keys + ['edge'], sort=False).size().reset_index(name='n')
+    busiest = busiest.sort_values('n', ascending=False).drop_duplicates(keys)
+    return aggregates.merge(busiest[keys + ['edge']], on=keys), int((~matched).sum())
+
+
+class GPSMatcher:
+    """Turns RawGPSData into per-(road_id, date, hour) TrafficData speeds.
+
+    Points are read in id order after a watermark, map-matched to the
+    nearest edge within ``max_distance`` metres and averaged per road, local
+    date and hour. Each batch is written and the watermark advanced in one
+    transaction, so an interrupted run resumes where it stopped and no point
+    is counted twice. Batches are split into hourly partitions, which never
+    share an aggregate, and matched on ``workers`` processes.
+
+    Only points older than ``settle_seconds`` are read, so inserts still
+    committing with lower ids are not skipped. With a ``bbox`` (min_lat,
+    min_lon, max_lat, max_lon) only points inside it are read, points inside
+    any of the ``exclude`` boxes are skipped, and ``watermark_name`` keeps
+    each region's progress apart.
+    """
+
+    def __init__(self, network, max_distance=30, workers=0, tz='Asia/Kolkata', settle_seconds=10,
+                 bbox=None, watermark_name=WATERMARK, exclude=()):
+        self.network = network
+        self.bbox = bbox
+        self.exclude = list(exclude)
+        self.watermark_name = watermark_name
+        self.max_distance = max_distance
+        self.workers = workers
+        self.tz = tz
+        self.settle_seconds = settle_seconds
+        self._pool = None
+
+    def watermark(self):
+        mark, _ = ProcessingWatermark.objects.get_or_create(name=self.watermark_name)
+        return mark.position
+
+    def reset(self, position=0):
+        ProcessingWatermark.objects.update_or_create(name=self.watermark_name, defaults={'position': position})
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def run_batch(self, batch_size=50000):
+        """Process the next batch of points; returns how many were read."""
+        start = self.watermark()
+        settled = timezone.now() - timedelta(seconds=self.settle_seconds)
+        points = RawGPSData.objects.filter(id__gt=start, created_at__lte=settled)
+        if self.bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = self.bbox
+            points = points.filter(latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+        for min_lat, min_lon, max_lat, max_lon in self.exclude:
+            points = points.exclude(latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+        rows = list(
+            points.order_by('id').values_list('id', 'latitude', 'longitude', 'speed_kmh', 'timestamp')[:batch_size]
+        )
+        if not rows:
+            return 0
+        points = pd.DataFrame(rows, columns=['id', 'latitude', 'longitude', 'speed_kmh', 'timestamp'])
+        points['timestamp'] = pd.to_datetime(points['timestamp'], utc=True)
+        aggregates = self.match(points)
+
+        with transaction.atomic():
+            # Lock the watermark so concurrent runs cannot process the same batch
+            mark = ProcessingWatermark.objects.select_for_update().get(name=self.watermark_name)
+            if mark.position != start:
+                logger.warning('Watermark moved from %d to %d by another run, skipping batch',
+                               start, mark.position)
+                return 0
+            self.upsert(aggregates)
+            mark.position = int(points['id'].iloc[-1])
+            mark.save(update_fields=['position', 'updated_at'])
+        return len(points)
+
+    def match(self, points):
+        snap_index = self.network.snap_index
+        osmid = np.asarray(self.network.snapshot.edge_osmid)
+        # Local hours, as IST is offset by half an hour from UTC hours
+        hours = points['timestamp'].dt.tz_convert(self.tz).dt.floor('h')
+        tasks = [
+            (partition, self.max_distance, self.tz)
+            for _, partition in points.groupby(hours, sort=False)
+        ]
+        if self.workers > 1 and len(tasks) > 1:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                                 initargs=(snap_index, osmid))
+            results = list(self._pool.map(_worker_match, tasks))
+        else:
+            results = [match_partition(snap_index, osmid, *task) for task in tasks]
+        unmatched = sum(dropped for _, dropped in results)
+        metrics.inc('gps_matched_points_total', len(points) - unmatched, outcome='matched')
+        metrics.inc('gps_matched_points_total', unmatched, outcome='unmatched')
+        return pd.concat([aggregates for aggregates, _ in results], ignore_index=True)
+
+    def upsert(self, aggregates):
+        """Merge aggregates into TrafficData as sample-weighted means.
+
+        Must run in a transaction; the hourly rollup is updated with it.
+        """
+        if not len(aggregates):
+            return
+        keys = ['road_id', 'date', 'hour']
+        existing = []
+        for day, group in aggregates.groupby('date'):
+            road_ids = group['road_id'].unique().tolist()
+            for i in range(0, len(road_ids), 500):
+                existing += TrafficData.objects.filter(date=day, road_id__in=road_ids[i:i + 500]).values_list(
+                    'id', 'road_id', 'date', 'time', 'speed_kmh', 'sample_count',
+                )
+        existing = pd.DataFrame(existing, columns=['id', 'road_id', 'date', 'time', 'old_speed', 'old_count'])
+        existing['hour'] = [t.hour for t in existing['time']]
+        # Seeded history may hold several rows per key; merge into the first
+        existing = existing.sort_values('id').drop_duplicates(keys)
+        merged = aggregates.merge(existing[keys + ['id', 'old_speed', 'old_count']], on=keys, how='left')
+
+        found = merged['id'].notna()
+        update = merged[found]
+        counts = update['old_count'] + update['count']
+        speeds = (update['old_speed'] * update['old_count'] + update['speed_sum']) / counts
+        update_frame(TrafficData, pd.DataFrame({
+            'id': update['id'].astype(np.int64),
+            'speed_kmh': speeds,
+            'sample_count': counts.astype(np.int64),
+            'congestion_level': congestion_for(speeds.to_numpy()),
+        }))
+        # Rows already rolled up get the new points added to the rollup here;
+        # later rows are rolled up with their merged speeds
+        rolled_up = update[update['id'] <= locked_watermark().position]
+        apply_samples(pd.DataFrame({
+            'road_id': rolled_up['road_id'],
+            'day_of_week': pd.to_datetime(rolled_up['date']).dt.dayofweek,
+            'hour': rolled_up['hour'],
+            'speed_kmh': rolled_up['speed_sum'] / rolled_up['count'],
+            'weight': rolled_up['count'],
+        }))
+
+        create = merged[~found]
+        table = self.network.edge_table
+        edge = create['edge'].to_numpy()
+        speeds = (create['speed_sum'] / create['count']).to_numpy()
+        load_frame(TrafficData, pd.DataFrame({
+            'road_id': create['road_id'].to_numpy(),
+            'latitude_start': table.start_lat[edge],
+            'longitude_start': table.start_lon[edge],
+            'latitude_end': table.end_lat[edge],
+            'longitude_end': table.end_lon[edge],
+            'date': [day.isoformat() for day in create['date']],
+            'time': [f'{hour:02d}:00:00' for hour in create['hour']],
+            'speed_kmh': speeds,
+            'congestion_level': congestion_for(speeds),
+            'sample_count': create['count'].to_numpy(),
+        }))
@@ -0,0 +1,50 @@
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+
+def _matrix_rows(matrix, sources, seed_nodes, seed_costs, seed_starts):
+    """Costs from virtual source nodes to every destination.
+
+    Destination ``j`` owns seeds ``seed_starts[j]`` up to the next start and
+    costs the cheapest of them.
+    """
+    dist = dijkstra(matrix, indices=sources)
+    return np.minimum.reduceat(dist[:, seed_nodes] + seed_costs, seed_starts, axis=1)
+
+
+def cost_matrix(graph, origins, destinations, edge_weights, chunk_rows=64):
+    """Cheapest travel cost between every origin and destination endpoint.
+
+    One-to-many Dijkstra from a virtual node per origin, run over chunks of
+    ``chunk_rows`` origins at a time to bound memory. Endpoints are snapped ``Endpoint``
+    objects built with the same ``edge_weights``. Returns an
+    ``(len(origins), len(destinations))`` array with inf where a
+    destination cannot be reached.
+    """
+    n = graph.n_nodes
+    shape = (len(origins), len(destinations))
+    if not shape[0] or not shape[1]:
+        return np.empty(shape)
+    matrix = graph.seeded_matrix(graph.pair_weights(edge_weights), [origin.seeds for origin in origins])
+    seed_nodes = np.array([node for d in destinations for node, _ in d.seeds], dtype=np.int64)
+    seed_costs = np.array([cost for d in destinations for _, cost in d.seeds])
+    seed_starts = np.concatenate([[0], np.cumsum([len(d.seeds) for d in destinations])[:-1]])
+    costs = np.vstack([
+        _matrix_rows(matrix, np.arange(n + start, n + min(start + chunk_rows, shape[0])),
+                     seed_nodes, seed_costs, seed_starts)
+        for start in range(0, shape[0], chunk_rows)
+    ])
+
+    # Origin and destination on the same edge, destination further along
+    on_edge = {}
+    for j, destination in enumerate(destinations):
+        for edge, fraction in zip(destination.edges, destination.fractions):
+            if edge < 0:
+                continue
+            on_edge.setdefault(edge, []).append((j, fraction))
+    for i, origin in enumerate(origins):
+        for edge, fraction in zip(origin.edges, origin.fractions):
+            for j, dest_fraction in on_edge.get(edge, ()):
+                if dest_fraction >= fraction:
+                    costs[i, j] = min(costs[i, j], (dest_fraction - fraction) * float(edge_weights[edge]))
+    return costs
@@ -0,0 +1,88 @@
+import threading
+
+
+HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    inner = ','.join(f'{k}="{v}"' for k, v in labels)
+    return '{' + inner + '}'
+
+
+def _sort_key(item):
+    # Histogram buckets in numeric order of their upper bound
+    (name, labels), _ = item
+    return name, tuple((k, float(v)) if k == 'le' else (k, v) for k, v in labels)
+
+
+def _family(name, meta):
+    if name in meta:
+        return name
+    for suffix in HISTOGRAM_SUFFIXES:
+        if name.endswith(suffix) and name[:-len(suffix)] in meta:
+            return name[:-len(suffix)]
+    return None
+
+
+class Metrics:
+    """Minimal in-process metrics store rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._values = {}
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = value
+
+    def observe(self, name, value, buckets, **labels):
+        """Add ``value`` to histogram ``name`` with the given bucket upper bounds."""
+        base = tuple(sorted(labels.items()))
+        with self._lock:
+            for bound in (*buckets, float('inf')):
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                key = (f'{name}_bucket', tuple(sorted(base + (('le', le),))))
+                self._values[key] = self._values.get(key, 0) + (value <= bound)
+            for suffix, amount in (('_sum', value), ('_count', 1)):
+                key = (name + suffix, base)
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def clear(self, name, **labels):
+        """Remove the series of ``name``, or only those carrying all of ``labels``."""
+        labels = set(labels.items())
+        with self._lock:
+            for key in [k for k in self._values if k[0] == name and labels <= set(k[1])]:
+                del self._values[key]
+
+    def value(self, name, **labels):
+        return self._values.get((name, tuple(sorted(labels.items()))))
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items(), key=_sort_key)
+        lines = []
+        described = set()
+        for (name, labels), value in items:
+            family = _family(name, self._meta)
+            if family is not None and family not in described:
+                kind, help_text = self._meta[family]
+                lines.append(f'# HELP {family} {help_text}')
+                lines.append(f'# TYPE {family} {kind}')
+                described.add(family)
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("routes", "0002_gps_matching"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrafficRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("road_id", models.BigIntegerField()),
+                ("day_of_week", models.PositiveSmallIntegerField()),
+                ("hour", models.PositiveSmallIntegerField()),
+                ("sample_count", models.PositiveIntegerField(default=0)),
+                ("mean_speed_kmh", models.FloatField()),
+                ("p10_speed_kmh", models.FloatField()),
+                ("p50_speed_kmh", models.FloatField()),
+                ("p90_speed_kmh", models.FloatField()),
+                ("histogram", models.BinaryField()),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("day_of_week", "hour", "road_id"),
+                        name="unique_traffic_rollup_key",
+                    )
+                ],
+            },
+        ),
+    ]
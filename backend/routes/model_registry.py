@@ -0,0 +1,181 @@
+import json
+import logging
+import pickle
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .forest import PackedForest, RoadIdClasses
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = 'traffic_model.pkl'
+ENCODER_FILE = 'road_id_encoder.pkl'
+MANIFEST_FILE = 'manifest.json'
+FOREST_DIR = 'forest'
+ROAD_IDS_FILE = 'road_ids.npy'
+# sklearn's tree node struct plus one float64 leaf value
+TREE_NODE_BYTES = 72
+
+metrics.describe('traffic_model_info', 'gauge', 'Currently served speed model version per model directory')
+metrics.describe('traffic_model_reload_seconds', 'gauge', 'Time spent loading the last speed model')
+metrics.describe('traffic_model_reloads_total', 'counter', 'Speed model loads by outcome')
+metrics.describe('traffic_model_loaded_timestamp_seconds', 'gauge', 'Unix time the served model was loaded')
+
+
+class ModelBundle:
+    """A speed model and the road id encoder it was trained with.
+
+    ``speed_table`` optionally holds the model's prediction for every
+    (encoded road, hour, day_of_week), memory-mapped from disk. ``forest``
+    is the model exported as a ``PackedForest``; bundles loaded with one
+    leave ``model`` unset.
+    """
+
+    def __init__(self, model, encoder, version, loaded_at, speed_table=None, forest=None):
+        self.model = model
+        self.encoder = encoder
+        self.speed_table = speed_table
+        self.forest = forest
+        self.version = version
+        self.loaded_at = loaded_at
+
+    @property
+    def nbytes(self):
+        """Approximate memory of the model, encoder, forest and speed table."""
+        total = np.asarray(self.encoder.classes_).nbytes
+        if self.model is not None:
+            total += sum(estimator.tree_.node_count for estimator in self.model.estimators_) * TREE_NODE_BYTES
+        if self.forest is not None:
+            total += self.forest.nbytes
+        if self.speed_table is not None:
+            total += self.speed_table.nbytes
+        return total
+
+
+class ModelRegistry:
+    """Keeps the speed model in memory and swaps in retrained versions.
+
+    ``train_model.py`` writes ``manifest.json`` after the pickles, so a
+    change of the manifest signals a complete new model. Without a manifest
+    the pickle modification times are used instead. Files are checked at
+    most every ``MODEL_RELOAD_INTERVAL`` seconds. While a new model loads,
+    other requests keep being served by the previous one. ``on_load``, when
+    set, is called with the registry after every load.
+    """
+
+    def __init__(self, model_dir=None, check_interval=None):
+        self._model_dir = model_dir
+        self._check_interval = check_interval
+        self._bundle = None
+        self._fingerprint = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.on_load = None
+
+    @property
+    def model_dir(self):
+        return Path(self._model_dir or getattr(settings, 'TRAFFIC_MODEL_DIR', settings.BASE_DIR / 'traffic_model'))
+
+    @property
+    def check_interval(self):
+        if self._check_interval is not None:
+            return self._check_interval
+        return getattr(settings, 'MODEL_RELOAD_INTERVAL', 5)
+
+    def _current_fingerprint(self):
+        manifest = self.model_dir / MANIFEST_FILE
+        if manifest.exists():
+            return (manifest.stat().st_mtime_ns,)
+        return tuple((self.model_dir / name).stat().st_mtime_ns for name in (MODEL_FILE, ENCODER_FILE))
+
+    def _load(self, fingerprint):
+        start = time.perf_counter()
+        manifest_path = self.model_dir / MANIFEST_FILE
+        manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+        model_dir = self.model_dir
+        # A packed forest and its road ids load without unpickling anything
+        model = forest = None
+        if manifest.get('forest') and manifest.get('road_ids'):
+            forest = PackedForest.load(model_dir / manifest['forest'])
+            encoder = RoadIdClasses(np.load(model_dir / manifest['road_ids'], mmap_mode='r'))
+        else:
+            with open(model_dir / manifest.get('model', MODEL_FILE), 'rb') as f:
+                model = pickle.load(f)
+            with open(model_dir / manifest.get('encoder', ENCODER_FILE), 'rb') as f:
+                encoder = pickle.load(f)
+        version = manifest.get('version') or f'mtime-{max(fingerprint) // 10 ** 9}'
+        speed_table = None
+        if manifest.get('speed_table'):
+            speed_table = np.load(model_dir / manifest['speed_table'], mmap_mode='r')
+            if speed_table.shape != (len(encoder.classes_), 24, 7):
+                logger.warning('Ignoring speed table of shape %s for model version %s', speed_table.shape, version)
+                speed_table = None
+        bundle = ModelBundle(model, encoder, version, time.time(), speed_table=speed_table, forest=forest)
+
+        # Every region may serve its own model, so series are per directory
+        labels = {'model_dir': str(model_dir)}
+        metrics.set('traffic_model_reload_seconds', round(time.perf_counter() - start, 6), **labels)
+        metrics.clear('traffic_model_info', **labels)
+        metrics.set('traffic_model_info', 1, version=version, **labels)
+        metrics.set('traffic_model_loaded_timestamp_seconds', round(bundle.loaded_at, 3), **labels)
+        metrics.inc('traffic_model_reloads_total', outcome='success')
+        return bundle
+
+    def _refresh(self, force=False):
+        self._next_check = time.monotonic() + self.check_interval
+        fingerprint = self._current_fingerprint()
+        bundle = self._bundle
+        if force or bundle is None or fingerprint != self._fingerprint:
+            bundle = self._bundle = self._load(fingerprint)
+            self._fingerprint = fingerprint
+            logger.info('Loaded speed model version %s', bundle.version)
+            if self.on_load is not None:
+                self.on_load(self)
+        # The model loaded here, even if another registry's load has
+        # unloaded it since
+        return bundle
+
+    def get(self):
+        bundle = self._bundle
+        if bundle is not None and time.monotonic() < self._next_check:
+            return bundle
+        if bundle is None:
+            # Nothing to serve yet, so every caller waits for the first load
+            with self._lock:
+                return self._bundle or self._refresh()
+        # A reload is already running in another thread; keep serving the
+        # model we have
+        if not self._lock.acquire(blocking=False):
+            return bundle
+        try:
+            bundle = self._refresh()
+        except Exception:
+            metrics.inc('traffic_model_reloads_total', outcome='failure')
+            logger.exception('Failed to reload speed model, keeping version %s', bundle.version)
+        finally:
+            self._lock.release()
+        return bundle
+
+    def reload(self):
+        with self._lock:
+            return self._refresh(force=True)
+
+    @property
+    def nbytes(self):
+        bundle = self._bundle
+        return bundle.nbytes if bundle is not None else 0
+
+    def unload(self):
+        """Drop the model; the next ``get`` loads it again.
+
+        Takes no lock, as it is called while other registries load.
+        """
+        self._bundle = None
+        self._fingerprint = None
+
+model_registry = ModelRegistry()
@@ -13,6 +13,8 @@ class TrafficData(models.Model):
     time = models.TimeField()
     speed_kmh = models.FloatField()
     congestion_level = models.CharField(max_length=20)
+    # Observations averaged into speed_kmh, e.g. matched GPS points
+    sample_count = models.PositiveIntegerField(default=1)
 
     class Meta:
         indexes = [
@@ -24,4 +26,34 @@ class RawGPSData(models.Model):
     longitude = models.FloatField()
     speed_kmh = models.FloatField()
     timestamp = models.DateTimeField()
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class ProcessingWatermark(models.Model):
+    """Progress of an incremental job, e.g. the last RawGPSData id map-matched."""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class TrafficRollup(models.Model):
+    """Speed statistics of TrafficData per road, day of week and hour.
+
+    Maintained incrementally by the ``rollup_traffic`` command, see
+    ``routes.rollup``.
+    """
+    road_id = models.BigIntegerField()
+    # Monday is 0, as in date.weekday()
+    day_of_week = models.PositiveSmallIntegerField()
+    hour = models.PositiveSmallIntegerField()
+    sample_count = models.PositiveIntegerField(default=0)
+    mean_speed_kmh = models.FloatField()
+    p10_speed_kmh = models.FloatField()
+    p50_speed_kmh = models.FloatField()
+    p90_speed_kmh = models.FloatField()
+    # Sample counts per speed bin, see routes.rollup.SPEED_BIN_KMH
+    histogram = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            # Also serves snapshot queries for one day of week and hour
+            models.UniqueConstraint(fields=['day_of_week', 'hour', 'road_id'], name='unique_traffic_rollup_key'),
+        ]
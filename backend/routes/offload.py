@@ -0,0 +1,92 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .metrics import metrics
+
+metrics.describe('offload_pending', 'gauge', 'Offloaded calls queued or running')
+metrics.describe('offload_calls_total', 'counter', 'Offloaded calls by outcome')
+
+
+class PoolFull(Exception):
+    pass
+
+
+class OffloadPool:
+    """Bounded thread pool for running blocking work from async views.
+
+    At most ``max_pending`` calls may be queued or running; further calls
+    are refused with ``PoolFull`` instead of queueing without limit. Each
+    call gets a ``threading.Event`` as its ``cancel`` argument, set when the
+    caller times out or is cancelled, e.g. because the client went away.
+    Work in a thread cannot be interrupted, so the callee should check the
+    event between stages. A cancelled call keeps its slot until its thread
+    actually finishes.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None):
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_workers(self):
+        if self._max_workers is not None:
+            return self._max_workers
+        return getattr(settings, 'ROUTE_ASYNC_WORKERS', 4)
+
+    @property
+    def max_pending(self):
+        if self._max_pending is not None:
+            return self._max_pending
+        return getattr(settings, 'ROUTE_ASYNC_MAX_PENDING', 16)
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+            metrics.set('offload_pending', self._pending)
+
+    async def run(self, fn, *args, timeout=None):
+        """Run ``fn(*args, cancel=event)`` in the pool and await its result.
+
+        Raises ``PoolFull`` when the pool is saturated and
+        ``asyncio.TimeoutError`` after ``timeout`` seconds.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                metrics.inc('offload_calls_total', outcome='rejected')
+                raise PoolFull()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='offload')
+            self._pending += 1
+            metrics.set('offload_pending', self._pending)
+        cancel = threading.Event()
+        try:
+            future = self._executor.submit(fn, *args, cancel=cancel)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            cancel.set()
+            metrics.inc('offload_calls_total', outcome='timeout')
+            raise
+        except asyncio.CancelledError:
+            cancel.set()
+            metrics.inc('offload_calls_total', outcome='cancelled')
+            raise
+        metrics.inc('offload_calls_total', outcome='completed')
+        return result
+
+
+route_pool = OffloadPool()
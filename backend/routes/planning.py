@@ -0,0 +1,106 @@
+from datetime import datetime
+
+from django.conf import settings
+
+from .alternatives import find_alternatives
+from .route_cache import route_cache, route_key
+from .snapping import attach_endpoints, direct_path, path_along
+from .tracing import span
+from .weights import weight_cache
+
+# Map travel mode to osmnx network type
+NETWORK_TYPES = {'drive': 'drive', 'bike': 'bike', 'walk': 'walk'}
+
+
+class RouteCancelled(Exception):
+    pass
+
+
+def parse_route_request(data, travel_mode='drive', optimize=None):
+    """Source, destination, time, travel mode and weight of one route request.
+
+    Raises KeyError, ValueError or AttributeError for invalid input.
+    """
+    source = tuple(map(float, data['source'].split(',')))
+    dest = tuple(map(float, data['destination'].split(',')))
+    if len(source) != 2 or len(dest) != 2:
+        raise ValueError('coordinates')
+    date_time = datetime.fromisoformat(data['date_time'].replace('Z', '+05:30'))
+    travel_mode = data.get('travel_mode', travel_mode)
+    if optimize is None:
+        optimize = getattr(settings, 'ROUTE_OPTIMIZE', 'distance')
+    optimize = data.get('optimize', optimize)
+    if optimize not in ('distance', 'time'):
+        raise ValueError(optimize)
+    return source, dest, date_time, travel_mode, optimize
+
+
+def plan_routes(network, bundle, snaps, travel_mode, optimize, date_time, cancel=None):
+    """Best route and dissimilar alternatives between the two points of ``snaps``.
+
+    Routes are searched on the directed multigraph either by length or by
+    predicted travel time for the requested hour and day. Returns the found
+    paths together with the origin and destination endpoints. Raises
+    ``RouteCancelled`` if the optional ``cancel`` event is set meanwhile.
+    """
+    snapshot = network.snapshot
+    snap_index = network.snap_index
+    graph = network.routing_graph
+    edge_weights = snapshot.edge_length
+    bound_scale = 1.0
+    if optimize == 'time':
+        with span('weights'):
+            weights = weight_cache.get(network, bundle, date_time.hour, date_time.weekday(), travel_mode)
+        edge_weights = weights.seconds
+        bound_scale = weights.bound_scale
+    with span('snap'):
+        origin = snap_index.endpoint(snaps, 0, edge_weights, origin=True)
+        destination = snap_index.endpoint(snaps, 1, edge_weights, origin=False)
+    direct = direct_path(origin, destination, edge_weights, snapshot)
+    if direct is not None:
+        return [direct], origin, destination
+
+    with span('route_cache'):
+        cache_key = route_key(network, bundle, snap_index, snaps, travel_mode, optimize, date_time)
+        cached = route_cache.get(cache_key)
+        if cached is not None:
+            # Same corridor as a recent request: reuse its routes, trimmed to
+            # this request's snapped points. If any of them does not pass
+            # through both points, search afresh instead.
+            found = [path_along(edges, origin, destination, edge_weights, snapshot) for edges in cached]
+            if all(path is not None for path in found):
+                return found, origin, destination
+
+    with span('search'):
+        found = find_alternatives(
+            graph,
+            origin.seeds,
+            destination.seeds,
+            k=getattr(settings, 'ROUTE_ALTERNATIVES', 3),
+            max_similarity=getattr(settings, 'ROUTE_MAX_SIMILARITY', 0.8),
+            pair_weights=graph.pair_weights(edge_weights),
+            bound_scale=bound_scale,
+            cancel=cancel,
+        )
+    if cancel is not None and cancel.is_set():
+        raise RouteCancelled()
+    found = [attach_endpoints(path, origin, destination, snapshot) for path in found]
+    with span('route_cache'):
+        route_cache.put(cache_key, [path.edges for path in found])
+    return found, origin, destination
+
+
+def name_routes(found, optimize):
+    first_name = 'Fastest Time' if optimize == 'time' else 'Shortest Distance'
+    return [
+        (first_name if i == 0 else f'Alternative Route {i+1}', path)
+        for i, path in enumerate(found)
+    ]
+
+
+def rank_routes(route_results):
+    # Sort by travel time and mark fastest as recommended
+    route_results.sort(key=lambda x: x['total_time_min'])
+    if route_results:
+        route_results[0]['recommended'] = True
+    return route_results
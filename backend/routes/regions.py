@@ -0,0 +1,102 @@
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .graph_registry import DEFAULT_PLACE, graph_registry
+from .model_registry import ModelRegistry, model_registry
+
+
+class RegionError(ValueError):
+    """Request coordinates that no single served region covers."""
+
+
+class Region:
+    """One served area: an OSM place, the box requests are dispatched by, and its speed model.
+
+    ``bbox`` is ``(min_lat, min_lon, max_lat, max_lon)``; a region without
+    one takes every point no other region covers. Regions without a
+    ``model_dir`` share the TRAFFIC_MODEL_DIR model. Loaded models count
+    against the graph registry's memory budget.
+    """
+
+    def __init__(self, name, place, bbox=None, model_dir=None):
+        self.name = name
+        self.place = place
+        self.bbox = tuple(float(v) for v in bbox) if bbox is not None else None
+        self.model_dir = model_dir
+        self.models = ModelRegistry(model_dir) if model_dir is not None else model_registry
+
+    def contains(self, lats, lons):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        if self.bbox is None:
+            return np.ones(lats.shape, dtype=bool)
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        return (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+
+    def network(self, network_type):
+        return graph_registry.get(self.place, network_type)
+
+    def bundle(self):
+        bundle = self.models.get()
+        graph_registry.hold(self.models)
+        return bundle
+
+
+class RegionRegistry:
+    """Regions configured in ROUTE_REGIONS, in order, and request dispatch.
+
+    ROUTE_REGIONS maps each region's name to its ``place``, ``bbox`` and
+    optional ``model_dir``. Without it, one region named "default" serves
+    DEFAULT_PLACE everywhere. Region networks and models load lazily and
+    the graph registry keeps them within REGION_MEMORY_BUDGET_MB.
+    """
+
+    def __init__(self):
+        self._config = None
+        self._regions = []
+        self._lock = threading.Lock()
+
+    @property
+    def regions(self):
+        config = getattr(settings, 'ROUTE_REGIONS', None) or {'default': {'place': DEFAULT_PLACE}}
+        with self._lock:
+            # Rebuilt only when the setting changes, so each region keeps its
+            # model registry
+            if config != self._config:
+                self._regions = [
+                    Region(name, options['place'], options.get('bbox'), options.get('model_dir'))
+                    for name, options in config.items()
+                ]
+                self._config = config
+            return self._regions
+
+    @property
+    def default(self):
+        return self.regions[0]
+
+    def get(self, name):
+        for region in self.regions:
+            if region.name == name:
+                return region
+        raise KeyError(name)
+
+    def locate(self, lats, lons):
+        """The region covering every one of the points.
+
+        Regions with a bounding box are tried before one without. Raises
+        ``RegionError`` when the points fall outside every region or span
+        several, as routes never cross regions.
+        """
+        regions = sorted(self.regions, key=lambda region: region.bbox is None)
+        for region in regions:
+            if region.contains(lats, lons).all():
+                return region
+        touched = [region.name for region in regions if region.contains(lats, lons).any()]
+        if touched:
+            raise RegionError(f"Coordinates span regions {', '.join(touched)}; requests must stay within one region")
+        raise RegionError('Coordinates are outside every served region')
+
+
+region_registry = RegionRegistry()
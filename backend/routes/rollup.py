@@ -0,0 +1,231 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+from .bulk_load import load_frame, update_frame
+from .metrics import metrics
+from .models import ProcessingWatermark, TrafficData, TrafficRollup
+from .scoring import congestion_levels
+
+metrics.describe('traffic_rollup_samples_total', 'counter', 'TrafficData samples added to the hourly rollup')
+
+WATERMARK = 'traffic_rollup'
+
+# Speed histogram of each rollup row: SPEED_BINS bins SPEED_BIN_KMH wide,
+# the last one also holding faster samples. Percentiles interpolate
+# linearly within a bin.
+SPEED_BIN_KMH = 4
+SPEED_BINS = 32
+HISTOGRAM_DTYPE = np.dtype('<u4')
+PERCENTILES = (10, 50, 90)
+CONGESTION_LEVELS = ('green', 'yellow', 'red')
+
+
+def histogram_percentiles(histograms, q):
+    """Speed at percentile ``q`` of each row of ``histograms``."""
+    cumulative = np.cumsum(histograms, axis=1)
+    target = cumulative[:, -1] * (q / 100)
+    bins = np.minimum((cumulative < target[:, None]).sum(axis=1), SPEED_BINS - 1)
+    rows = np.arange(len(histograms))
+    below = np.where(bins > 0, cumulative[rows, np.maximum(bins - 1, 0)], 0)
+    within = histograms[rows, bins]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = np.where(within > 0, (target - below) / within, 0.0)
+    return (bins + np.clip(fraction, 0, 1)) * SPEED_BIN_KMH
+
+
+def apply_samples(frame):
+    """Add speed samples to the rollup.
+
+    ``frame`` has road_id, day_of_week, hour, speed_kmh and weight, the
+    number of samples the speed stands for. Must run in a transaction
+    holding the rollup watermark, see ``locked_watermark``.
+    """
+    if not len(frame):
+        return
+    slots = frame['day_of_week'].to_numpy(np.int64) * 24 + frame['hour'].to_numpy(np.int64)
+    keys = frame['road_id'].to_numpy(np.int64) * 168 + slots
+    unique, inverse = np.unique(keys, return_inverse=True)
+    speeds = frame['speed_kmh'].to_numpy(np.float64)
+    weights = frame['weight'].to_numpy(np.float64)
+    bins = np.clip((speeds // SPEED_BIN_KMH).astype(np.int64), 0, SPEED_BINS - 1)
+    added = np.bincount(inverse * SPEED_BINS + bins, weights=weights,
+                        minlength=len(unique) * SPEED_BINS).reshape(len(unique), SPEED_BINS)
+    added_sums = np.bincount(inverse, weights=speeds * weights, minlength=len(unique))
+    road_ids, slots = np.divmod(unique, 168)
+
+    existing = []
+    for slot in np.unique(slots):
+        roads = road_ids[slots == slot].tolist()
+        for i in range(0, len(roads), 500):
+            existing += TrafficRollup.objects.filter(
+                day_of_week=slot // 24, hour=slot % 24, road_id__in=roads[i:i + 500],
+            ).values_list('id', 'road_id', 'day_of_week', 'hour', 'sample_count', 'mean_speed_kmh', 'histogram')
+    ids = np.zeros(len(unique), dtype=np.int64)
+    histograms = added.astype(np.int64)
+    sums = added_sums
+    if existing:
+        found = np.searchsorted(unique, [row[1] * 168 + row[2] * 24 + row[3] for row in existing])
+        ids[found] = [row[0] for row in existing]
+        sums[found] += np.array([row[4] * row[5] for row in existing])
+        histograms[found] += np.stack([np.frombuffer(bytes(row[6]), dtype=HISTOGRAM_DTYPE) for row in existing])
+    counts = histograms.sum(axis=1)
+    stats = pd.DataFrame({
+        'sample_count': counts,
+        'mean_speed_kmh': sums / np.maximum(counts, 1),
+        **{f'p{q}_speed_kmh': histogram_percentiles(histograms, q) for q in PERCENTILES},
+        'histogram': [row.tobytes() for row in histograms.astype(HISTOGRAM_DTYPE)],
+    })
+
+    update = ids > 0
+    update_frame(TrafficRollup, stats[update].assign(id=ids[update]))
+    # Histograms are bytes, which COPY's CSV cannot carry
+    load_frame(TrafficRollup, stats[~update].assign(
+        road_id=road_ids[~update], day_of_week=slots[~update] // 24, hour=slots[~update] % 24,
+    ), method='insert')
+    metrics.inc('traffic_rollup_samples_total', int(weights.sum()))
+
+
+def locked_watermark():
+    """The rollup watermark row, locked until the current transaction ends.
+
+    TrafficData rows with ids up to its position are in the rollup. Writers
+    that change such rows in place add the difference with
+    ``apply_samples`` while holding this lock.
+    """
+    ProcessingWatermark.objects.get_or_create(name=WATERMARK)
+    return ProcessingWatermark.objects.select_for_update().get(name=WATERMARK)
+
+
+def rollup_batch(batch_size=100000):
+    """Add the next TrafficData rows to the rollup; returns how many were read.
+
+    Rows are read by id after the watermark, so rows inserted by a
+    transaction that commits after one with higher ids are missed; rebuild
+    after loading data concurrently with other writers.
+    """
+    with transaction.atomic():
+        mark = locked_watermark()
+        rows = list(
+            TrafficData.objects.filter(id__gt=mark.position).order_by('id')
+            .values_list('id', 'road_id', 'date', 'time', 'speed_kmh', 'sample_count')[:batch_size]
+        )
+        if not rows:
+            return 0
+        ids, road_ids, dates, times, speeds, weights = zip(*rows)
+        apply_samples(pd.DataFrame({
+            'road_id': road_ids,
+            # Monday is 0; 1970-01-01 was a Thursday
+            'day_of_week': (np.array(dates, dtype='datetime64[D]').astype(np.int64) - 4) % 7,
+            'hour': [t.hour for t in times],
+            'speed_kmh': speeds,
+            'weight': weights,
+        }))
+        mark.position = ids[-1]
+        mark.save(update_fields=['position', 'updated_at'])
+    return len(rows)
+
+
+def reset_rollup():
+    """Empty the rollup so the next batches rebuild it from all TrafficData."""
+    with transaction.atomic():
+        mark = locked_watermark()
+        TrafficRollup.objects.all().delete()
+        mark.position = 0
+        mark.save(update_fields=['position', 'updated_at'])
+
+
+class CongestionSnapshot:
+    """Rollup statistics mapped onto a network's edges for one day of week and hour.
+
+    Columns are per-edge arrays, restricted to edges whose road has samples.
+    """
+
+    def __init__(self, table, road_ids, stats):
+        positions = np.clip(np.searchsorted(road_ids, table.osmid), 0, max(len(road_ids) - 1, 0))
+        matched = road_ids[positions] == table.osmid if len(road_ids) else np.zeros(len(table), dtype=bool)
+        self.edge = np.flatnonzero(matched)
+        rows = positions[self.edge]
+        self.road_id = table.osmid[self.edge]
+        self.start_lat = table.start_lat[self.edge]
+        self.start_lon = table.start_lon[self.edge]
+        self.end_lat = table.end_lat[self.edge]
+        self.end_lon = table.end_lon[self.edge]
+        self.samples = stats['sample_count'][rows]
+        self.speed_kmh = stats['mean_speed_kmh'][rows]
+        self.percentiles = {q: stats[f'p{q}_speed_kmh'][rows] for q in PERCENTILES}
+        levels = congestion_levels(self.speed_kmh, table.max_speed[self.edge])
+        self.congestion = np.select([levels == level for level in CONGESTION_LEVELS], list(range(len(CONGESTION_LEVELS))))
+
+    def within(self, min_lat, min_lon, max_lat, max_lon):
+        """Mask of edges with either end inside the bounding box."""
+        def inside(lat, lon):
+            return (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        return inside(self.start_lat, self.start_lon) | inside(self.end_lat, self.end_lon)
+
+    def payload(self, mask=None):
+        """JSON-ready columns, with congestion as indices into ``levels``."""
+        select = (lambda column: column[mask]) if mask is not None else (lambda column: column)
+        return {
+            'levels': list(CONGESTION_LEVELS),
+            'count': int(len(self.edge) if mask is None else mask.sum()),
+            'edge': select(self.edge).tolist(),
+            'road_id': select(self.road_id).tolist(),
+            'start_lat': np.round(select(self.start_lat), 6).tolist(),
+            'start_lon': np.round(select(self.start_lon), 6).tolist(),
+            'end_lat': np.round(select(self.end_lat), 6).tolist(),
+            'end_lon': np.round(select(self.end_lon), 6).tolist(),
+            'samples': select(self.samples).tolist(),
+            'speed_kmh': np.round(select(self.speed_kmh), 1).tolist(),
+            **{f'p{q}_kmh': np.round(select(values), 1).tolist() for q, values in self.percentiles.items()},
+            'congestion': select(self.congestion).tolist(),
+        }
+
+
+class CongestionCache:
+    """Congestion snapshots per network, day of week and hour, kept for a TTL.
+
+    Building a snapshot reads one row per road from the rollup; the cache
+    keeps repeated snapshot requests to array slicing.
+    """
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'CONGESTION_CACHE_TTL', 60)
+
+    def get(self, network, day_of_week, hour):
+        key = (network.place, network.network_type, network.version, day_of_week, hour)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        columns = ['road_id', 'sample_count', 'mean_speed_kmh', *(f'p{q}_speed_kmh' for q in PERCENTILES)]
+        rows = TrafficRollup.objects.filter(day_of_week=day_of_week, hour=hour).order_by('road_id')
+        stats = pd.DataFrame(list(rows.values_list(*columns)), columns=columns)
+        snapshot = CongestionSnapshot(
+            network.edge_table, stats['road_id'].to_numpy(np.int64),
+            {name: stats[name].to_numpy() for name in columns[1:]},
+        )
+        with self._lock:
+            # Drop expired snapshots so the cache stays at most 168 per network
+            self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+            self._entries[key] = (now + self.ttl, snapshot)
+        return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+congestion_cache = CongestionCache()
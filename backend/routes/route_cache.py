@@ -0,0 +1,186 @@
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .lru import LRUCache
+from .metrics import metrics
+from .snapping import NODE_FRACTION
+
+metrics.describe('route_cache_total', 'counter', 'Route cache lookups by tier and result')
+metrics.describe('route_cache_entries', 'gauge', 'Routes held in the in-process route cache')
+
+
+def route_key(network, bundle, snap_index, snaps, travel_mode, optimize, date_time, snap_m=None):
+    """Cache key for a route request between two snapped points.
+
+    Endpoints are identified by their snapped edge and a ``snap_m`` metre
+    bucket along it, so nearby requests on the same corridor share routes.
+    Endpoints snapped onto a node are identified by the node instead, since
+    their routes may leave it along any of its edges.
+    The time bucket only matters when optimizing for travel time. Graph and
+    model versions are part of the key, so reloads never serve stale routes.
+    """
+    if snap_m is None:
+        snap_m = getattr(settings, 'ROUTE_CACHE_SNAP_M', 25)
+    endpoints = []
+    for i in range(len(snaps)):
+        edge = int(snaps.edge[i])
+        fraction = float(snaps.fraction[i])
+        if fraction <= NODE_FRACTION or fraction >= 1 - NODE_FRACTION:
+            edges = snap_index.snapshot.edge_u if fraction <= NODE_FRACTION else snap_index.snapshot.edge_v
+            endpoints += ['node', int(edges[edge])]
+            continue
+        along = fraction * float(snap_index.edge_geom_len[edge])
+        endpoints += [edge, int(along // snap_m) if snap_m > 0 else along]
+    bucket = [date_time.hour, date_time.weekday()] if optimize == 'time' else [None, None]
+    return (
+        network.place, network.network_type, network.snapshot.meta.get('built_at'), bundle.version,
+        travel_mode, optimize, *bucket, *endpoints,
+    )
+
+
+class SQLiteRouteStore:
+    """Route cache shared by all worker processes through a SQLite file."""
+
+    def __init__(self, path, max_entries=100000):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._puts = 0
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS route_cache '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value FROM route_cache WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, value, ttl):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO route_cache (key, value, expires) VALUES (?, ?, ?)',
+                (key, json.dumps(value), now + ttl),
+            )
+            self._puts += 1
+            # Prune now and then rather than on every write
+            if self._puts % 100 == 0:
+                conn.execute('DELETE FROM route_cache WHERE expires <= ?', (now,))
+                conn.execute(
+                    'DELETE FROM route_cache WHERE key NOT IN '
+                    '(SELECT key FROM route_cache ORDER BY expires DESC LIMIT ?)',
+                    (self.max_entries,),
+                )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM route_cache')
+
+
+class RouteCache:
+    """LRU cache of found routes with a TTL, optionally backed by a shared store.
+
+    Values are the edge-index lists of the routes found between two snapped
+    endpoints. Responses are still scored per request, so the exact snapped
+    points and the speeds for the requested time are always used; only the
+    route search is skipped.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, store=None):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._store = store
+        self._store_loaded = store is not None
+        self._entries = LRUCache(lambda: self.max_entries)
+
+    @property
+    def max_entries(self):
+        if self._max_entries is not None:
+            return self._max_entries
+        return getattr(settings, 'ROUTE_CACHE_SIZE', 1024)
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'ROUTE_CACHE_TTL', 300)
+
+    @property
+    def store(self):
+        if not self._store_loaded:
+            path = getattr(settings, 'ROUTE_CACHE_SHARED_PATH', None)
+            self._store = SQLiteRouteStore(path) if path else None
+            self._store_loaded = True
+        return self._store
+
+    def get(self, key):
+        """Cached routes for ``key`` as a list of edge-index arrays, or None."""
+        if self.max_entries <= 0:
+            return None
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, routes = entry
+            if expires > now:
+                metrics.inc('route_cache_total', tier='local', result='hit')
+                return routes
+            self._entries.pop(key)
+        metrics.inc('route_cache_total', tier='local', result='miss')
+
+        store = self.store
+        if store is None:
+            return None
+        try:
+            value = store.get(json.dumps(key))
+        except sqlite3.Error:
+            value = None
+        if value is None:
+            metrics.inc('route_cache_total', tier='shared', result='miss')
+            return None
+        metrics.inc('route_cache_total', tier='shared', result='hit')
+        routes = [np.array(edges, dtype=np.int64) for edges in value]
+        self._put_local(key, routes, now)
+        return routes
+
+    def put(self, key, routes):
+        if self.max_entries <= 0:
+            return
+        routes = [np.asarray(edges, dtype=np.int64) for edges in routes]
+        self._put_local(key, routes, time.time())
+        store = self.store
+        if store is not None:
+            try:
+                store.put(json.dumps(key), [edges.tolist() for edges in routes], self.ttl)
+            except sqlite3.Error:
+                pass
+
+    def _put_local(self, key, routes, now):
+        for edges in routes:
+            edges.flags.writeable = False
+        self._entries.put(key, (now + self.ttl, routes))
+        metrics.set('route_cache_entries', len(self._entries))
+
+    def clear(self):
+        self._entries.clear()
+        metrics.set('route_cache_entries', 0)
+        if self.store is not None:
+            self.store.clear()
+
+
+route_cache = RouteCache()
@@ -0,0 +1,209 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from .landmarks import astar
+from .lru import LRUCache
+
+# Weight arrays whose pair weights and A* weight lists are kept per graph
+WEIGHT_CACHE_SIZE = 4
+
+
+class Path:
+    """A route through a RoutingGraph as node and edge indices.
+
+    When the route starts or ends part-way along an edge, only the part of
+    the first edge after ``start_fraction`` and the part of the last edge
+    before ``end_fraction`` are travelled.
+    """
+
+    def __init__(self, nodes, edges, cost, start_fraction=0.0, end_fraction=1.0):
+        self.nodes = nodes
+        self.edges = edges
+        self.cost = cost
+        self.start_fraction = start_fraction
+        self.end_fraction = end_fraction
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+class RoutingGraph:
+    """Directed search graph over a snapshot's CSR adjacency.
+
+    Parallel edges are collapsed to the cheapest one per (u, v) pair and
+    self-loops are dropped. Every pair remembers which snapshot edge it
+    came from, so found paths map back to concrete multigraph edges.
+
+    Point-to-point queries run scipy's Dijkstra, or A* with landmark lower
+    bounds when a ``LandmarkIndex`` is attached.
+
+    Pair weights derived from a read-only weight array, such as snapshot
+    lengths or cached travel times, are cached together with the list A*
+    reads them from, so repeated queries skip the per-edge conversions.
+    """
+
+    def __init__(self, snapshot, landmarks=None):
+        self.snapshot = snapshot
+        self.landmarks = landmarks
+        self.n_nodes = snapshot.n_nodes
+        self.edge_u = np.asarray(snapshot.edge_u)
+        self.edge_v = np.asarray(snapshot.edge_v)
+        self.edge_length = np.asarray(snapshot.edge_length)
+        self.pair_edges = self._pair_edges(self.edge_length)
+        self.pair_u = self.edge_u[self.pair_edges].astype(np.int64)
+        self.pair_v = self.edge_v[self.pair_edges].astype(np.int64)
+        self.pair_keys = self.pair_u * self.n_nodes + self.pair_v
+        # Pairs are sorted by tail node, so they form a CSR adjacency too
+        self.pair_indptr = np.searchsorted(self.pair_u, np.arange(self.n_nodes + 1))
+        self._adjacency_lists = None
+        # By id() of read-only weight arrays, which entries keep alive
+        self._pair_weights = LRUCache(WEIGHT_CACHE_SIZE)
+        self._weight_lists = LRUCache(WEIGHT_CACHE_SIZE)
+
+    @property
+    def backend(self):
+        return 'alt' if self.landmarks is not None else 'dijkstra'
+
+    def _pair_edges(self, weights):
+        candidates = np.flatnonzero(self.edge_u != self.edge_v)
+        keys = self.edge_u[candidates].astype(np.int64) * self.n_nodes + self.edge_v[candidates]
+        order = np.lexsort((weights[candidates], keys))
+        keys = keys[order]
+        first = np.concatenate([[True], keys[1:] != keys[:-1]])
+        return candidates[order][first]
+
+    def pair_weights(self, edge_weights=None):
+        """Weights of the pairs from per-edge weights, by default edge lengths.
+
+        The result is read-only, and shared when ``edge_weights`` is.
+        """
+        if edge_weights is None:
+            edge_weights = self.edge_length
+        cacheable = isinstance(edge_weights, np.ndarray) and not edge_weights.flags.writeable
+        if cacheable:
+            cached = self._pair_weights.get(id(edge_weights))
+            if cached is not None and cached[0] is edge_weights:
+                return cached[1]
+        pair_weights = np.asarray(edge_weights, dtype=np.float64)[self.pair_edges]
+        pair_weights.flags.writeable = False
+        if cacheable:
+            self._pair_weights.put(id(edge_weights), (edge_weights, pair_weights))
+        return pair_weights
+
+    def weight_list(self, pair_weights):
+        """``pair_weights`` as a list for A*, cached when the array is read-only."""
+        pair_weights = np.asarray(pair_weights, dtype=np.float64)
+        if pair_weights.flags.writeable:
+            return pair_weights.tolist()
+        cached = self._weight_lists.get(id(pair_weights))
+        if cached is not None and cached[0] is pair_weights:
+            return cached[1]
+        weights = pair_weights.tolist()
+        self._weight_lists.put(id(pair_weights), (pair_weights, weights))
+        return weights
+
+    def matrix(self, pair_weights):
+        return csr_matrix(
+            (pair_weights, (self.edge_u[self.pair_edges], self.edge_v[self.pair_edges])),
+            shape=(self.n_nodes, self.n_nodes),
+        )
+
+    def seeded_matrix(self, pair_weights, endpoints):
+        """Search matrix with a virtual node ``n + i`` per endpoint.
+
+        Virtual node ``n + i`` has an edge to each ``(node, cost)`` seed of
+        ``endpoints[i]``. Pairs are already in CSR order, so the matrix is
+        assembled without sorting.
+        """
+        seeds = [sorted(_seeds(endpoint)) for endpoint in endpoints]
+        counts = np.array([len(s) for s in seeds], dtype=np.int64)
+        return csr_matrix(
+            (
+                np.concatenate([pair_weights, [c for s in seeds for _, c in s]]),
+                np.concatenate([self.pair_v, [node for s in seeds for node, _ in s]]).astype(np.int64),
+                np.concatenate([self.pair_indptr, len(self.pair_v) + np.cumsum(counts)]),
+            ),
+            shape=(self.n_nodes + len(seeds), self.n_nodes + len(seeds)),
+        )
+
+    def pairs_between(self, nodes):
+        """Positions in ``pair_edges`` for consecutive node indices of a path."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        return np.searchsorted(self.pair_keys, nodes[:-1] * self.n_nodes + nodes[1:])
+
+    def edges_between(self, nodes):
+        """Snapshot edge indices for consecutive node indices of a path."""
+        return self.pair_edges[self.pairs_between(nodes)]
+
+    def shortest_path(self, source, target, pair_weights=None, matrix=None, bound_scale=1.0, weight_list=None):
+        """Shortest path from ``source`` to ``target``; None when unreachable.
+
+        Endpoints are node indices or lists of ``(node, cost)`` seeds, e.g.
+        from a snapped ``Endpoint``: the search starts at any source seed
+        and ends at any target seed, adding the seed costs. The returned
+        path runs between the chosen seed nodes and its cost includes them.
+
+        With landmarks attached, ``pair_weights`` must be at least
+        ``bound_scale`` times the edge lengths for the result to be optimal.
+        A* reads them from ``weight_list`` instead when given, which must
+        hold the same values.
+        """
+        sources = _seeds(source)
+        targets = _seeds(target)
+        if pair_weights is None:
+            pair_weights = self.pair_weights()
+        if self.landmarks is not None:
+            if weight_list is None:
+                weight_list = self.weight_list(pair_weights)
+            return self._astar(sources, targets, weight_list, bound_scale)
+        return self._dijkstra(sources, targets, pair_weights, matrix)
+
+    def _dijkstra(self, sources, targets, pair_weights, matrix):
+        n = self.n_nodes
+        if len(sources) == 1 and sources[0][1] == 0:
+            source = sources[0][0]
+            if matrix is None:
+                matrix = self.matrix(pair_weights)
+        else:
+            # Virtual source n connects to the source seeds
+            source = n
+            matrix = self.seeded_matrix(pair_weights, [sources])
+        dist, pred, _ = dijkstra(matrix, indices=source, return_predecessors=True, min_only=True)
+        # Finish at whichever target seed is cheapest including its cost
+        target_nodes = np.array([t for t, _ in targets], dtype=np.int64)
+        totals = dist[target_nodes] + np.array([c for _, c in targets])
+        best = int(np.argmin(totals))
+        if not np.isfinite(totals[best]):
+            return None
+        nodes = [int(target_nodes[best])]
+        while nodes[-1] != source and pred[nodes[-1]] >= 0:
+            nodes.append(pred[nodes[-1]])
+        nodes = nodes[::-1]
+        if source == n:
+            nodes = nodes[1:]
+        nodes = np.array(nodes, dtype=np.int64)
+        return Path(nodes, self.edges_between(nodes), float(totals[best]))
+
+    def _astar(self, sources, targets, weight_list, bound_scale):
+        if self._adjacency_lists is None:
+            self._adjacency_lists = (self.pair_indptr.tolist(), self.pair_v.tolist())
+        indptr, heads = self._adjacency_lists
+        targets = dict(targets)
+        bounds = self.landmarks.block_bounds(targets, bound_scale)
+        found = astar(indptr, heads, weight_list, sources, targets, bounds)
+        if found is None:
+            return None
+        cost, nodes = found
+        nodes = np.array(nodes, dtype=np.int64)
+        return Path(nodes, self.edges_between(nodes), float(cost))
+
+
+def _seeds(endpoint):
+    """Normalize an endpoint to ``(node, cost)`` seeds, one per node."""
+    if np.ndim(endpoint) == 0:
+        return [(int(endpoint), 0.0)]
+    best = {}
+    for node, cost in endpoint:
+        best[int(node)] = min(float(cost), best.get(int(node), np.inf))
+    return list(best.items())
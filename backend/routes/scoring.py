@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+
+# Speed adjustment per travel mode
+SPEED_MULTIPLIERS = {'drive': 1.0, 'bike': 0.5, 'walk': 0.1}
+MIN_SPEED_KMH = 5
+
+# Free-flow speeds used for the congestion thresholds
+MAX_SPEEDS = {'motorway': 80, 'primary': 60, 'secondary': 50, 'residential': 30}
+DEFAULT_MAX_SPEED = 50
+
+
+def encode_road_ids(encoder, osm_ids):
+    """Vectorized ``encoder.transform`` that maps unknown ids to ``classes_[0]``."""
+    classes = encoder.classes_
+    osm_ids = np.asarray(osm_ids)
+    positions = np.clip(np.searchsorted(classes, osm_ids), 0, len(classes) - 1)
+    return np.where(classes[positions] == osm_ids, positions, 0)
+
+
+def predict_speeds(bundle, osm_ids, hour, day_of_week):
+    """Predict speeds for many roads at one point in time.
+
+    Uses the precomputed speed table when the model ships one, otherwise a
+    single batched call of the packed forest or the model. ``hour`` and
+    ``day_of_week`` may also be arrays with one entry per road.
+    """
+    if len(osm_ids) == 0:
+        return np.empty(0)
+    road_codes = encode_road_ids(bundle.encoder, osm_ids)
+    if bundle.speed_table is not None:
+        return bundle.speed_table[road_codes, hour, day_of_week].astype(np.float64)
+    features = pd.DataFrame({
+        'road_id_encoded': road_codes,
+        'hour': np.full(len(osm_ids), hour),
+        'day_of_week': np.full(len(osm_ids), day_of_week),
+    })
+    if bundle.forest is not None:
+        return bundle.forest.predict(features)
+    return bundle.model.predict(features)
+
+
+def max_speed_for(road_type):
+    try:
+        return MAX_SPEEDS.get(road_type, DEFAULT_MAX_SPEED)
+    except TypeError:
+        # List-valued highway tags have no class of their own
+        return np.nan
+
+
+def congestion_levels(speeds, max_speeds):
+    return np.where(
+        np.isnan(max_speeds), 'yellow',
+        np.where(speeds < max_speeds * 0.4, 'red',
+                 np.where(speeds < max_speeds * 0.7, 'yellow', 'green')),
+    )
+
+
+def score_paths(table, routes, bundle, date_time, travel_mode, start_point=None, end_point=None):
+    """Predict speeds and travel times for every segment of ``routes``.
+
+    ``routes`` holds ``(name, Path)`` entries whose edges index ``table``.
+    The first and last segments are shortened to the paths' start and end
+    fractions and, when given, begin at ``start_point`` and end at
+    ``end_point`` (``(lon, lat)`` tuples). All segments of all candidate
+    routes are scored in one batch. Returns one result dict per route, in
+    the order given.
+    """
+    n = len(routes)
+    return score_path_batch(
+        table, routes, bundle,
+        hours=[date_time.hour] * n,
+        days=[date_time.weekday()] * n,
+        travel_modes=[travel_mode] * n,
+        start_points=[start_point] * n,
+        end_points=[end_point] * n,
+    )
+
+
+def score_path_batch(table, routes, bundle, hours, days, travel_modes, start_points, end_points):
+    """``score_paths`` with a time, travel mode and endpoints per route.
+
+    Routes of many requests are scored together with a single speed
+    prediction.
+    """
+    counts = np.array([len(path.edges) for _, path in routes], dtype=np.int64)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    edge_index = np.concatenate([path.edges for _, path in routes] or [[]]).astype(np.int64)
+
+    # Share of each edge travelled: all of it except on a route's first and
+    # last edge
+    kept = np.ones(len(edge_index))
+    nonempty = counts > 0
+    kept[starts[nonempty]] -= [path.start_fraction for _, path in routes if len(path.edges)]
+    kept[ends[nonempty] - 1] -= [1 - path.end_fraction for _, path in routes if len(path.edges)]
+
+    osm_ids = table.osmid[edge_index]
+    lengths = table.length[edge_index] * kept
+    start_lat = table.start_lat[edge_index]
+    start_lon = table.start_lon[edge_index]
+    end_lat = table.end_lat[edge_index]
+    end_lon = table.end_lon[edge_index]
+    for r in np.flatnonzero(nonempty).tolist():
+        if start_points[r] is not None:
+            start_lon[starts[r]], start_lat[starts[r]] = start_points[r]
+        if end_points[r] is not None:
+            end_lon[ends[r] - 1], end_lat[ends[r] - 1] = end_points[r]
+
+    speed_multipliers = np.repeat([SPEED_MULTIPLIERS.get(mode, 1.0) for mode in travel_modes], counts)
+    raw_speeds = predict_speeds(bundle, osm_ids, np.repeat(hours, counts), np.repeat(days, counts))
+    speeds = np.maximum(raw_speeds * speed_multipliers, MIN_SPEED_KMH)
+    congestion = congestion_levels(speeds, table.max_speed[edge_index]).tolist()
+    # Travel time in hours
+    times = (lengths / 1000 / speeds).tolist()
+    speeds = speeds.tolist()
+    lengths = lengths.tolist()
+    osm_ids = osm_ids.tolist()
+    start_lat, start_lon, end_lat, end_lon = (a.tolist() for a in (start_lat, start_lon, end_lat, end_lon))
+
+    route_results = []
+    for (route_name, _), offset, end in zip(routes, starts.tolist(), ends.tolist()):
+        route_segments = [
+            {
+                'road_id': osm_ids[i],
+                'latitude_start': start_lat[i],
+                'longitude_start': start_lon[i],
+                'latitude_end': end_lat[i],
+                'longitude_end': end_lon[i],
+                'speed_kmh': round(speeds[i], 1),
+                'congestion_level': congestion[i],
+                'length_m': round(lengths[i], 1),
+                'travel_time_min': round(times[i] * 60, 1),
+            }
+            for i in range(offset, end)
+        ]
+        route_results.append({
+            'route_name': route_name,
+            'total_distance_km': round(sum(lengths[offset:end]) / 1000, 2),
+            'total_time_min': round(sum(times[offset:end]) * 60, 1),
+            'segments': route_segments,
+        })
+    return route_results
@@ -0,0 +1,259 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .routing import Path
+
+EARTH_RADIUS_M = 6371008.8
+# Snapped points this close to either end of an edge, as a fraction of its
+# length, are taken to be at the node itself
+NODE_FRACTION = 1e-6
+
+
+class Snaps:
+    """Result of snapping a batch of points onto road edges.
+
+    ``edge`` is -1 for points farther than the allowed distance. ``fraction``
+    is the position of the snapped point along the edge geometry (0 at the
+    edge's start node, 1 at its end node).
+    """
+
+    def __init__(self, edge, fraction, distance_m, lat, lon):
+        self.edge = edge
+        self.fraction = fraction
+        self.distance_m = distance_m
+        self.lat = lat
+        self.lon = lon
+
+    def __len__(self):
+        return len(self.edge)
+
+    def take(self, indices):
+        return Snaps(*(a[indices] for a in (self.edge, self.fraction, self.distance_m, self.lat, self.lon)))
+
+
+class Endpoint:
+    """A snapped route endpoint expressed as search seeds.
+
+    Each seed is ``(node, cost)``: a graph node and the cost of travelling
+    between the snapped point and that node along ``edges[i]``. A point
+    snapped onto a node also seeds that node at cost 0, with an edge of -1.
+    """
+
+    def __init__(self, seeds, edges, fractions, lat, lon):
+        self.seeds = seeds
+        self.edges = edges
+        self.fractions = fractions
+        self.lat = lat
+        self.lon = lon
+
+
+class SnapIndex:
+    """Spatial index over a snapshot's nodes and edge geometries.
+
+    Coordinates are projected onto a local equirectangular plane in metres.
+    Edge geometries are cut into pieces of at most ``piece_m`` metres whose
+    midpoints go into a KD-tree; the nearest edge is then found exactly by
+    projecting onto the candidate segments.
+    """
+
+    def __init__(self, snapshot, piece_m=50.0):
+        self.snapshot = snapshot
+        lat0 = float(np.mean(snapshot.node_y)) if snapshot.n_nodes else 0.0
+        self._ky = EARTH_RADIUS_M * np.pi / 180
+        self._kx = self._ky * np.cos(np.radians(lat0))
+
+        self.node_tree = cKDTree(self.project(snapshot.node_x, snapshot.node_y))
+
+        coords = self.project(snapshot.geom_coords[:, 0], snapshot.geom_coords[:, 1])
+        counts = np.diff(snapshot.geom_offsets)
+        coord_edge = np.repeat(np.arange(snapshot.n_edges), counts)
+        valid = coord_edge[:-1] == coord_edge[1:]
+        self.seg_a = coords[:-1][valid]
+        self.seg_b = coords[1:][valid]
+        self.seg_edge = coord_edge[:-1][valid]
+        self.seg_len = np.linalg.norm(self.seg_b - self.seg_a, axis=1)
+        # Distance along the edge geometry at which each segment starts
+        before = np.cumsum(self.seg_len) - self.seg_len
+        self.seg_offset = before - before[np.searchsorted(self.seg_edge, self.seg_edge)]
+        self.edge_geom_len = np.bincount(self.seg_edge, self.seg_len, minlength=snapshot.n_edges)
+
+        n_pieces = np.maximum(1, np.ceil(self.seg_len / piece_m)).astype(np.int64)
+        self.piece_seg = np.repeat(np.arange(len(self.seg_len)), n_pieces)
+        within = np.arange(len(self.piece_seg)) - np.repeat(np.cumsum(n_pieces) - n_pieces, n_pieces)
+        t = ((within + 0.5) / n_pieces[self.piece_seg])[:, None]
+        a = self.seg_a[self.piece_seg]
+        self.piece_tree = cKDTree(a + t * (self.seg_b[self.piece_seg] - a))
+        self.half_piece = piece_m / 2
+
+        self.twin = self._twin_edges()
+
+    def project(self, lon, lat):
+        return np.column_stack([np.asarray(lon) * self._kx, np.asarray(lat) * self._ky])
+
+    def unproject(self, xy):
+        return xy[:, 1] / self._ky, xy[:, 0] / self._kx
+
+    def _twin_edges(self):
+        """Index of the opposite-direction edge of the same way, or -1."""
+        s = self.snapshot
+        u, v, osmid = (np.asarray(a).tolist() for a in (s.edge_u, s.edge_v, s.edge_osmid))
+        lookup = {key: i for i, key in enumerate(zip(u, v, osmid))}
+        return np.array([lookup.get(key, -1) for key in zip(v, u, osmid)], dtype=np.int64)
+
+    def nearest_nodes(self, lats, lons):
+        """Nearest node index and distance in metres for each point."""
+        distance, node = self.node_tree.query(self.project(lons, lats))
+        return node, distance
+
+    def _project_onto(self, points, segs):
+        a = self.seg_a[segs]
+        ab = self.seg_b[segs] - a
+        denom = np.einsum('...i,...i->...', ab, ab)
+        t = np.einsum('...i,...i->...', points - a, ab) / np.where(denom > 0, denom, 1)
+        t = np.clip(np.where(denom > 0, t, 0), 0, 1)
+        nearest = a + t[..., None] * ab
+        return t, nearest, np.linalg.norm(points - nearest, axis=-1)
+
+    def snap(self, lats, lons, max_distance=None, k=16):
+        """Snap points to the nearest edge; batched over all points."""
+        points = self.project(lons, lats)
+        n_points = len(points)
+        n_total = len(self.piece_seg)
+        if n_total == 0:
+            raise ValueError('Road network has no edges to snap to')
+
+        segs = np.empty(n_points, dtype=np.int64)
+        ts = np.empty(n_points)
+        nearest = np.empty((n_points, 2))
+        distances = np.empty(n_points)
+        pending = np.arange(n_points)
+        k = min(k, n_total)
+        while len(pending):
+            mid_dist, pieces = self.piece_tree.query(points[pending], k=k)
+            mid_dist = mid_dist.reshape(len(pending), -1)
+            cand = self.piece_seg[pieces.reshape(len(pending), -1)]
+            t, near, dist = self._project_onto(points[pending][:, None, :], cand)
+            best = np.argmin(dist, axis=1)
+            rows = np.arange(len(pending))
+            segs[pending] = cand[rows, best]
+            ts[pending] = t[rows, best]
+            nearest[pending] = near[rows, best]
+            distances[pending] = dist[rows, best]
+            # A closer segment could still hide beyond the k-th piece only if
+            # that piece's midpoint is within reach of the best distance
+            unresolved = mid_dist[:, -1] <= distances[pending] + self.half_piece
+            if k >= n_total or not unresolved.any():
+                break
+            pending = pending[unresolved]
+            k = min(k * 4, n_total)
+
+        edge = self.seg_edge[segs]
+        along = self.seg_offset[segs] + ts * self.seg_len[segs]
+        geom_len = self.edge_geom_len[edge]
+        fraction = np.where(geom_len > 0, along / np.where(geom_len > 0, geom_len, 1), 0.0)
+        lat, lon = self.unproject(nearest)
+        if max_distance is not None:
+            edge = np.where(distances <= max_distance, edge, -1)
+        return Snaps(edge, fraction, distances, lat, lon)
+
+    def endpoint(self, snaps, i, edge_weights, origin):
+        """Search seeds for point ``i`` of ``snaps`` under per-edge weights.
+
+        An origin can leave its edge towards the edge's end node, or towards
+        the start node when the way is two-way; a destination is reached
+        the other way round. A point at either end of its edge can also
+        leave or be reached through any other edge at that node.
+        """
+        s = self.snapshot
+        edge = int(snaps.edge[i])
+        fraction = float(snaps.fraction[i])
+        seeds, edges, fractions = [], [], []
+        for e, f in ((edge, fraction), (int(self.twin[edge]), 1 - fraction)):
+            if e < 0:
+                continue
+            if origin:
+                seeds.append((int(s.edge_v[e]), (1 - f) * float(edge_weights[e])))
+            else:
+                seeds.append((int(s.edge_u[e]), f * float(edge_weights[e])))
+            edges.append(e)
+            fractions.append(f)
+        if fraction <= NODE_FRACTION or fraction >= 1 - NODE_FRACTION:
+            node = int(s.edge_u[edge] if fraction <= NODE_FRACTION else s.edge_v[edge])
+            if (node, 0.0) not in seeds:
+                seeds.append((node, 0.0))
+                edges.append(-1)
+                fractions.append(0.0 if origin else 1.0)
+        return Endpoint(seeds, edges, fractions, float(snaps.lat[i]), float(snaps.lon[i]))
+
+
+def _seed_index(endpoint, node):
+    """Index of the cheapest seed at ``node``."""
+    return min((i for i, (seed, _) in enumerate(endpoint.seeds) if seed == node),
+               key=lambda i: endpoint.seeds[i][1])
+
+
+def attach_endpoints(path, origin, destination, snapshot):
+    """Extend a seed-to-seed path with the snapped edges it starts and ends on."""
+    i = _seed_index(origin, int(path.nodes[0]))
+    j = _seed_index(destination, int(path.nodes[-1]))
+    first, last = origin.edges[i], destination.edges[j]
+    nodes, edges = [path.nodes], [path.edges]
+    # Endpoints seeded at their node add no edge
+    if first >= 0:
+        nodes.insert(0, [snapshot.edge_u[first]])
+        edges.insert(0, [first])
+    if last >= 0:
+        nodes.append([snapshot.edge_v[last]])
+        edges.append([last])
+    return Path(
+        np.concatenate(nodes).astype(np.int64),
+        np.concatenate(edges).astype(np.int64),
+        path.cost,
+        start_fraction=origin.fractions[i] if first >= 0 else 0.0,
+        end_fraction=destination.fractions[j] if last >= 0 else 1.0,
+    )
+
+
+def direct_path(origin, destination, edge_weights, snapshot):
+    """The path along a single edge when both endpoints lie on it in order."""
+    best = None
+    for e, f in zip(origin.edges, origin.fractions):
+        for e2, f2 in zip(destination.edges, destination.fractions):
+            if e == e2 and e >= 0 and f2 >= f:
+                cost = (f2 - f) * float(edge_weights[e])
+                if best is None or cost < best.cost:
+                    best = Path(
+                        np.array([snapshot.edge_u[e], snapshot.edge_v[e]], dtype=np.int64),
+                        np.array([e], dtype=np.int64), cost, start_fraction=f, end_fraction=f2,
+                    )
+    return best
+
+
+def _fraction_on(endpoint, edge, node, at_node):
+    """Where ``endpoint`` lies along ``edge``; ``at_node`` when it is seeded at ``node`` instead."""
+    if edge in endpoint.edges:
+        return endpoint.fractions[endpoint.edges.index(edge)]
+    if any(e < 0 and seed == node for e, (seed, _) in zip(endpoint.edges, endpoint.seeds)):
+        return at_node
+    return None
+
+
+def path_along(edges, origin, destination, edge_weights, snapshot):
+    """Rebuild a path from its edge indices between two snapped endpoints.
+
+    Returns None when the edges do not start and end on the endpoints' edges
+    or nodes.
+    """
+    edges = np.asarray(edges, dtype=np.int64)
+    if not len(edges):
+        return None
+    start_fraction = _fraction_on(origin, int(edges[0]), int(snapshot.edge_u[edges[0]]), 0.0)
+    end_fraction = _fraction_on(destination, int(edges[-1]), int(snapshot.edge_v[edges[-1]]), 1.0)
+    if start_fraction is None or end_fraction is None:
+        return None
+    weights = np.asarray(edge_weights)[edges]
+    cost = float(weights.sum() - start_fraction * weights[0] - (1 - end_fraction) * weights[-1])
+    return Path(
+        np.concatenate([snapshot.edge_u[edges], [snapshot.edge_v[edges[-1]]]]).astype(np.int64),
+        edges, cost, start_fraction=start_fraction, end_fraction=end_fraction,
+    )
@@ -0,0 +1,182 @@
+import json
+import time
+from pathlib import Path
+
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+import pandas as pd
+import shapely
+from django.conf import settings
+
+from .array_dir import save_array_dir
+
+FORMAT_VERSION = 1
+
+ARRAYS = (
+    'node_ids', 'node_x', 'node_y',
+    'indptr', 'edge_u', 'edge_v', 'edge_key',
+    'edge_length', 'edge_highway', 'edge_osmid',
+    'geom_offsets', 'geom_coords',
+)
+
+
+def snapshot_root():
+    return Path(getattr(settings, 'GRAPH_SNAPSHOT_DIR', settings.BASE_DIR / 'graph_snapshots'))
+
+
+def snapshot_path(place, network_type):
+    slug = ''.join(c if c.isalnum() else '_' for c in place.lower()).strip('_')
+    return snapshot_root() / slug / network_type
+
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0]
+    return value
+
+
+def graph_arrays(G):
+    """Flatten ``G`` into the snapshot arrays and metadata.
+
+    Nodes are stored sorted by OSM id and edges sorted by tail node, so the
+    edge arrays double as the CSR adjacency of the directed multigraph:
+    the edges leaving node ``i`` are ``indptr[i]:indptr[i + 1]``.
+    """
+    node_ids = np.array(sorted(G.nodes), dtype=np.int64)
+    node_x = np.array([G.nodes[n]['x'] for n in node_ids], dtype=np.float64)
+    node_y = np.array([G.nodes[n]['y'] for n in node_ids], dtype=np.float64)
+
+    edge_list = sorted(G.edges(keys=True, data=True), key=lambda e: (e[0], e[1], e[2]))
+    edge_u = np.searchsorted(node_ids, [e[0] for e in edge_list]).astype(np.int32)
+    edge_v = np.searchsorted(node_ids, [e[1] for e in edge_list]).astype(np.int32)
+    edge_key = np.array([e[2] for e in edge_list], dtype=np.int32)
+    edge_length = np.array([d.get('length', 0.0) for *_, d in edge_list], dtype=np.float64)
+    edge_osmid = np.array([int(_first(d.get('osmid', 0))) for *_, d in edge_list], dtype=np.int64)
+
+    # Highway tags are stored as codes into a JSON-encoded vocabulary so that
+    # list-valued tags survive the round trip unchanged
+    highway_vocab = {}
+    edge_highway = np.array([
+        highway_vocab.setdefault(json.dumps(d.get('highway')), len(highway_vocab))
+        for *_, d in edge_list
+    ], dtype=np.int16)
+
+    geometries = []
+    for (u, v, _, d), iu, iv in zip(edge_list, edge_u, edge_v):
+        if 'geometry' in d:
+            geometries.append(np.asarray(d['geometry'].coords, dtype=np.float64)[:, :2])
+        else:
+            geometries.append(np.array([[node_x[iu], node_y[iu]], [node_x[iv], node_y[iv]]]))
+    counts = np.array([len(g) for g in geometries], dtype=np.int64)
+    geom_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    geom_coords = np.concatenate(geometries) if geometries else np.empty((0, 2))
+
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(edge_u, minlength=len(node_ids)))]).astype(np.int64)
+
+    arrays = {
+        'node_ids': node_ids, 'node_x': node_x, 'node_y': node_y,
+        'indptr': indptr, 'edge_u': edge_u, 'edge_v': edge_v, 'edge_key': edge_key,
+        'edge_length': edge_length, 'edge_highway': edge_highway, 'edge_osmid': edge_osmid,
+        'geom_offsets': geom_offsets, 'geom_coords': geom_coords,
+    }
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'crs': str(G.graph.get('crs', 'epsg:4326')),
+        'highway_vocab': list(highway_vocab),
+        'n_nodes': len(node_ids),
+        'n_edges': len(edge_list),
+        'built_at': time.time(),
+    }
+    return arrays, meta
+
+
+def compile_snapshot(G, path):
+    """Write ``G`` to ``path`` as a directory of ``.npy`` arrays."""
+    arrays, meta = graph_arrays(G)
+    return save_array_dir(path, arrays, meta)
+
+
+class GraphSnapshot:
+    """Read-only view of a compiled road network.
+
+    Arrays are memory-mapped by default, so every worker process on the
+    host shares the same physical pages.
+    """
+
+    def __init__(self, path, arrays, meta):
+        self.path = Path(path) if path is not None else None
+        self.meta = meta
+        self.highway_vocab = [json.loads(h) for h in meta['highway_vocab']]
+        for name in ARRAYS:
+            arrays[name].flags.writeable = False
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        path = Path(path)
+        meta = json.loads((path / 'meta.json').read_text())
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {meta.get('format_version')} in {path}")
+        mmap_mode = 'r' if mmap else None
+        arrays = {name: np.load(path / f'{name}.npy', mmap_mode=mmap_mode) for name in ARRAYS}
+        return cls(path, arrays, meta)
+
+    @classmethod
+    def from_graph(cls, G):
+        arrays, meta = graph_arrays(G)
+        return cls(None, arrays, meta)
+
+    @classmethod
+    def exists(cls, path):
+        return (Path(path) / 'meta.json').exists()
+
+    @property
+    def n_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self):
+        return len(self.edge_u)
+
+    def node_index(self, node_ids):
+        return np.searchsorted(self.node_ids, node_ids)
+
+    def edge_coords(self, edge):
+        return self.geom_coords[self.geom_offsets[edge]:self.geom_offsets[edge + 1]]
+
+    def highways(self):
+        return [self.highway_vocab[code] for code in self.edge_highway]
+
+    def to_graph(self):
+        G = nx.MultiDiGraph(crs=self.meta['crs'])
+        node_ids = self.node_ids.tolist()
+        G.add_nodes_from(
+            (n, {'x': x, 'y': y})
+            for n, x, y in zip(node_ids, self.node_x.tolist(), self.node_y.tolist())
+        )
+        u = self.node_ids[self.edge_u].tolist()
+        v = self.node_ids[self.edge_v].tolist()
+        G.add_edges_from(
+            (a, b, k, {'osmid': osmid, 'length': length, 'highway': highway})
+            for a, b, k, osmid, length, highway in zip(
+                u, v, self.edge_key.tolist(), self.edge_osmid.tolist(),
+                self.edge_length.tolist(), self.highways(),
+            )
+        )
+        return G
+
+    def edges_frame(self):
+        counts = np.diff(self.geom_offsets)
+        geometry = shapely.linestrings(
+            np.asarray(self.geom_coords), indices=np.repeat(np.arange(self.n_edges), counts)
+        )
+        index = pd.MultiIndex.from_arrays(
+            [self.node_ids[self.edge_u], self.node_ids[self.edge_v], np.asarray(self.edge_key)],
+            names=['u', 'v', 'key'],
+        )
+        return gpd.GeoDataFrame({
+            'osmid': np.asarray(self.edge_osmid),
+            'highway': self.highways(),
+            'length': np.asarray(self.edge_length),
+        }, geometry=geometry, index=index, crs=self.meta['crs'])
@@ -1,3 +1,310 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import date, datetime, time
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
 
-# Create your tests here.
+import networkx as nx
+import numpy as np
+import pandas as pd
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from sklearn.ensemble import RandomForestRegressor
+
+from benchmarks.support import grid_graph
+
+from .forest import PackedForest
+from .graph_registry import RoadNetwork
+from .ingest import PROBE_DTYPE, BatchTooLarge, ProbeBuffer, parse_binary, parse_json_lines
+from .models import TrafficData, TrafficRollup
+from .planning import plan_routes
+from .rollup import histogram_percentiles
+from .route_cache import RouteCache, SQLiteRouteStore, route_cache, route_key
+from .routing import RoutingGraph
+from .snapping import SnapIndex, Snaps, attach_endpoints
+from .snapshot import GraphSnapshot
+
+
+class PackedForestTests(SimpleTestCase):
+    """The packed forest predicts what the sklearn forest it came from does."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = np.random.default_rng(0)
+        rows = 5000
+        cls.features = pd.DataFrame({
+            'road_id_encoded': rng.integers(0, 40000, rows),
+            'hour': rng.integers(0, 24, rows),
+            'day_of_week': rng.integers(0, 7, rows),
+        })
+        speeds = (
+            20 + cls.features['road_id_encoded'] % 40
+            - 10 * cls.features['hour'].isin([8, 9, 18, 19]) + rng.normal(0, 3, rows)
+        )
+        # Unbounded depth, as in traffic_model/train_model.py
+        cls.model = RandomForestRegressor(n_estimators=8, random_state=0).fit(cls.features, speeds)
+        cls.queries = pd.DataFrame({
+            'road_id_encoded': rng.integers(-10, 40010, 2000),
+            'hour': rng.integers(0, 24, 2000),
+            'day_of_week': rng.integers(0, 7, 2000),
+        })
+
+    def test_matches_sklearn(self):
+        forest = PackedForest.from_sklearn(self.model)
+        np.testing.assert_allclose(forest.predict(self.queries), self.model.predict(self.queries), rtol=1e-12)
+
+    def test_matches_sklearn_on_float_features(self):
+        rng = np.random.default_rng(1)
+        X = rng.normal(size=(2000, 4)).astype(np.float32)
+        model = RandomForestRegressor(n_estimators=5, random_state=0).fit(X, X[:, 0] * 3 + np.sin(X[:, 1]))
+        queries = rng.normal(size=(1000, 4)).astype(np.float32)
+        forest = PackedForest.from_sklearn(model)
+        np.testing.assert_allclose(forest.predict(queries), model.predict(queries), rtol=1e-12)
+
+    def test_quantized_keeps_splits(self):
+        forest = PackedForest.from_sklearn(self.model, quantize=True)
+        self.assertEqual(forest.threshold.dtype, np.int32)
+        self.assertEqual(forest.value.dtype, np.float16)
+        # Only float16 rounding of leaf values remains
+        np.testing.assert_allclose(forest.predict(self.queries), self.model.predict(self.queries), atol=0.05)
+
+    def test_quantized_uses_int16_when_thresholds_fit(self):
+        features = self.features.assign(road_id_encoded=self.features['road_id_encoded'] % 30000)
+        model = RandomForestRegressor(n_estimators=2, max_depth=8, random_state=0)
+        model.fit(features, features['hour'] * 2.0)
+        forest = PackedForest.from_sklearn(model, quantize=True)
+        self.assertEqual(forest.threshold.dtype, np.int16)
+        np.testing.assert_allclose(forest.predict(features), model.predict(features), atol=0.05)
+
+    def test_save_and_load_memory_mapped(self):
+        forest = PackedForest.from_sklearn(self.model, quantize=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            forest.save(f'{tmp}/forest')
+            loaded = PackedForest.load(f'{tmp}/forest')
+            self.assertIsInstance(loaded.children, np.memmap)
+            np.testing.assert_array_equal(loaded.predict(self.queries), forest.predict(self.queries))
+            del loaded
+
+    def test_rejects_wrong_feature_count(self):
+        forest = PackedForest.from_sklearn(self.model)
+        with self.assertRaises(ValueError):
+            forest.predict(np.zeros((3, 2)))
+
+
+class SnapSeedTests(SimpleTestCase):
+    """Snapped endpoints seed every way out of and into the point."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.G = grid_graph(12)
+        cls.snapshot = GraphSnapshot.from_graph(cls.G)
+        cls.index = SnapIndex(cls.snapshot)
+        cls.graph = RoutingGraph(cls.snapshot)
+        cls.weights = np.asarray(cls.snapshot.edge_length, dtype=np.float64)
+
+    def snap_nodes(self, nodes):
+        lats = [self.G.nodes[node]['y'] for node in nodes]
+        lons = [self.G.nodes[node]['x'] for node in nodes]
+        return self.index.snap(lats, lons)
+
+    def test_point_at_node_seeds_the_node(self):
+        nodes = list(self.G.nodes)
+        snaps = self.snap_nodes(nodes)
+        self.assertTrue(np.all((snaps.fraction < 1e-6) | (snaps.fraction > 1 - 1e-6)))
+        index = self.snapshot.node_index(nodes)
+        for i, node in enumerate(index):
+            for origin in (True, False):
+                endpoint = self.index.endpoint(snaps, i, self.weights, origin)
+                self.assertIn((int(node), 0.0), endpoint.seeds)
+
+    def test_one_way_edge_end_is_reached_from_other_edges(self):
+        one_way = [
+            (u, v) for u, v, data in self.G.edges(data=True)
+            if data['oneway'] and self.G.in_degree(v) > 1
+        ]
+        u, v = one_way[0]
+        # Half a metre short of v along the one-way edge
+        snaps = self.index.snap(
+            [self.G.nodes[v]['y'] + (self.G.nodes[u]['y'] - self.G.nodes[v]['y']) * 0.005],
+            [self.G.nodes[v]['x'] + (self.G.nodes[u]['x'] - self.G.nodes[v]['x']) * 0.005],
+        )
+        destination = self.index.endpoint(snaps, 0, self.weights, origin=False)
+        self.assertEqual(len(destination.seeds), 1)
+        snaps = self.snap_nodes([v])
+        destination = self.index.endpoint(snaps, 0, self.weights, origin=False)
+        self.assertIn((int(self.snapshot.node_index([v])[0]), 0.0), destination.seeds)
+
+    def test_routes_between_nodes_are_shortest(self):
+        rng = np.random.default_rng(1)
+        nodes = list(self.G.nodes)
+        pairs = [tuple(rng.choice(nodes, 2, replace=False)) for _ in range(40)]
+        snaps = self.snap_nodes([node for pair in pairs for node in pair])
+        lengths = dict(nx.all_pairs_dijkstra_path_length(self.G, weight='length'))
+        for k, (source, target) in enumerate(pairs):
+            origin = self.index.endpoint(snaps, 2 * k, self.weights, origin=True)
+            destination = self.index.endpoint(snaps, 2 * k + 1, self.weights, origin=False)
+            path = self.graph.shortest_path(origin.seeds, destination.seeds, self.graph.pair_weights(self.weights))
+            expected = lengths[source].get(target)
+            if expected is None:
+                self.assertIsNone(path)
+                continue
+            self.assertAlmostEqual(path.cost, expected, places=6)
+            route = attach_endpoints(path, origin, destination, self.snapshot)
+            travelled = self.weights[route.edges].sum()
+            travelled -= route.start_fraction * self.weights[route.edges[0]]
+            travelled -= (1 - route.end_fraction) * self.weights[route.edges[-1]]
+            self.assertAlmostEqual(travelled, expected, places=6)
+            np.testing.assert_array_equal(np.asarray(self.snapshot.edge_u)[route.edges[1:]],
+                                          np.asarray(self.snapshot.edge_v)[route.edges[:-1]])
+
+
+class RouteCacheTests(SimpleTestCase):
+    """Cached routes are only reused for requests they actually fit."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.G = grid_graph(12)
+        cls.network = RoadNetwork('test', 'drive', G=cls.G)
+        cls.bundle = SimpleNamespace(version='test')
+        cls.date_time = datetime(2024, 1, 8, 9)
+
+    def setUp(self):
+        route_cache.clear()
+        self.addCleanup(route_cache.clear)
+
+    def snap(self, points):
+        return self.network.snap_index.snap([lat for lat, lon in points], [lon for lat, lon in points])
+
+    def key(self, snaps):
+        return route_key(self.network, self.bundle, self.network.snap_index, snaps, 'drive', 'distance',
+                         self.date_time)
+
+    def node_point(self, node):
+        return self.G.nodes[node]['y'], self.G.nodes[node]['x']
+
+    def near_node(self, node, towards, metres):
+        (lat, lon), (to_lat, to_lon) = self.node_point(node), self.node_point(towards)
+        data = self.G.get_edge_data(node, towards) or self.G.get_edge_data(towards, node)
+        share = metres / data[0]['length']
+        return lat + (to_lat - lat) * share, lon + (to_lon - lon) * share
+
+    def test_node_and_nearby_point_get_different_keys(self):
+        node = 1 + 5 * 12 + 5
+        destination = self.node_point(1)
+        at_node = self.snap([self.node_point(node), destination])
+        # Five metres along the very edge the node snapped onto
+        index, edge = self.network.snap_index, int(at_node.edge[0])
+        share = 5.0 / index.edge_geom_len[edge]
+        fraction = at_node.fraction.copy()
+        fraction[0] = share if fraction[0] < 0.5 else 1 - share
+        nearby = Snaps(at_node.edge, fraction, at_node.distance_m, at_node.lat, at_node.lon)
+        self.assertNotEqual(self.key(at_node), self.key(nearby))
+        # Snapping onto the node through any of its edges gives the same key
+        snapshot = self.network.snapshot
+        leaving = np.flatnonzero(np.asarray(snapshot.edge_u) == snapshot.node_index([node])[0])
+        other = at_node.edge.copy()
+        other[0] = leaving[leaving != edge][0]
+        fraction[0] = 0.0
+        via_other = Snaps(other, fraction, at_node.distance_m, at_node.lat, at_node.lon)
+        self.assertEqual(self.key(at_node), self.key(via_other))
+
+    def test_cached_routes_that_miss_the_endpoints_are_searched_again(self):
+        node = 1 + 5 * 12 + 5
+        towards = next(iter(self.G.successors(node)))
+        snaps = self.snap([self.near_node(node, towards, 5.0), self.node_point(12 * 12)])
+        found, _, _ = plan_routes(self.network, self.bundle, snaps, 'drive', 'distance', self.date_time)
+        self.assertTrue(found)
+        # Poison the entry with a route that starts elsewhere
+        snapshot = self.network.snapshot
+        elsewhere = int(np.flatnonzero(np.asarray(snapshot.edge_u) == 0)[0])
+        route_cache.put(self.key(snaps), [np.array([elsewhere])])
+        cached, _, _ = plan_routes(self.network, self.bundle, snaps, 'drive', 'distance', self.date_time)
+        self.assertEqual([path.edges.tolist() for path in cached], [path.edges.tolist() for path in found])
+
+    def test_entries_expire_and_are_evicted(self):
+        cache = RouteCache(max_entries=2, ttl=60)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, [[1, 2, 3]])
+        self.assertIsNone(cache.get('a'))
+        np.testing.assert_array_equal(cache.get('c')[0], [1, 2, 3])
+        cache = RouteCache(max_entries=2, ttl=-1)
+        cache.put('a', [[1]])
+        self.assertIsNone(cache.get('a'))
+
+    def test_shared_store_serves_other_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'routes.sqlite3'
+            RouteCache(ttl=60, store=SQLiteRouteStore(path)).put(('key', 1), [[4, 5], [6]])
+            routes = RouteCache(ttl=60, store=SQLiteRouteStore(path)).get(('key', 1))
+        self.assertEqual([edges.tolist() for edges in routes], [[4, 5], [6]])
+
+
+class ProbeParsingTests(SimpleTestCase):
+    """Both probe body formats parse to the same columns."""
+
+    def test_binary_records(self):
+        records = np.array([(1.7e9, 22.7, 75.8, 31.5), (1.7e9 + 1, 22.8, 75.9, 0.0)], dtype=PROBE_DTYPE)
+        frame = parse_binary(records.tobytes())
+        self.assertEqual(list(frame.columns), list(PROBE_DTYPE.names))
+        np.testing.assert_allclose(frame['speed_kmh'], [31.5, 0.0])
+        np.testing.assert_allclose(frame['timestamp'], [1.7e9, 1.7e9 + 1])
+        with self.assertRaises(ValueError):
+            parse_binary(records.tobytes()[:-1])
+
+    def test_json_lines(self):
+        rows = [
+            {'latitude': 22.7, 'longitude': 75.8, 'speed_kmh': 30, 'timestamp': 1700000000},
+            {'latitude': '22.8', 'longitude': 75.9, 'speed_kmh': 12.5, 'timestamp': '2023-11-14T22:13:20Z'},
+            {'latitude': 22.9, 'speed_kmh': 'fast', 'timestamp': 'yesterday'},
+        ]
+        frame = parse_json_lines(b'\n'.join(json.dumps(row).encode() for row in rows) + b'\n\n')
+        np.testing.assert_allclose(frame['timestamp'][:2], [1700000000, 1700000000])
+        np.testing.assert_allclose(frame['latitude'], [22.7, 22.8, 22.9])
+        self.assertTrue(frame.loc[2, ['longitude', 'speed_kmh', 'timestamp']].isna().all())
+        self.assertEqual(len(parse_json_lines(b'')), 0)
+        with self.assertRaises(ValueError):
+            parse_json_lines(b'[1, 2]')
+
+    def test_batch_larger_than_buffer(self):
+        frame = parse_binary(np.zeros(3, dtype=PROBE_DTYPE).tobytes())
+        with self.assertRaises(BatchTooLarge):
+            ProbeBuffer(max_rows=2).add(frame)
+
+
+class RollupTests(TestCase):
+    """The hourly rollup merges new TrafficData into existing rows."""
+
+    def add(self, speed_kmh, sample_count):
+        # 2025-05-05 was a Monday
+        TrafficData.objects.create(
+            road_id=7, latitude_start=22.7, longitude_start=75.8, latitude_end=22.71, longitude_end=75.81,
+            date=date(2025, 5, 5), time=time(8), speed_kmh=speed_kmh, congestion_level='green',
+            sample_count=sample_count,
+        )
+
+    def test_histogram_percentiles(self):
+        histograms = np.zeros((2, 32), dtype=np.int64)
+        histograms[0, :2] = 10
+        np.testing.assert_allclose(histogram_percentiles(histograms, 50), [4.0, 0.0])
+        np.testing.assert_allclose(histogram_percentiles(histograms, 90), [7.2, 0.0])
+
+    def test_rows_are_merged_by_road_and_hour(self):
+        self.add(10, 3)
+        self.add(30, 1)
+        call_command('rollup_traffic', stdout=StringIO())
+        row = TrafficRollup.objects.get(road_id=7, day_of_week=0, hour=8)
+        self.assertEqual(row.sample_count, 4)
+        self.assertAlmostEqual(row.mean_speed_kmh, 15.0)
+        self.assertAlmostEqual(row.p50_speed_kmh, 32 / 3)
+
+        self.add(50, 4)
+        call_command('rollup_traffic', stdout=StringIO())
+        row = TrafficRollup.objects.get(road_id=7, day_of_week=0, hour=8)
+        self.assertEqual(row.sample_count, 8)
+        self.assertAlmostEqual(row.mean_speed_kmh, 32.5)
+        self.assertAlmostEqual(row.p50_speed_kmh, 32.0)
+        self.assertEqual(np.frombuffer(bytes(row.histogram), dtype=np.uint32).sum(), 8)
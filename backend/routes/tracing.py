@@ -0,0 +1,161 @@
+import contextvars
+import cProfile
+import heapq
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+from django.conf import settings
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe('route_stage_seconds', 'histogram', 'Route request time per stage')
+metrics.describe('route_profiles_total', 'counter', 'Route request profiles by outcome')
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROFILE_HEADER = 'X-Route-Profile'
+
+_current = contextvars.ContextVar('route_trace', default=None)
+# cProfile can only run one profile at a time on newer Pythons
+_profile_lock = threading.Lock()
+
+
+def span(name):
+    """Time a stage of the route request being traced in this thread, if any."""
+    trace = _current.get()
+    return trace.span(name) if trace is not None else nullcontext()
+
+
+class Trace:
+    """Wall time spent in each stage of one route request.
+
+    Stages repeated within a request add up. ``finish`` records the stages
+    and the total in the ``route_stage_seconds`` histogram.
+    """
+
+    def __init__(self, profile=False):
+        self.stages = {}
+        self.profile = profile
+        self.elapsed = None
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    @contextmanager
+    def activate(self):
+        """Make this the current trace, profiling the block when requested.
+
+        Profiles run in the calling thread, so this wraps the blocking part
+        of a request wherever it runs.
+        """
+        token = _current.set(self)
+        profiler = None
+        if self.profile and _profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            profiler.enable()
+        elif self.profile:
+            metrics.inc('route_profiles_total', outcome='busy')
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+            if profiler is not None:
+                profiler.disable()
+                _profile_lock.release()
+                slow_profiles.offer(profiler, time.perf_counter() - start)
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self._start
+        for name, seconds in self.stages.items():
+            metrics.observe('route_stage_seconds', seconds, STAGE_BUCKETS, stage=name)
+        metrics.observe('route_stage_seconds', self.elapsed, STAGE_BUCKETS, stage='total')
+        return self
+
+    def server_timing(self):
+        """``Server-Timing`` header value with every stage and the total, in ms."""
+        entries = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.stages.items()]
+        if self.elapsed is not None:
+            entries.append(f'total;dur={self.elapsed * 1000:.2f}')
+        return ', '.join(entries)
+
+
+def start_trace(request):
+    """Trace for a route request, profiled if sampled or asked for by header.
+
+    The ``X-Route-Profile`` header is honoured only with
+    ROUTE_PROFILE_ALLOW_HEADER, as profiling slows the request down.
+    """
+    profile = random.random() < getattr(settings, 'ROUTE_PROFILE_SAMPLE_RATE', 0.0)
+    if not profile and getattr(settings, 'ROUTE_PROFILE_ALLOW_HEADER', False):
+        profile = request.headers.get(PROFILE_HEADER, '') not in ('', '0')
+    return Trace(profile=profile)
+
+
+def add_server_timing(response, trace):
+    if getattr(settings, 'ROUTE_SERVER_TIMING', False):
+        response['Server-Timing'] = trace.server_timing()
+    return response
+
+
+class SlowProfiles:
+    """Keeps the pstats dumps of the slowest profiled requests.
+
+    Dumps go to ROUTE_PROFILE_DIR as ``route-<ms>ms-<time>.pstats``, e.g.
+    for ``python -m pstats``. Once ROUTE_PROFILE_KEEP dumps exist, a new
+    profile is written only if it is slower than the fastest one kept,
+    which is then deleted.
+    """
+
+    def __init__(self):
+        self._kept = []
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self):
+        return Path(getattr(settings, 'ROUTE_PROFILE_DIR', settings.BASE_DIR / 'route_profiles'))
+
+    @property
+    def keep(self):
+        return getattr(settings, 'ROUTE_PROFILE_KEEP', 10)
+
+    def kept(self):
+        """``(seconds, path)`` of the dumps kept, slowest first."""
+        with self._lock:
+            return sorted(self._kept, reverse=True)
+
+    def offer(self, profiler, seconds):
+        with self._lock:
+            if self.keep <= 0 or (len(self._kept) >= self.keep and seconds <= self._kept[0][0]):
+                metrics.inc('route_profiles_total', outcome='discarded')
+                return None
+            directory = self.directory
+            path = directory / f'route-{seconds * 1000:.0f}ms-{time.time():.6f}.pstats'
+            try:
+                directory.mkdir(parents=True, exist_ok=True)
+                profiler.dump_stats(path)
+            except OSError:
+                logger.exception('Failed to write route profile to %s', path)
+                metrics.inc('route_profiles_total', outcome='failure')
+                return None
+            heapq.heappush(self._kept, (seconds, str(path)))
+            while len(self._kept) > self.keep:
+                _, evicted = heapq.heappop(self._kept)
+                Path(evicted).unlink(missing_ok=True)
+        metrics.inc('route_profiles_total', outcome='kept')
+        logger.info('Profiled a route request taking %.1f ms: %s', seconds * 1000, path)
+        return path
+
+
+slow_profiles = SlowProfiles()
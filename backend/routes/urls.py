@@ -1,6 +1,16 @@
 from django.urls import path
-from .views import RouteView
+from .views import (
+    AsyncRouteView, BatchRouteView, CongestionView, IsochroneView, MatrixView, MetricsView, ProbeIngestView,
+    RouteView,
+)
 
 urlpatterns = [
     path('routes/', RouteView.as_view(), name='routes'),
+    path('routes/async/', AsyncRouteView.as_view(), name='routes-async'),
+    path('routes/batch/', BatchRouteView.as_view(), name='routes-batch'),
+    path('routes/matrix/', MatrixView.as_view(), name='routes-matrix'),
+    path('routes/isochrone/', IsochroneView.as_view(), name='routes-isochrone'),
+    path('congestion/', CongestionView.as_view(), name='congestion'),
+    path('probes/', ProbeIngestView.as_view(), name='probes'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
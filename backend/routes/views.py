@@ -1,159 +1,529 @@
+import asyncio
+import json
+from datetime import datetime
+from functools import partial
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
-import osmnx as ox
-import pandas as pd
-import pickle
-from datetime import datetime
-import networkx as nx
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from .ingest import BatchTooLarge, BufferFull, parse_binary, parse_json_lines, probe_buffer, validate
+from .isochrone import isochrone_cache, isochrone_key, isochrones
+from .matrix import cost_matrix
+from .metrics import metrics
+from .offload import PoolFull, route_pool
+from .planning import NETWORK_TYPES, name_routes, parse_route_request, plan_routes, rank_routes
+from .regions import RegionError, region_registry
+from .rollup import congestion_cache
+from .scoring import score_path_batch, score_paths
+from .tracing import add_server_timing, span, start_trace
+from .weights import weight_cache
+
+def route_request(data, cancel=None, trace=None):
+    """Routes for one request as ``(payload, status)``.
+
+    Shared by the synchronous and the async route views. Raises
+    ``RouteCancelled`` when the optional ``cancel`` event gets set. Stages
+    are timed into the optional ``trace``.
+    """
+    if trace is None:
+        return _route_request(data, cancel)
+    with trace.activate():
+        return _route_request(data, cancel)
+
+
+def _route_request(data, cancel):
+    try:
+        with span('parse'):
+            source, dest, date_time, travel_mode, optimize = parse_route_request(data)
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+        return {"error": "Invalid input data"}, 400
+
+    network_type = NETWORK_TYPES.get(travel_mode, 'drive')
+    try:
+        region = region_registry.locate([source[0], dest[0]], [source[1], dest[1]])
+    except RegionError as e:
+        return {"error": str(e)}, 400
+
+    try:
+        with span('graph'):
+            network = region.network(network_type)
+    except Exception as e:
+        return {"error": f"Failed to load map data: {str(e)}"}, 500
+
+    try:
+        with span('model'):
+            bundle = region.bundle()
+    except FileNotFoundError:
+        return {"error": "Model files not found"}, 500
+
+    # Snap both endpoints onto the nearest edges in one batched query
+    max_snap_distance = getattr(settings, 'SNAP_MAX_DISTANCE_M', 1000)
+    try:
+        with span('snap'):
+            snaps = network.snap_index.snap([source[0], dest[0]], [source[1], dest[1]], max_distance=max_snap_distance)
+    except Exception as e:
+        return {"error": f"Invalid coordinates: {str(e)}"}, 400
+    if (snaps.edge < 0).any():
+        return {"error": f"Invalid coordinates: more than {max_snap_distance} m from the road network"}, 400
+
+    found, origin, destination = plan_routes(network, bundle, snaps, travel_mode, optimize, date_time, cancel=cancel)
+    if not found:
+        return {"error": "No route found"}, 404
+
+    # Score all candidate routes in one batch
+    with span('score'):
+        route_results = score_paths(
+            network.edge_table, name_routes(found, optimize), bundle, date_time, travel_mode,
+            start_point=(origin.lon, origin.lat), end_point=(destination.lon, destination.lat),
+        )
+        return rank_routes(route_results), 200
+
 
 class RouteView(APIView):
     def post(self, request):
+        self.trace = start_trace(request)
+        with self.trace.span('parse'):
+            data = request.data
+        payload, status = route_request(data, trace=self.trace)
+        return Response(payload, status=status)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        trace = getattr(self, 'trace', None)
+        if trace is None:
+            return response
+        # Render here rather than on the way out so serialization is timed
+        with trace.span('serialize'):
+            response.render()
+        return add_server_timing(response, trace.finish())
+
+
+class AsyncRouteView(View):
+    """``RouteView`` for ASGI servers.
+
+    The route search runs on a bounded thread pool so the event loop keeps
+    serving other requests. Requests get 503 when ROUTE_ASYNC_MAX_PENDING
+    searches are already queued or running and 504 after
+    ROUTE_ASYNC_TIMEOUT seconds. When the client disconnects, the search
+    stops before its next alternative.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token-less API like the DRF views
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def post(self, request):
+        trace = start_trace(request)
         try:
-            source = tuple(map(float, request.data['source'].split(',')))
-            dest = tuple(map(float, request.data['destination'].split(',')))
-            date_time = datetime.fromisoformat(request.data['date_time'].replace('Z', '+05:30'))
+            with trace.span('parse'):
+                data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({"error": "Invalid input data"}, status=400)
+        timeout = getattr(settings, 'ROUTE_ASYNC_TIMEOUT', 30)
+        try:
+            payload, status = await route_pool.run(partial(route_request, trace=trace), data, timeout=timeout)
+        except PoolFull:
+            response = JsonResponse({"error": "Server busy, try again later"}, status=503)
+            response['Retry-After'] = '1'
+            return response
+        except asyncio.TimeoutError:
+            return JsonResponse({"error": f"Route search timed out after {timeout} s"}, status=504)
+        with trace.span('serialize'):
+            response = JsonResponse(payload, status=status, safe=False)
+        return add_server_timing(response, trace.finish())
+
+
+class BatchRouteView(APIView):
+    """Routes for many origin-destination pairs in one request.
+
+    Accepts ``{"trips": [...]}`` where each trip has the fields of a
+    ``RouteView`` request plus an optional ``id``; top-level ``travel_mode``
+    and ``optimize`` act as defaults. Responds with newline-delimited JSON,
+    one line per trip as soon as its chunk is done, holding the trip's
+    ``index`` and ``id`` and either its ``routes`` or an ``error`` and
+    ``status``. Lines are grouped by region and network type, not in input
+    order.
+    """
+
+    def post(self, request):
+        data = request.data if isinstance(request.data, dict) else {}
+        trips = data.get('trips')
+        if not isinstance(trips, list) or not trips:
+            return Response({"error": "Invalid input data"}, status=400)
+        max_trips = getattr(settings, 'BATCH_ROUTE_MAX_TRIPS', 1000)
+        if len(trips) > max_trips:
+            return Response({"error": f"At most {max_trips} trips per request"}, status=400)
+
+        errors = []
+        by_network = {}
+        for index, trip in enumerate(trips):
+            trip_id = trip.get('id') if isinstance(trip, dict) else None
+            try:
+                parsed = parse_route_request(trip, data.get('travel_mode', 'drive'), data.get('optimize'))
+            except (KeyError, ValueError, AttributeError, TypeError):
+                errors.append(self._error(index, trip_id, "Invalid input data", 400))
+                continue
+            source, dest = parsed[0], parsed[1]
+            try:
+                region = region_registry.locate([source[0], dest[0]], [source[1], dest[1]])
+            except RegionError as e:
+                errors.append(self._error(index, trip_id, str(e), 400))
+                continue
+            network_type = NETWORK_TYPES.get(parsed[3], 'drive')
+            by_network.setdefault((region, network_type), []).append((index, trip_id) + parsed)
+
+        def lines():
+            yield from errors
+            for (region, network_type), network_trips in by_network.items():
+                yield from self._route_trips(region, network_type, network_trips)
+
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+    @staticmethod
+    def _line(payload):
+        return json.dumps(payload) + '\n'
+
+    @classmethod
+    def _error(cls, index, trip_id, error, status):
+        return cls._line({'index': index, 'id': trip_id, 'error': error, 'status': status})
+
+    def _route_trips(self, region, network_type, trips):
+        try:
+            bundle = region.bundle()
+        except FileNotFoundError:
+            for index, trip_id, *_ in trips:
+                yield self._error(index, trip_id, "Model files not found", 500)
+            return
+        try:
+            network = region.network(network_type)
+        except Exception as e:
+            for index, trip_id, *_ in trips:
+                yield self._error(index, trip_id, f"Failed to load map data: {str(e)}", 500)
+            return
+
+        # Snap every endpoint of every trip in one query
+        max_snap_distance = getattr(settings, 'SNAP_MAX_DISTANCE_M', 1000)
+        lats = [coord[0] for trip in trips for coord in (trip[2], trip[3])]
+        lons = [coord[1] for trip in trips for coord in (trip[2], trip[3])]
+        try:
+            snaps = network.snap_index.snap(lats, lons, max_distance=max_snap_distance)
+        except Exception as e:
+            for index, trip_id, *_ in trips:
+                yield self._error(index, trip_id, f"Invalid coordinates: {str(e)}", 400)
+            return
+
+        routable = []
+        for i, trip in enumerate(trips):
+            if (snaps.edge[2 * i:2 * i + 2] < 0).any():
+                yield self._error(
+                    trip[0], trip[1],
+                    f"Invalid coordinates: more than {max_snap_distance} m from the road network", 400,
+                )
+            else:
+                routable.append((trip, snaps.take([2 * i, 2 * i + 1])))
+
+        def plan(item):
+            (_, _, _, _, date_time, travel_mode, optimize), trip_snaps = item
+            return plan_routes(network, bundle, trip_snaps, travel_mode, optimize, date_time)
+
+        # Searches run one after another: they hold the GIL, so threads would
+        # not overlap them, and trips at the same hour share cached weights
+        chunk_size = getattr(settings, 'BATCH_ROUTE_CHUNK_SIZE', 64)
+        for offset in range(0, len(routable), chunk_size):
+            chunk = routable[offset:offset + chunk_size]
+            planned = [plan(item) for item in chunk]
+            yield from self._score_chunk(network, bundle, chunk, planned)
+
+    def _score_chunk(self, network, bundle, chunk, planned):
+        # One speed prediction for all routes of all trips in the chunk
+        routes, hours, days, modes, starts, ends, owners = [], [], [], [], [], [], []
+        for i, (((_, _, _, _, date_time, travel_mode, optimize), _), (found, origin, destination)) in \
+                enumerate(zip(chunk, planned)):
+            for route in name_routes(found, optimize):
+                routes.append(route)
+                hours.append(date_time.hour)
+                days.append(date_time.weekday())
+                modes.append(travel_mode)
+                starts.append((origin.lon, origin.lat))
+                ends.append((destination.lon, destination.lat))
+                owners.append(i)
+        scored = score_path_batch(network.edge_table, routes, bundle, hours, days, modes, starts, ends) if routes else []
+        by_trip = [[] for _ in chunk]
+        for owner, result in zip(owners, scored):
+            by_trip[owner].append(result)
+
+        for ((index, trip_id, *_), _), route_results in zip(chunk, by_trip):
+            if not route_results:
+                yield self._error(index, trip_id, "No route found", 404)
+            else:
+                yield self._line({'index': index, 'id': trip_id, 'routes': rank_routes(route_results)})
+
+
+class MatrixView(APIView):
+    """Travel costs between every source and every destination.
+
+    Accepts ``sources`` and ``destinations`` as lists of ``"lat,lon"``
+    strings, ``date_time``, ``travel_mode``, ``metric`` (``"time"`` in
+    seconds, the default, or ``"distance"`` in metres) and ``format``
+    (``"json"``, the default, or ``"binary"`` for row-major little-endian
+    float32 with the shape in the ``X-Matrix-Shape`` header). Unreachable
+    pairs are null in JSON and inf in binary.
+    """
+
+    def post(self, request):
+        try:
+            sources = [tuple(map(float, point.split(','))) for point in request.data['sources']]
+            destinations = [tuple(map(float, point.split(','))) for point in request.data['destinations']]
+            if any(len(p) != 2 for p in sources + destinations):
+                raise ValueError('coordinates')
             travel_mode = request.data.get('travel_mode', 'drive')
-        except (KeyError, ValueError) as e:
+            metric = request.data.get('metric', 'time')
+            output = request.data.get('format', 'json')
+            if metric not in ('time', 'distance') or output not in ('json', 'binary'):
+                raise ValueError(metric)
+            date_time = None
+            if metric == 'time':
+                date_time = datetime.fromisoformat(request.data['date_time'].replace('Z', '+05:30'))
+        except (KeyError, ValueError, TypeError, AttributeError):
             return Response({"error": "Invalid input data"}, status=400)
+        max_cells = getattr(settings, 'MATRIX_MAX_CELLS', 250000)
+        if len(sources) * len(destinations) > max_cells:
+            return Response({"error": f"At most {max_cells} source-destination pairs per request"}, status=400)
 
-        # Map travel mode to osmnx network type
-        network_types = {'drive': 'drive', 'bike': 'bike', 'walk': 'walk'}
-        network_type = network_types.get(travel_mode, 'drive')
-        ox.settings.use_cache = True
+        points = sources + destinations
+        try:
+            region = region_registry.locate([p[0] for p in points], [p[1] for p in points])
+        except RegionError as e:
+            return Response({"error": str(e)}, status=400)
 
+        network_type = NETWORK_TYPES.get(travel_mode, 'drive')
         try:
-            G = ox.graph_from_place('Indore, India', network_type=network_type)
-            edges = ox.graph_to_gdfs(G, nodes=False, edges=True)
-            # Convert multigraph to simple graph for path finding
-            G_simple = nx.Graph(G)
+            network = region.network(network_type)
         except Exception as e:
             return Response({"error": f"Failed to load map data: {str(e)}"}, status=500)
 
+        snapshot = network.snapshot
+        edge_weights = snapshot.edge_length
+        if metric == 'time':
+            try:
+                bundle = region.bundle()
+            except FileNotFoundError:
+                return Response({"error": "Model files not found"}, status=500)
+            edge_weights = weight_cache.get(network, bundle, date_time.hour, date_time.weekday(), travel_mode).seconds
+
+        # Snap all points in one query
+        max_snap_distance = getattr(settings, 'SNAP_MAX_DISTANCE_M', 1000)
+        try:
+            snaps = network.snap_index.snap(
+                [p[0] for p in points], [p[1] for p in points], max_distance=max_snap_distance,
+            )
+        except Exception as e:
+            return Response({"error": f"Invalid coordinates: {str(e)}"}, status=400)
+        if (snaps.edge < 0).any():
+            far = np.flatnonzero(snaps.edge < 0)
+            return Response({
+                "error": f"Invalid coordinates: more than {max_snap_distance} m from the road network",
+                "sources": far[far < len(sources)].tolist(),
+                "destinations": (far[far >= len(sources)] - len(sources)).tolist(),
+            }, status=400)
+        snap_index = network.snap_index
+        origins = [snap_index.endpoint(snaps, i, edge_weights, origin=True) for i in range(len(sources))]
+        targets = [
+            snap_index.endpoint(snaps, len(sources) + j, edge_weights, origin=False)
+            for j in range(len(destinations))
+        ]
+
+        costs = cost_matrix(
+            network.routing_graph, origins, targets, edge_weights,
+            chunk_rows=getattr(settings, 'MATRIX_CHUNK_ROWS', 64),
+        )
+
+        unit = 's' if metric == 'time' else 'm'
+        if output == 'binary':
+            response = HttpResponse(costs.astype('<f4').tobytes(), content_type='application/octet-stream')
+            response['X-Matrix-Shape'] = f'{costs.shape[0]},{costs.shape[1]}'
+            response['X-Matrix-Unit'] = unit
+            return response
+        values = [[None if v == np.inf else v for v in row] for row in np.round(costs, 1).tolist()]
+        return Response({'metric': metric, 'unit': unit, 'values': values})
+
+
+class IsochroneView(APIView):
+    """Areas reachable from a point within several travel-time budgets.
+
+    Accepts ``location`` as ``"lat,lon"``, ``date_time``, ``travel_mode``,
+    ``budgets`` (a list of minutes, defaulting to ISOCHRONE_BUDGETS) and
+    ``edges`` (false to leave out the reachable edges). Travel times come from the
+    speed model for the request's hour and day. Responds with a contour
+    polygon per budget and the edges entered within the largest one.
+    """
+
+    def post(self, request):
+        try:
+            location = tuple(map(float, request.data['location'].split(',')))
+            if len(location) != 2:
+                raise ValueError('coordinates')
+            date_time = datetime.fromisoformat(request.data['date_time'].replace('Z', '+05:30'))
+            travel_mode = request.data.get('travel_mode', 'drive')
+            budgets = request.data.get('budgets', list(getattr(settings, 'ISOCHRONE_BUDGETS', [5, 10, 15])))
+            if not isinstance(budgets, list):
+                raise TypeError('budgets')
+            budgets = sorted({float(minutes) for minutes in budgets})
+            include_edges = request.data.get('edges', True)
+            if isinstance(include_edges, str):
+                include_edges = {'true': True, 'false': False}[include_edges.lower()]
+            if not isinstance(include_edges, bool):
+                raise TypeError('edges')
+        except (KeyError, ValueError, TypeError, AttributeError):
+            return Response({"error": "Invalid input data"}, status=400)
+        max_minutes = getattr(settings, 'ISOCHRONE_MAX_MINUTES', 60)
+        max_budgets = getattr(settings, 'ISOCHRONE_MAX_BUDGETS', 6)
+        if not budgets or len(budgets) > max_budgets or not all(0 < m <= max_minutes for m in budgets):
+            return Response(
+                {"error": f"Between 1 and {max_budgets} budgets of at most {max_minutes} minutes"}, status=400,
+            )
+
+        try:
+            region = region_registry.locate([location[0]], [location[1]])
+        except RegionError as e:
+            return Response({"error": str(e)}, status=400)
+
+        network_type = NETWORK_TYPES.get(travel_mode, 'drive')
         try:
-            with open('traffic_model/traffic_model.pkl', 'rb') as f:
-                model = pickle.load(f)
-            with open('traffic_model/road_id_encoder.pkl', 'rb') as f:
-                le = pickle.load(f)
+            network = region.network(network_type)
+            bundle = region.bundle()
         except FileNotFoundError:
             return Response({"error": "Model files not found"}, status=500)
+        except Exception as e:
+            return Response({"error": f"Failed to load map data: {str(e)}"}, status=500)
 
+        max_snap_distance = getattr(settings, 'SNAP_MAX_DISTANCE_M', 1000)
+        snap_index = network.snap_index
         try:
-            origin = ox.nearest_nodes(G, source[1], source[0])
-            destination = ox.nearest_nodes(G, dest[1], dest[0])
+            snaps = snap_index.snap([location[0]], [location[1]], max_distance=max_snap_distance)
         except Exception as e:
             return Response({"error": f"Invalid coordinates: {str(e)}"}, status=400)
+        if snaps.edge[0] < 0:
+            return Response(
+                {"error": f"Invalid coordinates: more than {max_snap_distance} m from the road network"}, status=400,
+            )
+
+        key = isochrone_key(network, bundle, snap_index, snaps, travel_mode, date_time, budgets)
+        payload = isochrone_cache.get(key)
+        if payload is None:
+            edge_weights = weight_cache.get(network, bundle, date_time.hour, date_time.weekday(), travel_mode).seconds
+            origin = snap_index.endpoint(snaps, 0, edge_weights, origin=True)
+            payload = isochrones(
+                network, origin, edge_weights, [m * 60 for m in budgets],
+                max_nodes=getattr(settings, 'ISOCHRONE_MAX_NODES', 50000),
+            )
+            isochrone_cache.put(key, payload)
+        if not include_edges:
+            payload = {name: value for name, value in payload.items() if name != 'edges'}
+        return Response(payload)
+
+
+class ProbeIngestView(APIView):
+    """Accepts batches of GPS probe points for RawGPSData.
+
+    The body is JSON lines (objects with latitude, longitude, speed_kmh and
+    timestamp as epoch seconds or ISO 8601) or, with Content-Type
+    application/octet-stream, packed ``ingest.PROBE_DTYPE`` records.
+    Implausible points are dropped and counted; the rest are buffered and
+    written in bulk, so a 202 response means accepted, not yet stored.
+    A batch larger than the whole buffer gets 413, while a buffer that is
+    only full for now gets 503 with Retry-After.
+    """
+
+    def post(self, request):
+        # Batches may exceed DATA_UPLOAD_MAX_MEMORY_SIZE, so the body is read
+        # directly under a limit of its own
+        max_bytes = getattr(settings, 'GPS_MAX_BODY_BYTES', 16 * 2 ** 20)
+        body = request.read(max_bytes + 1)
+        if len(body) > max_bytes:
+            return Response({"error": f"Request body larger than {max_bytes} bytes"}, status=413)
+        try:
+            if request.content_type == 'application/octet-stream':
+                frame = parse_binary(body)
+            else:
+                frame = parse_json_lines(body)
+        except ValueError as e:
+            return Response({"error": f"Invalid input data: {str(e)}"}, status=400)
+        valid = validate(frame)
+        rejected = len(frame) - len(valid)
+        metrics.inc('gps_points_total', rejected, outcome='rejected')
+        try:
+            probe_buffer.add(valid)
+        except BatchTooLarge as e:
+            metrics.inc('gps_points_total', len(valid), outcome='refused')
+            return Response({"error": f"{e}, send smaller batches", 'rejected': rejected}, status=413)
+        except BufferFull:
+            metrics.inc('gps_points_total', len(valid), outcome='refused')
+            return Response({"error": "Ingestion buffer full, try again later", 'rejected': rejected}, status=503,
+                            headers={'Retry-After': '1'})
+        metrics.inc('gps_points_total', len(valid), outcome='accepted')
+        return Response({'accepted': len(valid), 'rejected': rejected}, status=202)
+
+
+class CongestionView(APIView):
+    """Region-wide congestion for one hour of the week from the traffic rollup.
+
+    Query parameters: ``date_time`` (ISO 8601, ``Z`` meaning local time as
+    in route requests; defaults to now in GPS_MATCH_TIMEZONE), ``bbox`` as
+    ``"min_lat,min_lon,max_lat,max_lon"`` and ``region``, defaulting to the
+    region around the bbox's centre or else the first configured one.
+    Responds with per-edge arrays of every drivable edge with samples for
+    that day of week and hour; ``congestion`` holds indices into ``levels``.
+    """
+
+    def get(self, request):
+        try:
+            if 'date_time' in request.query_params:
+                date_time = datetime.fromisoformat(request.query_params['date_time'].replace('Z', '+05:30'))
+            else:
+                date_time = timezone.localtime(
+                    timezone=ZoneInfo(getattr(settings, 'GPS_MATCH_TIMEZONE', 'Asia/Kolkata')),
+                )
+            bbox = None
+            if 'bbox' in request.query_params:
+                bbox = tuple(map(float, request.query_params['bbox'].split(',')))
+                if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+                    raise ValueError(bbox)
+        except ValueError:
+            return Response({"error": "Invalid input data"}, status=400)
+
+        try:
+            if 'region' in request.query_params:
+                region = region_registry.get(request.query_params['region'])
+            elif bbox is not None:
+                region = region_registry.locate([(bbox[0] + bbox[2]) / 2], [(bbox[1] + bbox[3]) / 2])
+            else:
+                region = region_registry.default
+        except KeyError:
+            return Response({"error": "Unknown region"}, status=400)
+        except RegionError as e:
+            return Response({"error": str(e)}, status=400)
+
+        try:
+            network = region.network('drive')
+        except Exception as e:
+            return Response({"error": f"Failed to load map data: {str(e)}"}, status=500)
+
+        snapshot = congestion_cache.get(network, date_time.weekday(), date_time.hour)
+        payload = snapshot.payload(snapshot.within(*bbox) if bbox is not None else None)
+        payload.update(region=region.name, day_of_week=date_time.weekday(), hour=date_time.hour)
+        return Response(payload)
+
 
-        # Generate multiple routes
-        routes = []
-        try:
-            # Shortest path by distance using original multigraph
-            route_shortest = ox.shortest_path(G, origin, destination, weight='length')
-            if route_shortest:
-                routes.append(('Shortest Distance', route_shortest))
-
-            # Alternative paths using k-shortest paths on simple graph
-            def get_k_shortest_paths(G, source, target, k):
-                paths = []
-                try:
-                    for path in nx.shortest_simple_paths(G, source, target, weight='length'):
-                        if len(paths) >= k:
-                            break
-                        if path not in paths:
-                            paths.append(path)
-                except nx.NetworkXNoPath:
-                    pass
-                return paths
-
-            alternative_paths = get_k_shortest_paths(G_simple, origin, destination, k=3)
-            for i, path in enumerate(alternative_paths):
-                if path not in [p for _, p in routes]:
-                    routes.append((f'Alternative Route {i+1}', path))
-
-        except nx.NetworkXNoPath:
-            return Response({"error": "No route found"}, status=404)
-
-        if not routes:
-            return Response({"error": "No routes found"}, status=404)
-
-        # Adjust speed based on travel mode
-        speed_multipliers = {'drive': 1.0, 'bike': 0.5, 'walk': 0.1}
-        speed_multiplier = speed_multipliers.get(travel_mode, 1.0)
-
-        # Process routes
-        route_results = []
-        for route_name, route in routes[:3]:  # Limit to 3 routes
-            total_distance = 0
-            total_time = 0
-            segments = []
-            for u, v in zip(route[:-1], route[1:]):
-                # Find edge in original multigraph
-                edge_data = None
-                if G.has_edge(u, v):
-                    edge_data = G.get_edge_data(u, v, 0)  # Default to first edge
-                if not edge_data:
-                    continue
-                osm_id = edge_data.get('osmid', 0)
-                if isinstance(osm_id, list):
-                    osm_id = osm_id[0]
-
-                # Encode road_id with fallback
-                try:
-                    road_id_encoded = le.transform([osm_id])[0] if osm_id in le.classes_ else le.transform([le.classes_[0]])[0]
-                except ValueError:
-                    road_id_encoded = le.transform([le.classes_[0]])[0]
-
-                # Prepare features for prediction
-                features = pd.DataFrame({
-                    'road_id_encoded': [road_id_encoded],
-                    'hour': [date_time.hour],
-                    'day_of_week': [date_time.weekday()]
-                })
-
-                # Predict speed and apply travel mode adjustment
-                speed = max(model.predict(features)[0] * speed_multiplier, 5)
-                # Dynamic congestion thresholds based on road type
-                try:
-                    road_type = edge_data.get('highway', 'road')
-                    max_speed = {'motorway': 80, 'primary': 60, 'secondary': 50, 'residential': 30}.get(road_type, 50)
-                    congestion = 'red' if speed < max_speed * 0.4 else 'yellow' if speed < max_speed * 0.7 else 'green'
-                except:
-                    congestion = 'yellow'
-
-                # Get edge geometry and length
-                try:
-                    edge = edges.loc[(u, v, 0)]
-                    coords = edge['geometry'].coords
-                    length_m = edge.get('length', 0)
-                except KeyError:
-                    continue
-
-                # Calculate travel time (hours)
-                segment_time = (length_m / 1000) / speed if speed > 0 else 0
-                total_distance += length_m
-                total_time += segment_time
-
-                segments.append({
-                    'road_id': osm_id,
-                    'latitude_start': coords[0][1],
-                    'longitude_start': coords[0][0],
-                    'latitude_end': coords[-1][1],
-                    'longitude_end': coords[-1][0],
-                    'speed_kmh': round(speed, 1),
-                    'congestion_level': congestion,
-                    'length_m': round(length_m, 1),
-                    'travel_time_min': round(segment_time * 60, 1)
-                })
-
-            route_results.append({
-                'route_name': route_name,
-                'total_distance_km': round(total_distance / 1000, 2),
-                'total_time_min': round(total_time * 60, 1),
-                'segments': segments
-            })
-
-        # Sort by travel time and mark fastest as recommended
-        route_results.sort(key=lambda x: x['total_time_min'])
-        if route_results:
-            route_results[0]['recommended'] = True
-
-        return Response(route_results)
\ No newline at end of file
+class MetricsView(APIView):
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4')
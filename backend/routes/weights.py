@@ -0,0 +1,71 @@
+import numpy as np
+from django.conf import settings
+
+from .lru import LRUCache
+from .metrics import metrics
+from .scoring import MIN_SPEED_KMH, SPEED_MULTIPLIERS, predict_speeds
+
+metrics.describe('travel_time_weights_total', 'counter', 'Travel-time weight lookups by cache result')
+
+
+def edge_speeds(snapshot, bundle, hour, day_of_week, travel_mode):
+    """Predicted speed (km/h) of every snapshot edge for one time bucket.
+
+    Edges sharing an OSM way are predicted once, in a single batch.
+    """
+    osm_ids, inverse = np.unique(np.asarray(snapshot.edge_osmid), return_inverse=True)
+    speeds = predict_speeds(bundle, osm_ids, hour, day_of_week)[inverse]
+    return np.maximum(speeds * SPEED_MULTIPLIERS.get(travel_mode, 1.0), MIN_SPEED_KMH)
+
+
+class TravelTimeWeights:
+    """Per-edge travel times in seconds for one network and time bucket."""
+
+    def __init__(self, seconds, speeds):
+        self.seconds = seconds
+        self.speeds = speeds
+        # Lengths divided by the top speed bound the travel times from
+        # below, which keeps landmark heuristics admissible
+        self.bound_scale = 3.6 / float(speeds.max()) if len(speeds) else 1.0
+
+
+class TravelTimeWeightCache:
+    """LRU cache of travel-time weights keyed by network, model and time bucket.
+
+    Weights are read-only and shared by all requests in the same bucket.
+    Keys include the network and model versions, so reloads never serve
+    stale weights.
+    """
+
+    def __init__(self, max_entries=None):
+        self._max_entries = max_entries
+        self._entries = LRUCache(lambda: self.max_entries)
+
+    @property
+    def max_entries(self):
+        if self._max_entries is not None:
+            return self._max_entries
+        return getattr(settings, 'TRAVEL_TIME_WEIGHT_CACHE_SIZE', 32)
+
+    def get(self, network, bundle, hour, day_of_week, travel_mode):
+        key = (network.place, network.network_type, network.version, bundle.version,
+               hour, day_of_week, travel_mode)
+        weights = self._entries.get(key)
+        if weights is not None:
+            metrics.inc('travel_time_weights_total', result='hit')
+            return weights
+        metrics.inc('travel_time_weights_total', result='miss')
+        snapshot = network.snapshot
+        speeds = edge_speeds(snapshot, bundle, hour, day_of_week, travel_mode)
+        seconds = np.asarray(snapshot.edge_length) / (speeds / 3.6)
+        weights = TravelTimeWeights(seconds, speeds)
+        for array in (weights.seconds, weights.speeds):
+            array.flags.writeable = False
+        self._entries.put(key, weights)
+        return weights
+
+    def clear(self):
+        self._entries.clear()
+
+
+weight_cache = TravelTimeWeightCache()
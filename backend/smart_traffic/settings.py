@@ -131,6 +131,127 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# Routing
+# Compiled road network snapshots, see `manage.py build_graph_snapshots`
+
+GRAPH_SNAPSHOT_DIR = BASE_DIR / "graph_snapshots"
+
+# Number of routes returned per request and the largest share of a route's
+# length allowed to overlap another returned route
+
+ROUTE_ALTERNATIVES = 3
+ROUTE_MAX_SIMILARITY = 0.8
+
+# Default route search weight when a request has no "optimize" field:
+# "distance", or "time" for predicted travel time in the request's hour and
+# day. Travel-time weights are cached per (network, hour, day, travel mode).
+
+ROUTE_OPTIMIZE = "distance"
+TRAVEL_TIME_WEIGHT_CACHE_SIZE = 32
+
+# Point-to-point search: "dijkstra", or "alt" for A* with landmark lower
+# bounds (stored by `build_graph_snapshots --landmarks`, else built on load)
+
+ROUTING_BACKEND = "dijkstra"
+ROUTING_LANDMARKS = 16
+
+# Request coordinates farther than this from any road are rejected
+
+SNAP_MAX_DISTANCE_M = 1000
+
+# Speed model written by traffic_model/train_model.py, checked for a new
+# version at most every MODEL_RELOAD_INTERVAL seconds
+
+TRAFFIC_MODEL_DIR = BASE_DIR / "traffic_model"
+MODEL_RELOAD_INTERVAL = 5
+
+# Recently found routes, keyed by snapped endpoints (bucketed every
+# ROUTE_CACHE_SNAP_M metres along their edges), travel mode, time bucket and
+# graph/model versions. Set ROUTE_CACHE_SHARED_PATH to a SQLite file to share
+# the cache between worker processes; ROUTE_CACHE_SIZE = 0 disables it.
+
+ROUTE_CACHE_SIZE = 1024
+ROUTE_CACHE_TTL = 300
+ROUTE_CACHE_SNAP_M = 25
+ROUTE_CACHE_SHARED_PATH = None
+
+# Batch routing (api/routes/batch/): trips per request and trips searched
+# and scored together per streamed chunk
+
+BATCH_ROUTE_MAX_TRIPS = 1000
+BATCH_ROUTE_CHUNK_SIZE = 64
+
+# Travel-time matrices (api/routes/matrix/): largest sources x destinations
+# and origins searched per Dijkstra call
+
+MATRIX_MAX_CELLS = 250000
+MATRIX_CHUNK_ROWS = 64
+
+# Async route view (api/routes/async/, for ASGI servers): search threads,
+# searches queued or running before new requests get 503, and seconds
+# before a request gets 504
+
+ROUTE_ASYNC_WORKERS = 4
+ROUTE_ASYNC_MAX_PENDING = 16
+ROUTE_ASYNC_TIMEOUT = 30
+
+# Route request stage timings (route_stage_seconds in api/metrics/), also
+# sent as a Server-Timing header with ROUTE_SERVER_TIMING. A share of
+# requests, plus those sending "X-Route-Profile: 1" if allowed, is run under
+# cProfile; the ROUTE_PROFILE_KEEP slowest are dumped to ROUTE_PROFILE_DIR.
+
+ROUTE_SERVER_TIMING = False
+ROUTE_PROFILE_SAMPLE_RATE = 0.0
+ROUTE_PROFILE_ALLOW_HEADER = False
+ROUTE_PROFILE_KEEP = 10
+ROUTE_PROFILE_DIR = BASE_DIR / "route_profiles"
+
+# GPS probe ingestion (api/probes/): buffered points are written once
+# GPS_FLUSH_ROWS are waiting or the oldest is GPS_FLUSH_INTERVAL seconds
+# old; requests that would push the buffer past GPS_BUFFER_MAX_ROWS get 503,
+# and batches of more than GPS_BUFFER_MAX_ROWS points get 413
+
+GPS_MAX_BODY_BYTES = 16 * 2 ** 20
+GPS_FLUSH_ROWS = 5000
+GPS_FLUSH_INTERVAL = 1.0
+GPS_BUFFER_MAX_ROWS = 100000
+GPS_MAX_SPEED_KMH = 250
+GPS_MAX_CLOCK_SKEW_S = 300
+
+# Map-matching of GPS probes into TrafficData (`manage.py match_gps`):
+# points farther than this from any road are dropped, and hours are bucketed
+# in this time zone, as route requests are
+
+GPS_MATCH_MAX_DISTANCE_M = 30
+GPS_MATCH_TIMEZONE = "Asia/Kolkata"
+
+# Congestion snapshots (api/congestion/) from the hourly rollup kept by
+# `manage.py rollup_traffic`, cached per day of week and hour for this long
+
+CONGESTION_CACHE_TTL = 60
+
+# Isochrones (api/routes/isochrone/): default and largest travel-time
+# budgets in minutes, budgets per request, nodes a search may reach before
+# contours are cut short, and cached results (keyed like the route cache)
+
+ISOCHRONE_BUDGETS = [5, 10, 15]
+ISOCHRONE_MAX_MINUTES = 60
+ISOCHRONE_MAX_BUDGETS = 6
+ISOCHRONE_MAX_NODES = 50000
+ISOCHRONE_CACHE_SIZE = 256
+
+# Served regions: each has an OSM place with its own snapshots, and requests
+# are dispatched to the region whose bounding box (min_lat, min_lon, max_lat,
+# max_lon) holds all their points; a region without "bbox" takes the rest.
+# "model_dir" gives a region its own speed model instead of TRAFFIC_MODEL_DIR.
+# Road networks and speed models are dropped least recently used once what
+# they hold passes REGION_MEMORY_BUDGET_MB, and loaded again on demand.
+
+ROUTE_REGIONS = {
+    'indore': {'place': 'Indore, India', 'bbox': (22.55, 75.70, 22.90, 76.05)},
+}
+REGION_MEMORY_BUDGET_MB = 4096
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -1,7 +1,25 @@
+import argparse
 import os
 import sys
 import django
 
+parser = argparse.ArgumentParser(description='Train the road speed model from TrafficData')
+parser.add_argument(
+    '--speed-table', action='store_true',
+    help='Also precompute the speed for every (road, hour, day_of_week) into speed_table.npy',
+)
+parser.add_argument(
+    '--forest', action='store_true',
+    help='Also export the forest as packed NumPy arrays, which the server loads instead of the pickles',
+)
+parser.add_argument('--quantize', action='store_true',
+                    help='With --forest, store int16 split thresholds and float16 leaf values')
+parser.add_argument('--chunk-size', type=int, default=100000, help='Rows read from the database at a time')
+parser.add_argument('--jobs', type=int, default=-1, help='Cores used to fit the forest; -1 uses all')
+parser.add_argument('--trees', type=int, default=100, help='Number of trees in the forest')
+parser.add_argument('--output-dir', default=None, help='Where to write the model; defaults to TRAFFIC_MODEL_DIR')
+args = parser.parse_args()
+
 # Add backend\smart_traffic to Python path
 project_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(project_path)
@@ -9,34 +27,205 @@ sys.path.append(project_path)
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smart_traffic.settings')
 django.setup()
 
+import json
+import pickle
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import islice
+import numpy as np
 import pandas as pd
+from django.conf import settings
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import LabelEncoder
-import pickle
+from routes.forest import PackedForest
 from routes.models import TrafficData
 
-# Fetch data
-data = TrafficData.objects.values('road_id', 'date', 'time', 'speed_kmh')
-df = pd.DataFrame(data)
-df['date'] = pd.to_datetime(df['date'])
-df['hour'] = pd.to_datetime(df['time'], format='%H:%M:%S').dt.hour
-df['day_of_week'] = df['date'].dt.dayofweek
+output_dir = args.output_dir or getattr(settings, 'TRAFFIC_MODEL_DIR', os.path.dirname(__file__))
+
+# Wall time and peak resident memory of each stage, printed at the end.
+# Linux can reset the process's peak between stages; elsewhere the peak
+# reported is the highest so far.
+stages = []
+
+
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mib():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2 ** 10
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float('nan')
+    # Kilobytes on Linux, bytes on macOS
+    scale = 2 ** 20 if sys.platform == 'darwin' else 2 ** 10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+@contextmanager
+def stage(name):
+    reset_peak_rss()
+    start = time.perf_counter()
+    yield
+    stages.append((name, time.perf_counter() - start, peak_rss_mib()))
+    print(f'{name}: {stages[-1][1]:.1f}s, peak {stages[-1][2]:.1f} MiB', flush=True)
+
+
+# Rows are (road, hour, day_of_week) keys packed into one integer; the
+# features are only those three, so training on one row per key with its
+# mean speed, weighted by its sample count, fits the same squared error as
+# training on every sample
+KEYS_PER_ROAD = 24 * 7
 
-# Encode road_id
-le = LabelEncoder()
-df['road_id_encoded'] = le.fit_transform(df['road_id'])
 
-# Features and target
-X = df[['road_id_encoded', 'hour', 'day_of_week']]
-y = df['speed_kmh']
+def aggregate(keys, counts, sums):
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return (
+        unique,
+        np.bincount(inverse, weights=counts, minlength=len(unique)).astype(np.int64),
+        np.bincount(inverse, weights=sums, minlength=len(unique)),
+    )
+
+
+def read_aggregates(chunk_size):
+    """Stream TrafficData and reduce it to per-key sample counts and speed sums.
+
+    A row stands for ``sample_count`` readings averaging ``speed_kmh``.
+    Memory stays within one chunk plus the distinct keys seen so far.
+    """
+    rows = TrafficData.objects.filter(sample_count__gt=0).values_list(
+        'road_id', 'date', 'time', 'speed_kmh', 'sample_count'
+    ).iterator(chunk_size=chunk_size)
+    partials = []
+    pending = 0
+    total = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        road_ids, dates, times, speeds, samples = zip(*chunk)
+        del chunk
+        hours = np.fromiter((t.hour for t in times), dtype=np.int64, count=len(times))
+        # Monday is 0; 1970-01-01 was a Thursday
+        days = (np.array(dates, dtype='datetime64[D]').astype(np.int64) - 4) % 7
+        keys = np.array(road_ids, dtype=np.int64) * KEYS_PER_ROAD + hours * 7 + days
+        samples = np.array(samples, dtype=np.float64)
+        partials.append(aggregate(keys, samples, np.array(speeds, dtype=np.float64) * samples))
+        pending += len(partials[-1][0])
+        total += len(keys)
+        # Fold the partial aggregates together before they outgrow a few chunks
+        if pending > 4 * chunk_size and len(partials) > 1:
+            partials = [aggregate(*map(np.concatenate, zip(*partials)))]
+            pending = len(partials[0][0])
+        print(f'{total} rows read', flush=True)
+    if not partials:
+        return total, np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+    return (total, *aggregate(*map(np.concatenate, zip(*partials))))
+
+
+# Fetch data
+with stage('read'):
+    total_rows, keys, counts, sums = read_aggregates(args.chunk_size)
+if not total_rows:
+    sys.exit('TrafficData is empty, nothing to train on')
+
+with stage('prepare'):
+    road_ids, slots = np.divmod(keys, KEYS_PER_ROAD)
+    # Encode road_id
+    le = LabelEncoder().fit(np.unique(road_ids))
+    X = pd.DataFrame({
+        'road_id_encoded': np.searchsorted(le.classes_, road_ids).astype(np.int32),
+        'hour': (slots // 7).astype(np.int8),
+        'day_of_week': (slots % 7).astype(np.int8),
+    })
+    y = (sums / counts).astype(np.float32)
+    del keys, road_ids, slots, sums
 
 # Train
-model = RandomForestRegressor(n_estimators=100, random_state=42)
-model.fit(X, y)
+with stage('fit'):
+    model = RandomForestRegressor(n_estimators=args.trees, random_state=42, n_jobs=args.jobs)
+    model.fit(X, y, sample_weight=counts)
+    # Serving predicts one request at a time; threads would only add overhead
+    model.n_jobs = None
+
+# The features are only road, hour and day of week, so every possible
+# prediction fits in a (roads x 24 x 7) table the server can index directly
+def build_speed_table(model, n_roads, chunk_roads=2000):
+    table = np.empty((n_roads, 24, 7), dtype=np.float32)
+    hours, days = np.meshgrid(np.arange(24), np.arange(7), indexing='ij')
+    for start in range(0, n_roads, chunk_roads):
+        codes = np.arange(start, min(start + chunk_roads, n_roads))
+        features = pd.DataFrame({
+            'road_id_encoded': np.repeat(codes, 24 * 7),
+            'hour': np.tile(hours.ravel(), len(codes)),
+            'day_of_week': np.tile(days.ravel(), len(codes)),
+        })
+        table[start:start + len(codes)] = model.predict(features).reshape(len(codes), 24, 7)
+    return table
 
 # Save
-with open(os.path.join(os.path.dirname(__file__), 'traffic_model.pkl'), 'wb') as f:
-    pickle.dump(model, f)
-with open(os.path.join(os.path.dirname(__file__), 'road_id_encoder.pkl'), 'wb') as f:
-    pickle.dump(le, f)
-print("Model trained and saved.")
\ No newline at end of file
+# Each file is written under a temporary name and renamed into place so a
+# running server never reads a partial pickle. The manifest goes last: the
+# server's model registry swaps models when it changes.
+def save_atomic(name, write):
+    path = os.path.join(output_dir, name)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+if args.speed_table:
+    with stage('speed table'):
+        model.n_jobs = args.jobs
+        speed_table = build_speed_table(model, len(le.classes_))
+        model.n_jobs = None
+
+if args.forest:
+    with stage('forest'):
+        forest = PackedForest.from_sklearn(model, quantize=args.quantize)
+
+with stage('save'):
+    save_atomic('traffic_model.pkl', lambda f: pickle.dump(model, f, protocol=5))
+    save_atomic('road_id_encoder.pkl', lambda f: pickle.dump(le, f, protocol=5))
+    if args.speed_table:
+        save_atomic('speed_table.npy', lambda f: np.save(f, speed_table))
+    if args.forest:
+        forest.save(os.path.join(output_dir, 'forest'))
+        save_atomic('road_ids.npy', lambda f: np.save(f, le.classes_))
+
+    version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    manifest = {
+        'version': version,
+        'model': 'traffic_model.pkl',
+        'encoder': 'road_id_encoder.pkl',
+        'rows': total_rows,
+        'training_rows': len(X),
+        'roads': len(le.classes_),
+        'stages': {
+            name: {'seconds': round(seconds, 3), 'peak_mib': round(peak, 1)}
+            for name, seconds, peak in stages
+        },
+    }
+    if args.speed_table:
+        manifest['speed_table'] = 'speed_table.npy'
+    if args.forest:
+        manifest['forest'] = 'forest'
+        manifest['road_ids'] = 'road_ids.npy'
+    save_atomic('manifest.json', lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+
+print(f'{"stage":<12} {"seconds":>8} {"peak MiB":>9}')
+for name, seconds, peak in stages:
+    print(f'{name:<12} {seconds:>8.1f} {peak:>9.1f}')
+print(f"Model trained and saved (version {version}).")